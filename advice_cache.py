@@ -0,0 +1,196 @@
+"""
+Advice Cache
+Exact-match LRU/TTL cache for generated advice with optional SQLite persistence
+"""
+
+import hashlib
+import json
+import logging
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE = re.compile(r"\s+")
+_EDGE_PUNCTUATION = " .,!?;:~\"'"
+
+
+def normalize_goal(goal: str) -> str:
+    """Normalize a goal so trivially different spellings share a cache entry"""
+    goal = unicodedata.normalize("NFKC", goal).casefold()
+    return _WHITESPACE.sub(" ", goal).strip(_EDGE_PUNCTUATION)
+
+
+def make_cache_key(goal: str, model: str, template: str, options: Dict[str, Any]) -> str:
+    """Cache key over the normalized goal and everything that shapes the generation"""
+    material = json.dumps([normalize_goal(goal), model, template, options],
+                          sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class AdviceCache:
+    """Thread-safe LRU cache with per-entry TTL.
+
+    When `db_path` is set, entries are written through to SQLite so a warm
+    cache survives restarts; memory holds the most recent `max_entries` and
+    misses fall through to disk before counting as a miss. The table keeps at
+    most `max_rows` (default `max_entries`) of the most recently written
+    entries; expired and excess rows are swept at most every `sweep_interval`
+    seconds on write, and an entry found expired is deleted right away. The
+    file may be shared by several processes: a lookup that cannot get it
+    within `timeout` seconds counts as a miss and a write that cannot is kept
+    in memory only.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 86400.0,
+                 db_path: Optional[str] = None, timeout: float = 0.5,
+                 max_rows: Optional[int] = None, sweep_interval: float = 60.0):
+        self.max_entries = max_entries
+        self.max_rows = max_entries if max_rows is None else max_rows
+        self.ttl = ttl
+        self.timeout = timeout
+        self.sweep_interval = sweep_interval
+        self.hits = 0
+        self.misses = 0
+        self.db_errors = 0
+        self._entries: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        self._next_sweep = 0.0
+        if db_path:
+            self._open_db(db_path)
+
+    def _open_db(self, db_path: str):
+        self._db = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None,
+                                   timeout=self.timeout)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS advice_cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)")
+        self._sweep(time.time())
+        rows = self._db.execute(
+            "SELECT key, value, expires_at FROM advice_cache "
+            "ORDER BY rowid DESC LIMIT ?", (self.max_entries,)).fetchall()
+        for key, value, expires_at in reversed(rows):
+            self._entries[key] = (value, expires_at)
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] <= now:
+                self._expire(key, now)
+                entry = None
+            if entry is None and self._db is not None:
+                try:
+                    row = self._db.execute(
+                        "SELECT value, expires_at FROM advice_cache WHERE key = ? AND expires_at > ?",
+                        (key, now)).fetchone()
+                except sqlite3.Error as e:
+                    self._db_failed(e)
+                    row = None
+                if row is not None:
+                    entry = (row[0], row[1])
+                    self._store(key, entry)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def contains(self, key: str) -> bool:
+        """Whether a live entry exists, without counting a hit or miss or refreshing its position"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[1] > now:
+                    return True
+                self._expire(key, now)
+                return False
+            if self._db is None:
+                return False
+            try:
+                return self._db.execute("SELECT 1 FROM advice_cache WHERE key = ? AND expires_at > ?",
+                                        (key, now)).fetchone() is not None
+            except sqlite3.Error as e:
+                self._db_failed(e)
+                return False
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None):
+        now = time.time()
+        entry = (value, now + (self.ttl if ttl is None else ttl))
+        with self._lock:
+            self._store(key, entry)
+            if self._db is not None:
+                try:
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO advice_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                        (key, entry[0], entry[1]))
+                except sqlite3.Error as e:
+                    self._db_failed(e)
+                if now >= self._next_sweep:
+                    self._sweep(now)
+
+    @property
+    def persistent(self) -> bool:
+        return self._db is not None
+
+    def _db_failed(self, error: sqlite3.Error):
+        # Locked past the timeout (or similar): degrade to the memory tier
+        self.db_errors += 1
+        logger.warning("Advice cache database unavailable", extra={"error": str(error)})
+
+    def _expire(self, key: str, now: float):
+        del self._entries[key]
+        if self._db is None:
+            return
+        try:
+            # Only if still expired: another process may have rewritten it since
+            self._db.execute("DELETE FROM advice_cache WHERE key = ? AND expires_at <= ?", (key, now))
+        except sqlite3.Error as e:
+            self._db_failed(e)
+
+    def _sweep(self, now: float):
+        """Drop expired rows, then all but the `max_rows` most recently written"""
+        self._next_sweep = now + self.sweep_interval
+        try:
+            self._db.execute("DELETE FROM advice_cache WHERE expires_at <= ?", (now,))
+            self._db.execute(
+                "DELETE FROM advice_cache WHERE rowid NOT IN "
+                "(SELECT rowid FROM advice_cache ORDER BY rowid DESC LIMIT ?)", (self.max_rows,))
+        except sqlite3.Error as e:
+            self._db_failed(e)  # another process is writing; retried on a later write
+
+    def _store(self, key: str, entry: Tuple[str, float]):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM advice_cache")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "max_rows": self.max_rows if self._db is not None else None,
+                "persistent": self._db is not None,
+                "db_errors": self.db_errors
+            }
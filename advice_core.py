@@ -0,0 +1,710 @@
+"""
+Advice Core
+Configuration, prompts and shared cache/scheduler state for the Flask (app_simple.py)
+and ASGI (app.py) servers
+"""
+
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from advice_cache import AdviceCache, make_cache_key, normalize_goal
+from backend_pool import ROUTING_LEAST_OUTSTANDING, parse_base_urls
+from circuit_breaker import STATE_CLOSED, STATE_OPEN, CircuitBreaker, LatencyTracker, LatencyTrackers
+from goal_router import BIG_ROUTE, ROUTE_TEMPLATE, GoalRoute, GoalRouter
+from job_queue import Job, JobQueue, JobWorkers
+from load_policy import TIER_FULL, TIER_SHED, BudgetPolicy, BudgetTier, build_tiers
+from metrics import REGISTRY as METRICS, budget_tiers, fallbacks, goal_routes
+from ollama_client import GenerateResult, OllamaTimeouts
+from precompute import PRECOMPUTED_DIR, PrecomputedStore, current_dir
+from prefetch import PrefetchItem, Prefetcher
+from rag import RagEngine
+from scheduler import PRIORITY_BATCH, PRIORITY_INTERACTIVE, PRIORITY_NAMES, Scheduler
+from semantic_cache import SemanticCache
+from session_store import Session, SessionStore
+from shared_state import SharedState
+from structured_advice import FALLBACK_TIPS, MAX_TIPS, TIPS_PROMPT_TEMPLATE
+from structured_log import setup_logging
+from traffic_capture import note as note_capture
+
+# JSON logs through a background writer, configured before anything below logs
+setup_logging()
+
+# Ollama API Configuration
+OLLAMA_BASE_URL = os.environ.get("OLLAMA_BASE_URL", "http://localhost:11434")
+# Several nodes, e.g. "http://gpu1:11434,http://gpu2:11434"; defaults to OLLAMA_BASE_URL
+OLLAMA_BASE_URLS = parse_base_urls(os.environ.get("OLLAMA_BASE_URLS", OLLAMA_BASE_URL))
+OLLAMA_ROUTING = os.environ.get("OLLAMA_ROUTING", ROUTING_LEAST_OUTSTANDING)  # or "ewma"
+BACKEND_CHECK_INTERVAL = float(os.environ.get("BACKEND_CHECK_INTERVAL", "10"))
+BACKEND_EJECT_AFTER = int(os.environ.get("BACKEND_EJECT_AFTER", "3"))
+OLLAMA_MODEL = os.environ.get("OLLAMA_MODEL", "llama3:latest")
+OLLAMA_MAX_IN_FLIGHT = int(os.environ.get("OLLAMA_MAX_IN_FLIGHT", "4"))
+OLLAMA_TIMEOUTS = OllamaTimeouts(
+    connect=float(os.environ.get("OLLAMA_CONNECT_TIMEOUT", "10")),
+    first_byte=float(os.environ.get("OLLAMA_FIRST_BYTE_TIMEOUT", "80")),
+    total=float(os.environ.get("OLLAMA_TOTAL_TIMEOUT", "80"))
+)
+STATUS_TIMEOUTS = OllamaTimeouts(connect=5, first_byte=5, total=5)
+STATUS_POLL_INTERVAL = float(os.environ.get("STATUS_POLL_INTERVAL", "5"))
+# How long Ollama keeps the model loaded after each request; "-1" keeps it forever
+OLLAMA_KEEP_ALIVE = os.environ.get("OLLAMA_KEEP_ALIVE", "30m")
+# Preload the model at startup and report unhealthy until it is resident
+MODEL_WARMUP_ENABLED = os.environ.get("MODEL_WARMUP_ENABLED", "1") == "1"
+
+# Host-wide state shared by all worker processes (rate limits, circuit, Ollama status,
+# advice cache); unset keeps everything per process
+SHARED_STATE_DB = os.environ.get("SHARED_STATE_DB")  # e.g. "/dev/shm/advice_state.db"
+SHARED_STATE_MAX_ENTRIES = int(os.environ.get("SHARED_STATE_MAX_ENTRIES", "100000"))
+
+shared_state = SharedState.open(SHARED_STATE_DB, max_entries=SHARED_STATE_MAX_ENTRIES)
+
+# Circuit breaker and latency-derived deadlines around generation
+CIRCUIT_FAILURE_THRESHOLD = int(os.environ.get("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RESET_TIMEOUT = float(os.environ.get("CIRCUIT_RESET_TIMEOUT", "30"))
+ADAPTIVE_TIMEOUTS_ENABLED = os.environ.get("ADAPTIVE_TIMEOUTS_ENABLED", "1") == "1"
+ADAPTIVE_TIMEOUT_FLOOR = float(os.environ.get("ADAPTIVE_TIMEOUT_FLOOR", "15"))
+# Duplicate a generation on a second node once it is slower than the observed p95
+OLLAMA_HEDGE_ENABLED = os.environ.get("OLLAMA_HEDGE_ENABLED", "0") == "1"
+
+ollama_breaker = CircuitBreaker(failure_threshold=CIRCUIT_FAILURE_THRESHOLD,
+                                reset_timeout=CIRCUIT_RESET_TIMEOUT,
+                                shared=shared_state)
+# Every generation, for load pressure and stats
+generate_latency = LatencyTracker()
+first_token_latency = LatencyTracker()
+# Per route and budget tier, for deadlines and hedging (see latency_key)
+route_latency = LatencyTrackers()
+route_first_token = LatencyTrackers()
+
+OLLAMA_OPTIONS = {
+    "temperature": 0.7,
+    "num_predict": 200,
+    "num_ctx": 1024
+}
+
+# Advice cache configuration; with shared state, every worker reads and writes through
+# the shared file and keeps only a small hot set in memory
+ADVICE_CACHE_SIZE = int(os.environ.get("ADVICE_CACHE_SIZE", "256" if shared_state else "1024"))
+ADVICE_CACHE_TTL = float(os.environ.get("ADVICE_CACHE_TTL", "86400"))
+ADVICE_CACHE_DB = os.environ.get(  # e.g. "advice_cache.db" to persist
+    "ADVICE_CACHE_DB", shared_state.db_path if shared_state else None)
+# Longest wait for another process's write lock before a lookup counts as a miss
+ADVICE_CACHE_DB_TIMEOUT = float(os.environ.get("ADVICE_CACHE_DB_TIMEOUT", "0.5"))
+# Row cap for the file; the shared file outlives any one worker's small memory tier
+ADVICE_CACHE_DB_SIZE = int(os.environ.get(
+    "ADVICE_CACHE_DB_SIZE", str(max(ADVICE_CACHE_SIZE, 1024) if shared_state else ADVICE_CACHE_SIZE)))
+
+advice_cache = AdviceCache(max_entries=ADVICE_CACHE_SIZE, ttl=ADVICE_CACHE_TTL,
+                           db_path=ADVICE_CACHE_DB, timeout=ADVICE_CACHE_DB_TIMEOUT,
+                           max_rows=ADVICE_CACHE_DB_SIZE)
+
+# Semantic cache configuration (near-duplicate goals via embeddings)
+SEMANTIC_CACHE_ENABLED = os.environ.get("SEMANTIC_CACHE_ENABLED", "1") == "1"
+SEMANTIC_CACHE_SIZE = int(os.environ.get("SEMANTIC_CACHE_SIZE", "512"))
+SEMANTIC_CACHE_THRESHOLD = float(os.environ.get("SEMANTIC_CACHE_THRESHOLD", "0.92"))
+OLLAMA_EMBED_MODEL = os.environ.get("OLLAMA_EMBED_MODEL", "nomic-embed-text")
+EMBED_TIMEOUTS = OllamaTimeouts(connect=2, first_byte=5, total=5)
+
+semantic_cache = SemanticCache(capacity=SEMANTIC_CACHE_SIZE,
+                               threshold=SEMANTIC_CACHE_THRESHOLD, ttl=ADVICE_CACHE_TTL)
+
+# Admission control: bounded queue in front of Ollama's limited parallelism
+SCHEDULER_CONCURRENCY = int(os.environ.get("SCHEDULER_CONCURRENCY",
+                                           str(OLLAMA_MAX_IN_FLIGHT * len(OLLAMA_BASE_URLS))))
+SCHEDULER_MAX_QUEUE = int(os.environ.get("SCHEDULER_MAX_QUEUE", "64"))
+SCHEDULER_QUEUE_TIMEOUT = float(os.environ.get("SCHEDULER_QUEUE_TIMEOUT", "10"))
+CLIENT_RATE_PER_SEC = float(os.environ.get("CLIENT_RATE_PER_SEC", "0.5"))
+CLIENT_BURST = float(os.environ.get("CLIENT_BURST", "10"))
+
+scheduler = Scheduler(concurrency=SCHEDULER_CONCURRENCY,
+                      max_queue=SCHEDULER_MAX_QUEUE,
+                      queue_timeout=SCHEDULER_QUEUE_TIMEOUT,
+                      client_rate=CLIENT_RATE_PER_SEC,
+                      client_burst=CLIENT_BURST,
+                      shared=shared_state)
+
+# Read at scrape time only
+METRICS.gauge('advice_scheduler_active', 'Generations holding a scheduler slot', lambda: scheduler.active)
+METRICS.gauge('advice_scheduler_queued', 'Requests waiting for a scheduler slot',
+              lambda: scheduler.stats()['queued'])
+METRICS.gauge('ollama_circuit_open', '1 while the circuit breaker short-circuits generations',
+              lambda: int(ollama_breaker.state == STATE_OPEN))
+
+# Load-aware generation budgets: full -> reduced -> short -> shed (templated advice)
+LOAD_BUDGET_ENABLED = os.environ.get("LOAD_BUDGET_ENABLED", "1") == "1"
+# Pressure at which reduced / short / shed start; 1.0 = one full round of work queued
+LOAD_TIER_THRESHOLDS = [float(v) for v in os.environ.get("LOAD_TIER_THRESHOLDS", "1,2,4").split(",")]
+LOAD_TIER_NUM_PREDICT = [int(v) for v in os.environ.get(
+    "LOAD_TIER_NUM_PREDICT", f"{OLLAMA_OPTIONS['num_predict']},120,60").split(",")]
+# Empty keeps num_ctx for every tier (changing it makes Ollama reload the model)
+LOAD_TIER_NUM_CTX = [int(v) for v in os.environ.get("LOAD_TIER_NUM_CTX", "").split(",") if v]
+# p95 generation latency that counts as pressure 1.0
+LOAD_LATENCY_TARGET = float(os.environ.get("LOAD_LATENCY_TARGET", str(OLLAMA_TIMEOUTS.total / 2)))
+LOAD_RECOVER_SECONDS = float(os.environ.get("LOAD_RECOVER_SECONDS", "10"))
+
+def load_pressure() -> float:
+    """Queued requests per scheduler slot, or p95 latency over target, whichever is worse"""
+    stats = scheduler.stats()
+    queue = stats['queued'] / max(1, stats['concurrency'])
+    p95 = generate_latency.percentile(95)
+    return max(queue, p95 / LOAD_LATENCY_TARGET if p95 is not None else 0.0)
+
+budget_policy = BudgetPolicy(build_tiers(OLLAMA_OPTIONS, LOAD_TIER_NUM_PREDICT, LOAD_TIER_NUM_CTX),
+                             LOAD_TIER_THRESHOLDS, load_pressure,
+                             recover_seconds=LOAD_RECOVER_SECONDS, enabled=LOAD_BUDGET_ENABLED)
+
+METRICS.gauge('advice_budget_tier', 'Current load budget tier (0 = full quality)', lambda: budget_policy.level)
+METRICS.gauge('advice_load_pressure', 'Load figure the budget tier is chosen from',
+              lambda: budget_policy.last_pressure)
+
+# Goal routing: canned templates and a fast model for clear-cut single-topic goals
+GOAL_ROUTER_ENABLED = os.environ.get("GOAL_ROUTER_ENABLED", "0") == "1"
+# Empty keeps OLLAMA_MODEL for the fast route, with the shorter category prompt
+GOAL_ROUTER_FAST_MODEL = os.environ.get("GOAL_ROUTER_FAST_MODEL", "")
+GOAL_ROUTER_TEMPLATES = os.environ.get("GOAL_ROUTER_TEMPLATES", "1") == "1"
+# Share of the classifier score the best category needs for the fast route / a template
+GOAL_ROUTER_MIN_CONFIDENCE = float(os.environ.get("GOAL_ROUTER_MIN_CONFIDENCE", "0.6"))
+GOAL_ROUTER_TEMPLATE_CONFIDENCE = float(os.environ.get("GOAL_ROUTER_TEMPLATE_CONFIDENCE", "0.8"))
+GOAL_ROUTER_FAST_NUM_PREDICT = int(os.environ.get("GOAL_ROUTER_FAST_NUM_PREDICT", "120"))
+
+goal_router = GoalRouter(enabled=GOAL_ROUTER_ENABLED, fast_model=GOAL_ROUTER_FAST_MODEL,
+                         templates=GOAL_ROUTER_TEMPLATES, min_confidence=GOAL_ROUTER_MIN_CONFIDENCE,
+                         template_confidence=GOAL_ROUTER_TEMPLATE_CONFIDENCE,
+                         fast_num_predict=GOAL_ROUTER_FAST_NUM_PREDICT)
+
+# Retrieval configuration (index built with `python rag.py ingest <dir>`)
+RAG_ENABLED = os.environ.get("RAG_ENABLED", "0") == "1"
+RAG_INDEX_DIR = os.environ.get("RAG_INDEX_DIR", "rag_index")
+RAG_TOP_K = int(os.environ.get("RAG_TOP_K", "3"))
+RAG_MIN_SCORE = float(os.environ.get("RAG_MIN_SCORE", "0.3"))
+
+# Servers embed the query themselves (sync or async) and pass the vector in
+rag_engine = RagEngine(None, RAG_INDEX_DIR, OLLAMA_EMBED_MODEL)
+
+# Precomputed answers for popular goals (built with `python precompute.py generate goals.txt`)
+PRECOMPUTED_MIN_SIMILARITY = float(os.environ.get("PRECOMPUTED_MIN_SIMILARITY", "0.9"))
+# Seconds between checks for a store rebuilt by precompute.py while the server runs
+PRECOMPUTED_RELOAD_INTERVAL = float(os.environ.get("PRECOMPUTED_RELOAD_INTERVAL", "30"))
+
+# Batch advice (/api/llama-advice/batch)
+BATCH_MAX_GOALS = int(os.environ.get("BATCH_MAX_GOALS", "50"))
+BATCH_MAX_WORKERS = int(os.environ.get("BATCH_MAX_WORKERS", "8"))
+
+# Asynchronous advice jobs (/api/jobs), kept in SQLite so they survive restarts;
+# an empty JOBS_DB disables them
+JOBS_DB = os.environ.get("JOBS_DB", "advice_jobs.db")
+# Workers per process; defaults to the backend parallelism the scheduler admits
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", str(SCHEDULER_CONCURRENCY)))
+JOB_RESULT_TTL = float(os.environ.get("JOB_RESULT_TTL", "3600"))
+JOB_MAX_PENDING = int(os.environ.get("JOB_MAX_PENDING", "1000"))
+# How long a job keeps waiting out rejections, open circuits and shedding before it
+# settles for fallback advice
+JOB_MAX_WAIT = float(os.environ.get("JOB_MAX_WAIT", "600"))
+JOB_POLL_INTERVAL = float(os.environ.get("JOB_POLL_INTERVAL", "1.0"))
+
+job_workers: Optional[JobWorkers] = None
+_jobs_lock = threading.Lock()
+
+def open_jobs() -> Optional[JobWorkers]:
+    """The job queue and its workers, None when jobs are disabled.
+
+    Opened by the servers at startup rather than on import, so tools that
+    import this module (precompute.py, benchmark.py) create no database.
+    """
+    global job_workers
+    with _jobs_lock:
+        if job_workers is None and JOBS_DB:
+            queue = JobQueue(JOBS_DB, result_ttl=JOB_RESULT_TTL, stale_after=2 * OLLAMA_TIMEOUTS.total + 60)
+            job_workers = JobWorkers(queue, workers=JOB_WORKERS, poll_interval=JOB_POLL_INTERVAL)
+    return job_workers
+
+METRICS.gauge('advice_jobs', 'Advice jobs in the queue database by status',
+              lambda: ([((status,), count) for status, count in job_workers.queue.counts().items()]
+                       if job_workers is not None else []), ('status',))
+
+# Follow-up sessions (/api/llama-advice/follow-up) continue from the context Ollama returned
+SESSIONS_ENABLED = os.environ.get("SESSIONS_ENABLED", "1") == "1"
+SESSION_MAX = int(os.environ.get("SESSION_MAX", "10000"))
+# Context tokens held across all sessions, 4 bytes each
+SESSION_MAX_TOKENS = int(os.environ.get("SESSION_MAX_TOKENS", "2000000"))
+SESSION_IDLE_TTL = float(os.environ.get("SESSION_IDLE_TTL", "900"))
+# Longer contexts are not kept: with a follow-up answer on top they would overflow num_ctx
+SESSION_MAX_CONTEXT_TOKENS = int(os.environ.get(
+    "SESSION_MAX_CONTEXT_TOKENS", str(OLLAMA_OPTIONS['num_ctx'] - OLLAMA_OPTIONS['num_predict'] - 64)))
+FOLLOW_UP_MAX_CHARS = 500
+
+sessions = SessionStore(max_sessions=SESSION_MAX, max_tokens=SESSION_MAX_TOKENS,
+                        idle_ttl=SESSION_IDLE_TTL, max_context_tokens=SESSION_MAX_CONTEXT_TOKENS)
+
+METRICS.gauge('advice_sessions', 'Open follow-up sessions', lambda: len(sessions))
+METRICS.gauge('advice_session_context_tokens', 'Context tokens held for follow-up sessions',
+              lambda: sessions.tokens)
+
+# Speculative prefetch (/api/llama-advice/prefetch) of goals from newly created todos
+PREFETCH_ENABLED = os.environ.get("PREFETCH_ENABLED", "1") == "1"
+PREFETCH_WORKERS = int(os.environ.get("PREFETCH_WORKERS", "1"))
+PREFETCH_MAX_GOALS = int(os.environ.get("PREFETCH_MAX_GOALS", "20"))
+PREFETCH_MAX_PENDING = int(os.environ.get("PREFETCH_MAX_PENDING", "500"))
+# Pending goals not started within this many seconds are dropped
+PREFETCH_MAX_AGE = float(os.environ.get("PREFETCH_MAX_AGE", "300"))
+# Prefetched answers nobody asked for within this many seconds count as wasted
+PREFETCH_USE_WINDOW = float(os.environ.get("PREFETCH_USE_WINDOW", "3600"))
+# Scheduler slots prefetching leaves free for interactive requests
+PREFETCH_RESERVE_SLOTS = int(os.environ.get("PREFETCH_RESERVE_SLOTS", "1"))
+
+def prefetch_can_start() -> bool:
+    """Nothing queued, a slot to spare beyond the reserve, full budgets and a closed circuit"""
+    stats = scheduler.stats()
+    return (stats['queued'] == 0
+            and stats['active'] < max(1, stats['concurrency'] - PREFETCH_RESERVE_SLOTS)
+            and budget_policy.current().name == TIER_FULL
+            and ollama_breaker.state != STATE_OPEN)
+
+def prefetch_preempted() -> bool:
+    """Interactive or batch work waits for a slot, or load has left the full budget tier"""
+    return scheduler.queue_depth(PRIORITY_BATCH) > 0 or budget_policy.level > 0
+
+prefetcher = Prefetcher(prefetch_can_start, prefetch_preempted, workers=PREFETCH_WORKERS,
+                        max_pending=PREFETCH_MAX_PENDING, max_age=PREFETCH_MAX_AGE,
+                        use_window=PREFETCH_USE_WINDOW, max_filled=ADVICE_CACHE_SIZE)
+
+# Request fields kept in the traffic capture so a replay sends the same request
+CAPTURED_OPTIONS = ('fresh', 'rag', 'priority', 'structured', 'tips')
+
+ADVICE_PROMPT_TEMPLATE = """Goal: {goal}
+
+Please provide practical advice to achieve this goal. Give 3-4 specific tips. Use emojis.
+
+Advice:"""
+
+RAG_PROMPT_TEMPLATE = """Reference notes:
+{references}
+
+Goal: {goal}
+
+Using the reference notes where they help, please provide practical advice to achieve this goal. Give 3-4 specific tips. Use emojis.
+
+Advice:"""
+
+# Continues the stored context, which already holds the goal and the earlier answers
+FOLLOW_UP_PROMPT_TEMPLATE = """Follow-up: {message}
+
+Answer the follow-up for the same goal. Give 3-4 specific tips. Use emojis.
+
+Advice:"""
+
+# No context to continue from: the goal and the last answer are evaluated again
+FOLLOW_UP_TEXT_PROMPT_TEMPLATE = """Goal: {goal}
+
+Earlier advice:
+{advice}
+
+Follow-up: {message}
+
+Answer the follow-up for the same goal. Give 3-4 specific tips. Use emojis.
+
+Advice:"""
+
+def _tier_tips(prompt: str, tier: Optional[BudgetTier]) -> str:
+    if tier is not None and tier.tips != "3-4":
+        prompt = prompt.replace("Give 3-4 specific tips.", f"Give {tier.tips} short tips.")
+    return prompt
+
+def build_advice_prompt(goal: str, references: Optional[List[Dict[str, Any]]] = None,
+                        tier: Optional[BudgetTier] = None, route: GoalRoute = BIG_ROUTE) -> str:
+    """Build the advice prompt for a goal, optionally with retrieved reference chunks.
+
+    Reduced budget tiers ask for fewer tips so answers end naturally instead of
+    being cut off at num_predict.
+    """
+    if references:
+        notes = "\n".join(f"- {chunk['text']}" for chunk in references)
+        prompt = RAG_PROMPT_TEMPLATE.format(references=notes, goal=goal)
+    elif route.prompt_template is not None:
+        prompt = route.prompt(goal)
+    else:
+        prompt = ADVICE_PROMPT_TEMPLATE.format(goal=goal)
+    return _tier_tips(prompt, tier)
+
+def build_follow_up_prompt(session: Session, message: str,
+                           tier: BudgetTier) -> Tuple[str, Dict[str, Any]]:
+    """Follow-up prompt plus the generate() arguments that continue the session's context.
+
+    Without a usable context (the first answer came from a cache, or the context
+    plus a new answer would not fit the tier's num_ctx) the prompt repeats the
+    goal and the last answer instead.
+    """
+    session_kwargs = session.generate_kwargs()
+    options = session.route.options(tier.options)
+    if session_kwargs and len(session_kwargs['context']) + options.get('num_predict', 0) > options.get('num_ctx', 2048):
+        session_kwargs = {}
+    if session_kwargs:
+        prompt = FOLLOW_UP_PROMPT_TEMPLATE.format(message=message)
+    else:
+        prompt = FOLLOW_UP_TEXT_PROMPT_TEMPLATE.format(goal=session.goal, advice=session.advice, message=message)
+    return _tier_tips(prompt, tier), session_kwargs
+
+def build_fallback_advice(goal: str, error_msg: str) -> str:
+    """Static advice used when Ollama fails"""
+    return f"🎯 Advice for achieving '{goal}' goal:\n\n📋 Create a specific plan\n⏰ Execute a little each day\n📊 Record your progress\n🎉 Celebrate small achievements\n\n⚠️ AI advice generation failed: {error_msg}"
+
+def build_busy_advice(goal: str) -> str:
+    """Templated advice served without calling Ollama while load is extreme"""
+    return f"🎯 Advice for achieving '{goal}' goal:\n\n📋 Create a specific plan\n⏰ Execute a little each day\n📊 Record your progress\n🎉 Celebrate small achievements\n\n⏳ AI advice is paused while the server is busy. Please try again in a moment."
+
+def busy_response(goal: str) -> Dict[str, Any]:
+    """Response fields for the shed tier, served without calling Ollama"""
+    budget_tiers.inc(tier=TIER_SHED)
+    note_capture(fallback=True)
+    return {'success': True, 'advice': build_busy_advice(goal), 'fallback': True, 'tier': TIER_SHED}
+
+def build_simple_test_advice(goal: str) -> str:
+    """Canned advice for /api/simple-test"""
+    return f"🎯 Test advice for '{goal}':\n\n📋 Create a plan\n⏰ Execute consistently\n📊 Track progress\n🎉 Celebrate achievements"
+
+def validate_goal(data: Any) -> Tuple[Optional[str], Optional[str]]:
+    """(goal, None) for an advice request body, or (None, message for a 400 response)"""
+    if not isinstance(data, dict) or not isinstance(data.get('goal'), str):
+        return None, 'Please enter a goal.'
+    goal = data['goal'].strip()
+    if not goal:
+        return None, 'Goal is empty.'
+    return goal, None
+
+def wants_rag(data: Dict[str, Any]) -> bool:
+    """Retrieval is on when enabled globally or per request with {"rag": true} and the index has rows"""
+    if not data.get('rag', RAG_ENABLED):
+        return False
+    # Refreshed here, not only in retrieve: an index ingested after start-up is otherwise never seen
+    rag_engine.refresh()
+    return rag_engine.store.count > 0
+
+def wants_fresh_advice(data: Dict[str, Any], cache_control: str) -> bool:
+    """Clients bypass the cache with {"fresh": true} or Cache-Control: no-cache"""
+    return bool(data.get('fresh')) or 'no-cache' in cache_control
+
+def request_priority(data: Dict[str, Any]) -> int:
+    """Priority class from {"priority": "interactive" | "batch" | "prefetch"}"""
+    return PRIORITY_NAMES.get(str(data.get('priority', 'interactive')), PRIORITY_INTERACTIVE)
+
+def capture_advice_request(data: Dict[str, Any], goal: str, cache_hit: Optional[Dict[str, Any]], fresh: bool,
+                           route: GoalRoute = BIG_ROUTE):
+    """Goal, replayable options and cache outcome for the traffic capture (no-op unless enabled)"""
+    if route.name == ROUTE_TEMPLATE:
+        cache = ROUTE_TEMPLATE
+    else:
+        cache = cache_hit['cache'] if cache_hit is not None else ('bypass' if fresh else 'miss')
+    note_capture(goal=goal, cache=cache, route=route.name,
+                 **{k: data[k] for k in CAPTURED_OPTIONS if k in data})
+
+def open_session(data: Dict[str, Any], goal: str, advice: str, route: GoalRoute = BIG_ROUTE,
+                 result: Optional[GenerateResult] = None) -> Dict[str, Any]:
+    """{"session_id": ...} for clients that sent {"session": true}, so they can ask follow-ups"""
+    if not SESSIONS_ENABLED or not data.get('session'):
+        return {}
+    # Follow-ups on a templated answer are generated by the main model
+    route = BIG_ROUTE if route.name == ROUTE_TEMPLATE else route
+    return {'session_id': sessions.create(goal, advice, route, result).id}
+
+def parse_follow_up(data: Any) -> Tuple[Optional[Session], str, Optional[Tuple[str, int]]]:
+    """(session, message, None), or (None, '', (error, status)) for a bad follow-up request"""
+    if not SESSIONS_ENABLED:
+        return None, '', ('Follow-up sessions are disabled.', 404)
+    if not isinstance(data, dict) or not data.get('session_id') or not str(data.get('message', '')).strip():
+        return None, '', ('Please send a session_id and a message.', 400)
+    message = str(data['message']).strip()
+    if len(message) > FOLLOW_UP_MAX_CHARS:
+        return None, '', (f'Message is too long (max {FOLLOW_UP_MAX_CHARS} characters).', 400)
+    session = sessions.get(str(data['session_id']))
+    if session is None:
+        return None, '', ('Session not found or expired.', 404)
+    return session, message, None
+
+def choose_route(goal: str, use_rag: bool = False, fresh: bool = False) -> GoalRoute:
+    """Goal route, counted per route and category; RAG prompts always use the main model"""
+    route = BIG_ROUTE if use_rag else goal_router.route(goal, allow_template=not fresh)
+    goal_routes.inc(route=route.name, category=route.category or 'none')
+    return route
+
+def prefetch_items(goals: List[Any]) -> List[PrefetchItem]:
+    """Prefetch work for the goals a click would generate: not templated, not cached yet"""
+    use_rag = wants_rag({})
+    items = []
+    for goal, _ in dedupe_goals(goals)[0]:
+        route = goal_router.route(goal)
+        if route.name == ROUTE_TEMPLATE:
+            continue
+        cache_key = advice_cache_key(goal, use_rag, route)
+        if not advice_cache.contains(cache_key):
+            items.append(PrefetchItem(cache_key, goal, route, use_rag))
+    return items
+
+def job_payload(data: Dict[str, Any], goal: str, cache_control: str) -> Dict[str, Any]:
+    """What a job keeps of its request: the goal and the options that shape the answer"""
+    return {'goal': goal, 'fresh': wants_fresh_advice(data, cache_control),
+            **{k: data[k] for k in ('rag', 'priority') if k in data}}
+
+def job_can_wait(job: Job) -> bool:
+    """Whether a job may go back to the queue instead of settling for fallback advice"""
+    return job.age < JOB_MAX_WAIT
+
+def template_response(goal: str, route: GoalRoute) -> Dict[str, Any]:
+    """Response fields for a goal answered from its category template, without Ollama"""
+    return {'advice': route.template_advice(goal), 'cached': False, **route.fields()}
+
+def requested_tips(data: Dict[str, Any]) -> Optional[int]:
+    """Tip count for {"structured": true, "tips": n} (default 3, at most MAX_TIPS); None for free text"""
+    if not data.get('structured'):
+        return None
+    try:
+        return max(1, min(int(data.get('tips', 3)), MAX_TIPS))
+    except (TypeError, ValueError):
+        return 3
+
+def tier_tip_count(count: int, tier: BudgetTier) -> int:
+    """Fewer tips under reduced budget tiers, as the free-text prompt asks for"""
+    return min(count, int(tier.tips.split("-")[-1]))
+
+def tips_cache_key(goal: str, count: int, route: GoalRoute = BIG_ROUTE) -> str:
+    """Cache key for structured tips; kept apart from the free-text answers"""
+    return make_cache_key(goal, route.model or OLLAMA_MODEL, f"{TIPS_PROMPT_TEMPLATE}#{count}",
+                          route.options(OLLAMA_OPTIONS))
+
+def cached_tips(cache_key: str) -> Optional[Dict[str, Any]]:
+    """Response fields for cached structured tips"""
+    cached = advice_cache.get(cache_key)
+    if cached is None:
+        return None
+    return {'tips': json.loads(cached), 'cached': True, 'cache': 'exact'}
+
+def store_tips(cache_key: str, tips: List[str], count: int, tier: str = TIER_FULL):
+    """Cache complete full-tier answers only, like store_advice"""
+    if tier == TIER_FULL and len(tips) == count:
+        advice_cache.set(cache_key, json.dumps(tips, ensure_ascii=False))
+
+def fallback_tips(response: Dict[str, Any], count: int) -> Dict[str, Any]:
+    """A busy or fallback response in structured form: generic tips instead of the advice text"""
+    return {**{k: v for k, v in response.items() if k != 'advice'}, 'tips': FALLBACK_TIPS[:count]}
+
+def rag_model_for(goal_vector: Optional[np.ndarray]) -> Optional[str]:
+    """Model to embed the goal with for retrieval; None when goal_vector can be reused"""
+    if goal_vector is not None and rag_engine.store.model == OLLAMA_EMBED_MODEL:
+        return None
+    return rag_engine.store.model
+
+def retrieve_references(goal_vector: np.ndarray) -> List[Dict[str, Any]]:
+    """Top-k corpus chunks for a goal embedded with the index's model"""
+    return rag_engine.retrieve("", RAG_TOP_K, vector=goal_vector, min_score=RAG_MIN_SCORE)
+
+def reference_ids(references: List[Dict[str, Any]]) -> List[str]:
+    return [f"{chunk['source']}#{chunk['chunk']}" for chunk in references]
+
+def advice_cache_key(goal: str, use_rag: bool = False, route: GoalRoute = BIG_ROUTE) -> str:
+    """Cache key for a goal under the current model, prompt and options (of its route)"""
+    template = ADVICE_PROMPT_TEMPLATE
+    if use_rag:
+        template = f"{RAG_PROMPT_TEMPLATE}#{rag_engine.store.count}"
+    elif route.prompt_template is not None:
+        template = route.prompt_template
+    return make_cache_key(goal, route.model or OLLAMA_MODEL, template, route.options(OLLAMA_OPTIONS))
+
+def advice_fingerprint(use_rag: bool = False, route: GoalRoute = BIG_ROUTE) -> str:
+    """advice_cache_key without the goal: what an answer was generated with.
+
+    Semantic matches only count between answers with the same fingerprint.
+    """
+    return advice_cache_key("", use_rag, route)
+
+def exact_cache_hit(cache_key: str) -> Optional[Dict[str, Any]]:
+    """Response fields for an exact cache hit"""
+    cached_advice = advice_cache.get(cache_key)
+    if cached_advice is None:
+        return None
+    if prefetcher.claim(cache_key):
+        return {'advice': cached_advice, 'cached': True, 'cache': 'exact', 'prefetched': True}
+    return {'advice': cached_advice, 'cached': True, 'cache': 'exact'}
+
+def precomputed_hit(goal: str) -> Optional[Dict[str, Any]]:
+    """Response fields for a stored answer whose goal is a close trigram match"""
+    refresh_precomputed()
+    if precomputed_store is None:
+        return None
+    match = precomputed_store.lookup(goal, PRECOMPUTED_MIN_SIMILARITY)
+    if match is None:
+        return None
+    advice, similarity, matched_goal = match
+    return {
+        'advice': advice,
+        'cached': True,
+        'cache': 'precomputed',
+        'similarity': round(similarity, 4),
+        'matched_goal': matched_goal
+    }
+
+def instant_cache_hit(goal: str, cache_key: str, use_rag: bool = False) -> Optional[Dict[str, Any]]:
+    """Exact cache, then precomputed answers (not for RAG prompts); no Ollama calls"""
+    cache_hit = exact_cache_hit(cache_key)
+    if cache_hit is None and not use_rag:
+        cache_hit = precomputed_hit(goal)
+    return cache_hit
+
+def semantic_cache_hit(cache_key: str, fingerprint: str,
+                       goal_vector: Optional[np.ndarray]) -> Optional[Dict[str, Any]]:
+    """Response fields for a near-duplicate goal generated under `fingerprint`; promotes the
+    hit into the exact cache until the original answer expires, not for a fresh TTL"""
+    if goal_vector is None:
+        return None
+    match = semantic_cache.lookup(goal_vector, fingerprint)
+    if match is None:
+        return None
+    cached_advice, similarity, matched_goal, expires_at = match
+    advice_cache.set(cache_key, cached_advice, ttl=expires_at - time.time())
+    return {
+        'advice': cached_advice,
+        'cached': True,
+        'cache': 'semantic',
+        'similarity': round(similarity, 4),
+        'matched_goal': matched_goal
+    }
+
+def store_advice(goal: str, cache_key: str, fingerprint: str, advice: str,
+                 goal_vector: Optional[np.ndarray], tier: str = TIER_FULL):
+    """Remember freshly generated advice in both caches.
+
+    Answers from a reduced budget tier are not cached, so full-length advice
+    comes back once load drops.
+    """
+    if tier != TIER_FULL:
+        return
+    advice_cache.set(cache_key, advice)
+    if goal_vector is not None:
+        semantic_cache.add(goal_vector, fingerprint, goal, advice)
+
+def cache_stats() -> Dict[str, Any]:
+    return {
+        **advice_cache.stats(),
+        'semantic': semantic_cache.stats(),
+        'precomputed': precomputed_store.stats() if precomputed_store is not None else None,
+        'shared': shared_state.stats() if shared_state is not None else None
+    }
+
+def latency_key(route: GoalRoute, tier: BudgetTier) -> str:
+    """Calls that share deadlines: the same route (model and prompt) at the same budget tier"""
+    return f"{route.name}:{tier.name}"
+
+def generation_timeouts(key: str) -> OllamaTimeouts:
+    """Deadlines of 2x the recent p99 latency of `key`'s calls, never above the configured ones.
+
+    The configured deadlines apply while the circuit is not closed: those calls
+    are the probes that decide whether it closes again.
+    """
+    if not ADAPTIVE_TIMEOUTS_ENABLED or ollama_breaker.state != STATE_CLOSED:
+        return OLLAMA_TIMEOUTS
+    return OllamaTimeouts(
+        connect=OLLAMA_TIMEOUTS.connect,
+        first_byte=route_first_token[key].timeout(OLLAMA_TIMEOUTS.first_byte, ADAPTIVE_TIMEOUT_FLOOR),
+        total=route_latency[key].timeout(OLLAMA_TIMEOUTS.total, ADAPTIVE_TIMEOUT_FLOOR)
+    )
+
+def observe_first_token(key: str, seconds: float):
+    first_token_latency.add(seconds)
+    route_first_token[key].add(seconds)
+
+def observe_latency(key: str, seconds: float):
+    generate_latency.add(seconds)
+    route_latency[key].add(seconds)
+
+def hedge_delay(key: str) -> Optional[float]:
+    """Seconds before hedging a generation to another node, or None when not hedging"""
+    if not OLLAMA_HEDGE_ENABLED or len(OLLAMA_BASE_URLS) < 2:
+        return None
+    return route_latency[key].percentile(95)
+
+def resilience_stats() -> Dict[str, Any]:
+    timeouts = {key: generation_timeouts(key) for key in route_latency.keys()}
+    return {
+        'circuit': ollama_breaker.stats(),
+        'latency': {
+            'generate': generate_latency.stats(),
+            'first_token': first_token_latency.stats(),
+            'routes': route_latency.stats()
+        },
+        'timeouts': {key: {'first_byte': round(t.first_byte, 1), 'total': round(t.total, 1)}
+                     for key, t in timeouts.items()},
+        'hedging': OLLAMA_HEDGE_ENABLED
+    }
+
+# Only answers generated with the current model, prompt and options are served
+precomputed_dir = current_dir(PRECOMPUTED_DIR)
+precomputed_store = PrecomputedStore.open(PRECOMPUTED_DIR, fingerprint=advice_cache_key(""))
+_precomputed_checked = time.monotonic()
+
+def refresh_precomputed():
+    """Switch to the build precompute.py linked in since the last check"""
+    global precomputed_dir, precomputed_store, _precomputed_checked
+    now = time.monotonic()
+    if now - _precomputed_checked < PRECOMPUTED_RELOAD_INTERVAL:
+        return
+    _precomputed_checked = now
+    directory = current_dir(PRECOMPUTED_DIR)
+    if directory != precomputed_dir:
+        precomputed_dir = directory
+        precomputed_store = PrecomputedStore.open(PRECOMPUTED_DIR, fingerprint=advice_cache_key(""))
+
+def dedupe_goals(goals: List[Any]) -> Tuple[List[Tuple[str, List[int]]], List[int]]:
+    """Unique goals in first-seen order with every index they appear at, plus invalid indices"""
+    unique: Dict[str, Tuple[str, List[int]]] = {}
+    invalid: List[int] = []
+    for index, goal in enumerate(goals):
+        if not isinstance(goal, str) or not goal.strip():
+            invalid.append(index)
+            continue
+        entry = unique.setdefault(normalize_goal(goal), (goal.strip(), []))
+        entry[1].append(index)
+    return list(unique.values()), invalid
+
+def generated_item(goal: str, cache_key: str, fingerprint: str, result: Dict[str, Any],
+                   goal_vector: Optional[np.ndarray],
+                   references: List[Dict[str, Any]], route: GoalRoute = BIG_ROUTE,
+                   source: str = 'batch') -> Dict[str, Any]:
+    """Batch item (or job result) fields for a scheduled generation; successes are stored in the caches"""
+    if not result["success"]:
+        fallbacks.inc(route=source)
+        item = {
+            'status': 'fallback',
+            'success': True,
+            'advice': build_fallback_advice(goal, result["error"]),
+            'fallback': True,
+            'error': result["error"]
+        }
+        if result.get("retry_after"):
+            item['retry_after'] = result["retry_after"]
+        return item
+    advice = result["response"].strip()
+    store_advice(goal, cache_key, fingerprint, advice, goal_vector, result["tier"])
+    item = {'status': 'generated', 'success': True, 'advice': advice, 'cached': False, 'tier': result["tier"],
+            **route.fields()}
+    if references:
+        item['references'] = reference_ids(references)
+    return item
+
+def batch_line(goal: Optional[str], indices: List[int], fields: Dict[str, Any], start_time: float) -> str:
+    """One NDJSON line of a batch response"""
+    return json.dumps({
+        'event': 'result',
+        'goal': goal,
+        'indices': indices,
+        **fields,
+        'elapsed_ms': round((time.time() - start_time) * 1000, 1)
+    }, ensure_ascii=False) + "\n"
+
+def batch_summary(counts: Dict[str, int], start_time: float) -> str:
+    return json.dumps({
+        'event': 'done',
+        **counts,
+        'total_ms': round((time.time() - start_time) * 1000, 1)
+    }) + "\n"
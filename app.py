@@ -0,0 +1,1239 @@
+#!/usr/bin/env python3
+"""
+Production ASGI server
+Same routes and JSON shapes as app_simple.py, served by asyncio with a
+non-blocking Ollama client so thousands of slow generations and open
+streams can share one process.
+
+Run:
+    python app.py                                   # uvicorn, WEB_CONCURRENCY workers
+    gunicorn app:app -c gunicorn.conf.py            # gunicorn managing uvicorn workers
+"""
+
+import asyncio
+import json
+import logging
+import math
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+from advice_cache import normalize_goal
+from advice_core import (
+    BATCH_MAX_GOALS,
+    BATCH_MAX_WORKERS,
+    EMBED_TIMEOUTS,
+    JOB_MAX_PENDING,
+    JOB_POLL_INTERVAL,
+    LOAD_RECOVER_SECONDS,
+    BACKEND_CHECK_INTERVAL,
+    BACKEND_EJECT_AFTER,
+    OLLAMA_BASE_URLS,
+    OLLAMA_ROUTING,
+    OLLAMA_EMBED_MODEL,
+    OLLAMA_KEEP_ALIVE,
+    MODEL_WARMUP_ENABLED,
+    PREFETCH_ENABLED,
+    PREFETCH_MAX_GOALS,
+    OLLAMA_MAX_IN_FLIGHT,
+    OLLAMA_MODEL,
+    OLLAMA_TIMEOUTS,
+    SEMANTIC_CACHE_ENABLED,
+    STATUS_POLL_INTERVAL,
+    advice_cache_key,
+    advice_fingerprint,
+    build_advice_prompt,
+    build_fallback_advice,
+    build_follow_up_prompt,
+    busy_response,
+    build_simple_test_advice,
+    cached_tips,
+    capture_advice_request,
+    choose_route,
+    batch_line,
+    batch_summary,
+    budget_policy,
+    dedupe_goals,
+    fallback_tips,
+    generated_item,
+    goal_router,
+    cache_stats as core_cache_stats,
+    instant_cache_hit,
+    job_can_wait,
+    job_payload,
+    open_jobs,
+    advice_cache,
+    generation_timeouts,
+    hedge_delay,
+    latency_key,
+    observe_first_token,
+    observe_latency,
+    ollama_breaker,
+    open_session,
+    parse_follow_up,
+    prefetch_items,
+    prefetcher,
+    rag_model_for,
+    reference_ids,
+    request_priority,
+    requested_tips,
+    resilience_stats,
+    retrieve_references,
+    scheduler,
+    semantic_cache_hit,
+    sessions,
+    shared_state,
+    store_advice,
+    store_tips,
+    template_response,
+    tier_tip_count,
+    tips_cache_key,
+    validate_goal,
+    wants_fresh_advice,
+    wants_rag,
+)
+from backend_pool import AsyncBackendPool
+from circuit_breaker import CircuitOpenError
+from goal_router import BIG_ROUTE, ROUTE_TEMPLATE, GoalRoute
+from job_queue import JOB_QUEUED, JOB_RUNNING, Job, JobRetry, JobWorkers
+from load_policy import TIER_FULL, BudgetTier
+from metrics import (
+    CONTENT_TYPE as METRICS_CONTENT_TYPE,
+    REGISTRY as METRICS,
+    ASGIMetricsMiddleware,
+    budget_tiers,
+    fallbacks,
+    observe_cache_lookup,
+    observe_connect,
+    observe_generation,
+    observe_stage,
+    ollama_errors,
+    route_seconds,
+    structured_tokens,
+)
+from model_keeper import ModelKeeperGroup
+from ollama_client import (
+    AsyncOllamaClient,
+    GenerateChunk,
+    GenerateResult,
+    OllamaClient,
+    OllamaConnectionError,
+    OllamaError,
+    OllamaTimeoutError,
+    OllamaTimeouts,
+)
+from prefetch import (
+    PREFETCH_CANCELLED,
+    PREFETCH_DEFERRED,
+    PREFETCH_FAILED,
+    PREFETCH_GENERATED,
+    PREFETCH_SKIPPED,
+    PrefetchItem,
+)
+from scheduler import PRIORITY_INTERACTIVE, PRIORITY_PREFETCH, RateLimitedError, SchedulerRejected
+from semantic_cache import SemanticCache
+from singleflight import AsyncSingleFlight, AsyncStreamFlight
+from status_poller import StatusPoller, etag_matches
+from structured_advice import FALLBACK_TIPS, TipStreamParser, build_tips_prompt, tips_from_text, tips_schema
+from structured_log import (
+    LOG_ADMIN_TOKEN,
+    ASGIRequestContextMiddleware,
+    log_payload,
+    settings as log_settings,
+    update_settings as update_log_settings,
+    validate_settings as validate_log_settings,
+)
+from traffic_capture import (
+    CAPTURE_ENABLED,
+    CAPTURED_ROUTES,
+    ASGICaptureMiddleware,
+    note as note_capture,
+    writer as capture_writer,
+)
+
+logger = logging.getLogger("app")
+
+# Server configuration
+HOST = os.environ.get("HOST", "0.0.0.0")
+PORT = int(os.environ.get("PORT", "5000"))
+WEB_CONCURRENCY = int(os.environ.get("WEB_CONCURRENCY", "1"))
+OLLAMA_POOL_SIZE = int(os.environ.get("OLLAMA_POOL_SIZE", "100"))
+
+ollama: Optional[AsyncBackendPool] = None
+status_poller: Optional[StatusPoller] = None
+
+METRICS.gauge('ollama_backend_healthy', 'Whether each Ollama node is in rotation',
+              lambda: [((b['url'],), int(b['healthy'])) for b in ollama.stats()['backends']],
+              ('backend',))
+
+# Keepers run in background threads with their own small sync client per node
+model_keeper = ModelKeeperGroup(
+    [OllamaClient(url, OLLAMA_MODEL, max_in_flight=1, pool_size=2) for url in OLLAMA_BASE_URLS],
+    OLLAMA_MODEL, keep_alive=OLLAMA_KEEP_ALIVE)
+
+# Identical concurrent goals share one upstream generation
+advice_flight = AsyncSingleFlight()
+stream_flight = AsyncStreamFlight()
+
+# Drain /api/jobs; pending jobs from before a restart are picked up again.
+# Opened in lifespan; stays None when jobs are disabled
+job_workers: Optional[JobWorkers] = None
+
+
+def ollama_error_message(error: Exception, timeouts: OllamaTimeouts = OLLAMA_TIMEOUTS) -> str:
+    """Map client errors to the messages app_simple.py returns"""
+    if isinstance(error, OllamaTimeoutError):
+        return f"Ollama API call timeout ({timeouts.total:.0f}s)"
+    if isinstance(error, OllamaConnectionError):
+        return "Failed to connect to Ollama server"
+    if isinstance(error, OllamaError):
+        return str(error)
+    return f"Exception occurred: {str(error)}"
+
+
+def circuit_open_result(error: CircuitOpenError) -> Dict[str, Any]:
+    return {
+        "success": False,
+        "error": str(error),
+        "retry_after": math.ceil(error.retry_after)
+    }
+
+
+async def guarded_generate(prompt: str, timeouts: OllamaTimeouts, options: Dict[str, Any], key: str,
+                           route: GoalRoute = BIG_ROUTE,
+                           session_kwargs: Optional[Dict[str, Any]] = None) -> GenerateResult:
+    """ollama.generate behind the circuit breaker, hedged to a second node when enabled.
+
+    `session_kwargs` (context, prefer) continue a follow-up session on the node
+    holding its context; those calls are never hedged. `key` (latency_key)
+    picks the latency trackers the call feeds.
+    """
+    ollama_breaker.allow()
+    start_time = time.monotonic()
+    try:
+        hedge_after = None if session_kwargs else hedge_delay(key)
+        if hedge_after is not None:
+            result = await ollama.generate_hedged(prompt, hedge_after, options=options,
+                                                  model=route.model, timeouts=timeouts)
+        else:
+            result = await ollama.generate(prompt, options=options, model=route.model, timeouts=timeouts,
+                                           **(session_kwargs or {}))
+    except BaseException as e:
+        ollama_breaker.record(e)
+        if isinstance(e, OllamaTimeoutError):
+            observe_latency(key, time.monotonic() - start_time)
+        if isinstance(e, Exception):
+            ollama_errors.inc(type=type(e).__name__)
+        raise
+    ollama_breaker.record()
+    observe_latency(key, time.monotonic() - start_time)
+    observe_stage('generate', start_time)
+    route_seconds.observe(time.monotonic() - start_time, route=route.name)
+    observe_generation(result, 'reused' if session_kwargs else 'none')
+    return result
+
+
+async def guarded_stream(prompt: str, timeouts: OllamaTimeouts, options: Dict[str, Any], key: str,
+                         route: GoalRoute = BIG_ROUTE, **extra: Any) -> AsyncIterator[GenerateChunk]:
+    """ollama.generate_stream behind the circuit breaker, feeding the latency trackers.
+
+    `extra` goes into the /api/generate payload (e.g. a `format` schema).
+    """
+    ollama_breaker.allow()
+    start_time = time.monotonic()
+    first_chunk = True
+    recorded = False
+    try:
+        async for chunk in ollama.generate_stream(prompt, options=options, model=route.model, timeouts=timeouts,
+                                                  **extra):
+            if first_chunk:
+                observe_first_token(key, time.monotonic() - start_time)
+                observe_stage('ttft', start_time)
+                first_chunk = False
+            if chunk.done:
+                ollama_breaker.record()
+                observe_latency(key, time.monotonic() - start_time)
+                observe_stage('generate', start_time)
+                route_seconds.observe(time.monotonic() - start_time, route=route.name)
+                observe_generation(chunk.result)
+                recorded = True
+            yield chunk
+    except BaseException as e:
+        if not recorded and isinstance(e, GeneratorExit) and not first_chunk:
+            # Closed by the consumer after Ollama had answered (client gone, structured tips complete)
+            ollama_breaker.record()
+        elif not recorded:
+            ollama_breaker.record(e)
+            if isinstance(e, OllamaTimeoutError):
+                if first_chunk:
+                    observe_first_token(key, time.monotonic() - start_time)
+                observe_latency(key, time.monotonic() - start_time)
+            if isinstance(e, Exception):
+                ollama_errors.inc(type=type(e).__name__)
+        raise
+
+
+async def call_ollama_api(prompt: str, tier: BudgetTier, route: GoalRoute = BIG_ROUTE,
+                          session_kwargs: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Call Ollama API"""
+    key = latency_key(route, tier)
+    timeouts = generation_timeouts(key)
+    options = route.options(tier.options)
+    try:
+        log_payload(logger, "Ollama request", prompt=prompt, options=options)
+        budget_tiers.inc(tier=tier.name)
+        result = await guarded_generate(prompt, timeouts, options, key, route, session_kwargs)
+        if route.model is None:
+            # Only the main model is kept resident; other models' load times are expected
+            model_keeper.observe(result)
+        logger.info("Generation finished", extra={
+            "backend": result.backend,
+            "eval_count": result.eval_count,
+            "tier": tier.name,
+            "route": route.name,
+            "prompt_eval_count": result.prompt_eval_count,
+            "context_reused": bool(session_kwargs),
+            "total_ms": round(result.total_duration / 1e6, 1),
+            "load_ms": round(result.load_duration / 1e6, 1),
+            "response_chars": len(result.response),
+            "first_byte_timeout": round(timeouts.first_byte), "total_timeout": round(timeouts.total)
+        })
+        log_payload(logger, "Ollama response", response=result.response)
+        if result.response.strip():
+            return {
+                "success": True,
+                "response": result.response,
+                "tier": tier.name,
+                "generation": result
+            }
+        logger.warning("Empty response received", extra={"backend": result.backend})
+        return {
+            "success": False,
+            "error": "Received empty response from Ollama"
+        }
+    except CircuitOpenError as e:
+        logger.warning("Circuit open", extra={"retry_after": round(e.retry_after, 1)})
+        return circuit_open_result(e)
+    except Exception as e:
+        logger.error("Ollama API failed", extra={"error": f"{type(e).__name__}: {e}"})
+        return {
+            "success": False,
+            "error": ollama_error_message(e, timeouts)
+        }
+
+
+async def stream_ollama_api(prompt: str, tier: BudgetTier, route: GoalRoute = BIG_ROUTE,
+                            **extra: Any) -> AsyncIterator[Dict[str, Any]]:
+    """Call Ollama API in streaming mode, yielding chunks as they arrive"""
+    key = latency_key(route, tier)
+    timeouts = generation_timeouts(key)
+    options = route.options(tier.options)
+    try:
+        log_payload(logger, "Ollama stream request", prompt=prompt, options=options)
+        budget_tiers.inc(tier=tier.name)
+        async for chunk in guarded_stream(prompt, timeouts, options, key, route, **extra):
+            if chunk.result is not None and route.model is None:
+                model_keeper.observe(chunk.result)
+            yield {
+                "success": True,
+                "response": chunk.response,
+                "done": chunk.done,
+                "tier": tier.name,
+                "generation": chunk.result
+            }
+    except CircuitOpenError as e:
+        logger.warning("Circuit open", extra={"retry_after": round(e.retry_after, 1)})
+        yield circuit_open_result(e)
+    except Exception as e:
+        logger.error("Ollama stream failed", extra={"error": f"{type(e).__name__}: {e}"})
+        yield {
+            "success": False,
+            "error": ollama_error_message(e, timeouts)
+        }
+
+
+async def scheduled_call(prompt: str, priority: int, tier: BudgetTier, route: GoalRoute = BIG_ROUTE,
+                         session_kwargs: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """call_ollama_api once admitted by the scheduler"""
+    queued_at = time.monotonic()
+    try:
+        async with scheduler.slot_async(priority):
+            observe_stage('queue_wait', queued_at)
+            return await call_ollama_api(prompt, tier, route, session_kwargs)
+    except SchedulerRejected as e:
+        logger.warning("Not admitted", extra={"reason": type(e).__name__, "retry_after": round(e.retry_after, 1)})
+        return {
+            "success": False,
+            "error": str(e),
+            "retry_after": math.ceil(e.retry_after)
+        }
+
+
+async def scheduled_stream(prompt: str, priority: int, tier: BudgetTier,
+                           route: GoalRoute = BIG_ROUTE, **extra: Any) -> AsyncIterator[Dict[str, Any]]:
+    """stream_ollama_api once admitted by the scheduler"""
+    queued_at = time.monotonic()
+    try:
+        await scheduler.acquire_async(priority)
+    except SchedulerRejected as e:
+        logger.warning("Not admitted", extra={"reason": type(e).__name__, "retry_after": round(e.retry_after, 1)})
+        yield {
+            "success": False,
+            "error": str(e),
+            "retry_after": math.ceil(e.retry_after)
+        }
+        return
+    observe_stage('queue_wait', queued_at)
+    start_time = time.monotonic()
+    try:
+        async for chunk in stream_ollama_api(prompt, tier, route, **extra):
+            yield chunk
+    finally:
+        scheduler.release(time.monotonic() - start_time)
+
+
+async def scheduled_tips(prompt: str, priority: int, tier: BudgetTier, count: int,
+                         route: GoalRoute = BIG_ROUTE) -> Dict[str, Any]:
+    """Schema-constrained tips, closing the stream as soon as `count` of them are complete"""
+    parser = TipStreamParser(count)
+    tokens, done = 0, False
+    chunks = scheduled_stream(prompt, priority, tier, route, format=tips_schema(count))
+    try:
+        async for chunk in chunks:
+            if not chunk["success"]:
+                return chunk
+            done = chunk["done"]
+            if chunk["response"]:
+                tokens += 1
+                parser.feed(chunk["response"])
+            if parser.complete:
+                break
+    finally:
+        await chunks.aclose()
+    structured_tokens.observe(tokens, end='done' if done else 'early')
+    log_payload(logger, "Ollama tips", tips=parser.tips)
+    if not parser.tips:
+        return {"success": False, "error": "Received no tips from Ollama"}
+    return {"success": True, "tips": parser.tips, "tier": tier.name}
+
+
+async def embed_text(text: str, model: str) -> Optional[np.ndarray]:
+    """Unit-normalized embedding, or None when embeddings are unavailable"""
+    try:
+        result = await ollama.embeddings(text, model=model, timeouts=EMBED_TIMEOUTS)
+        return SemanticCache.normalize(result.embedding)
+    except OllamaError as e:
+        logger.warning("Embedding failed", extra={"error": str(e)})
+        return None
+
+
+async def embed_goal(goal: str) -> Optional[np.ndarray]:
+    """Embed a goal for the semantic cache"""
+    if not SEMANTIC_CACHE_ENABLED:
+        return None
+    return await embed_text(normalize_goal(goal), OLLAMA_EMBED_MODEL)
+
+
+async def off_loop(call: Callable[..., Any], *args: Any) -> Any:
+    """Run a call that may touch SQLite (shared state, persistent advice cache) in a thread,
+    where waiting on another process's lock cannot stall the event loop; inline otherwise"""
+    if shared_state is None and not advice_cache.persistent:
+        return call(*args)
+    return await asyncio.to_thread(call, *args)
+
+
+async def lookup_cached_advice(goal: str, cache_key: str, fingerprint: str, use_rag: bool = False) -> Tuple[Optional[Dict[str, Any]], Optional[np.ndarray]]:
+    """Exact cache, precomputed answers, then semantic cache; returns (response fields, goal vector)"""
+    cache_hit = await off_loop(instant_cache_hit, goal, cache_key, use_rag)
+    if cache_hit is None:
+        goal_vector = await embed_goal(goal)
+        cache_hit = await off_loop(semantic_cache_hit, cache_key, fingerprint, goal_vector)
+    else:
+        goal_vector = None
+    observe_cache_lookup(cache_hit)
+    return cache_hit, goal_vector
+
+
+async def references_for(goal: str, goal_vector: Optional[np.ndarray]) -> List[Dict[str, Any]]:
+    """Top-k corpus chunks, reusing the semantic-cache embedding when compatible"""
+    model = rag_model_for(goal_vector)
+    if model is not None:
+        goal_vector = await embed_text(normalize_goal(goal), model)
+    return retrieve_references(goal_vector) if goal_vector is not None else []
+
+
+def get_client_id(request: Request) -> str:
+    """Client identity for fair-share rate limiting"""
+    return request.headers.get('X-Client-ID') or (request.client.host if request.client else 'anonymous')
+
+
+def rate_limited_response(error: RateLimitedError) -> JSONResponse:
+    """429 with Retry-After for clients over their fair share"""
+    retry_after = math.ceil(error.retry_after)
+    return JSONResponse({
+        'success': False,
+        'error': 'Too many requests. Please try again later.',
+        'retry_after': retry_after
+    }, status_code=429, headers={'Retry-After': str(retry_after)})
+
+
+async def parse_goal(request: Request) -> Tuple[Optional[Dict[str, Any]], Optional[str], Optional[JSONResponse]]:
+    """Returns (data, goal, error response) for advice requests"""
+    parse_started = time.monotonic()
+    try:
+        data = await request.json()
+    except ValueError:
+        data = None
+    log_payload(logger, "Advice request", data=data)
+    goal, error = validate_goal(data)
+    if error is not None:
+        return None, None, JSONResponse({
+            'success': False,
+            'error': error
+        }, status_code=400)
+    observe_stage('parse', parse_started)
+    return data, goal, None
+
+
+async def get_advice(request: Request) -> Response:
+    """Advice API"""
+    if request.method == 'OPTIONS':
+        return JSONResponse({'status': 'ok'})
+
+    try:
+        data, goal, error_response = await parse_goal(request)
+        if error_response is not None:
+            return error_response
+
+        tip_count = requested_tips(data)
+        if tip_count is not None:
+            return await structured_advice(request, data, goal, tip_count)
+        use_rag = wants_rag(data)
+        fresh = wants_fresh_advice(data, request.headers.get('Cache-Control', ''))
+        route = choose_route(goal, use_rag, fresh)
+        if route.name == ROUTE_TEMPLATE:
+            capture_advice_request(data, goal, None, fresh, route)
+            response = template_response(goal, route)
+            return JSONResponse({'success': True, **response, **open_session(data, goal, response['advice'], route)})
+        cache_key = advice_cache_key(goal, use_rag, route)
+        fingerprint = advice_fingerprint(use_rag, route)
+        if fresh:
+            cache_hit, goal_vector = None, await embed_goal(goal)
+        else:
+            cache_hit, goal_vector = await lookup_cached_advice(goal, cache_key, fingerprint, use_rag)
+        capture_advice_request(data, goal, cache_hit, fresh, route)
+        if cache_hit is not None:
+            logger.info("Cache hit", extra={"cache": cache_hit['cache']})
+            return JSONResponse({'success': True, **cache_hit,
+                                 **open_session(data, goal, cache_hit['advice'], route)})
+        tier = budget_policy.current()
+        if not tier.generate:
+            return JSONResponse(busy_response(goal))
+
+        try:
+            await off_loop(scheduler.check_rate, get_client_id(request))
+        except RateLimitedError as e:
+            return rate_limited_response(e)
+        priority = request_priority(data)
+
+        references = await references_for(goal, goal_vector) if use_rag else []
+        prompt = build_advice_prompt(goal, references, tier, route)
+        result, shared = await advice_flight.do(cache_key, lambda: scheduled_call(prompt, priority, tier, route))
+        if shared:
+            logger.info("Joined in-flight generation")
+
+        if result["success"]:
+            advice = result["response"].strip()
+            log_payload(logger, "Advice generated", advice=advice)
+            await off_loop(store_advice, goal, cache_key, fingerprint, advice, goal_vector, result["tier"])
+            response = {
+                'success': True,
+                'advice': advice,
+                'cached': False,
+                'tier': result["tier"],
+                **route.fields(),
+                **open_session(data, goal, advice, route, result["generation"])
+            }
+            if references:
+                response['references'] = reference_ids(references)
+            return JSONResponse(response)
+
+        fallbacks.inc(route='advice')
+        note_capture(fallback=True)
+        logger.warning("Using fallback advice", extra={"error": result["error"]})
+        headers = {'Retry-After': str(result["retry_after"])} if result.get("retry_after") else None
+        return JSONResponse({
+            'success': True,
+            'advice': build_fallback_advice(goal, result["error"]),
+            'fallback': True
+        }, headers=headers)
+
+    except Exception as e:
+        logger.exception("Advice request failed")
+        return JSONResponse({
+            'success': False,
+            'error': f'Server error: {str(e)}'
+        }, status_code=500)
+
+
+async def structured_advice(request: Request, data: Dict[str, Any], goal: str, count: int) -> Response:
+    """Advice API in structured mode: a list of tips instead of one advice text"""
+    fresh = wants_fresh_advice(data, request.headers.get('Cache-Control', ''))
+    route = choose_route(goal, False, fresh)
+    if route.name == ROUTE_TEMPLATE:
+        capture_advice_request(data, goal, None, fresh, route)
+        return JSONResponse({'success': True, 'tips': tips_from_text(route.template_advice(goal), count),
+                             'cached': False, **route.fields()})
+    cache_key = tips_cache_key(goal, count, route)
+    cache_hit = None if fresh else await off_loop(cached_tips, cache_key)
+    capture_advice_request(data, goal, cache_hit, fresh, route)
+    if cache_hit is not None:
+        return JSONResponse({'success': True, **cache_hit})
+    tier = budget_policy.current()
+    if not tier.generate:
+        return JSONResponse(fallback_tips(busy_response(goal), count))
+
+    try:
+        await off_loop(scheduler.check_rate, get_client_id(request))
+    except RateLimitedError as e:
+        return rate_limited_response(e)
+    tier_count = tier_tip_count(count, tier)
+    prompt = build_tips_prompt(goal, tier_count)
+    result, shared = await advice_flight.do(
+        cache_key, lambda: scheduled_tips(prompt, request_priority(data), tier, tier_count, route))
+    if shared:
+        logger.info("Joined in-flight generation")
+
+    if result["success"]:
+        await off_loop(store_tips, cache_key, result["tips"], count, result["tier"])
+        return JSONResponse({'success': True, 'tips': result["tips"], 'cached': False,
+                             'tier': result["tier"], **route.fields()})
+    fallbacks.inc(route='advice')
+    note_capture(fallback=True)
+    logger.warning("Using fallback tips", extra={"error": result["error"]})
+    headers = {'Retry-After': str(result["retry_after"])} if result.get("retry_after") else None
+    return JSONResponse({
+        'success': True,
+        'tips': FALLBACK_TIPS[:count],
+        'fallback': True,
+        'error': result["error"]
+    }, headers=headers)
+
+
+def format_stream_event(event: str, payload: Dict[str, Any], ndjson: bool) -> str:
+    """Serialize a stream event as SSE or NDJSON"""
+    if ndjson:
+        return json.dumps({"event": event, **payload}, ensure_ascii=False) + "\n"
+    return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+
+async def stream_advice(request: Request) -> Response:
+    """Streaming advice API (Server-Sent Events, or NDJSON with ?format=ndjson)"""
+    if request.method == 'OPTIONS':
+        return JSONResponse({'status': 'ok'})
+
+    data, goal, error_response = await parse_goal(request)
+    if error_response is not None:
+        return error_response
+
+    ndjson = (request.query_params.get('format') == 'ndjson'
+              or 'application/x-ndjson' in request.headers.get('Accept', ''))
+    use_rag = wants_rag(data)
+    fresh = wants_fresh_advice(data, request.headers.get('Cache-Control', ''))
+    route = choose_route(goal, use_rag, fresh)
+    cache_key = advice_cache_key(goal, use_rag, route)
+    fingerprint = advice_fingerprint(use_rag, route)
+    if route.name == ROUTE_TEMPLATE:
+        # Answered at once from the category template, like a cache hit
+        cache_hit, goal_vector = template_response(goal, route), None
+    elif fresh:
+        cache_hit, goal_vector = None, await embed_goal(goal)
+    else:
+        cache_hit, goal_vector = await lookup_cached_advice(goal, cache_key, fingerprint, use_rag)
+    capture_advice_request(data, goal, cache_hit, fresh, route)
+    tier = budget_policy.current()
+    if cache_hit is None and not tier.generate:
+        # Extreme load: answer at once, like a cache hit, with templated advice
+        cache_hit = busy_response(goal)
+    if cache_hit is None:
+        try:
+            await off_loop(scheduler.check_rate, get_client_id(request))
+        except RateLimitedError as e:
+            return rate_limited_response(e)
+    priority = request_priority(data)
+    references = await references_for(goal, goal_vector) if use_rag and cache_hit is None else []
+    prompt = build_advice_prompt(goal, references, tier, route)
+
+    async def generate():
+        start_time = time.time()
+        if cache_hit is not None:
+            session = {} if cache_hit.get('fallback') else open_session(data, goal, cache_hit['advice'], route)
+            yield format_stream_event('done', {
+                'success': True,
+                **cache_hit,
+                **session,
+                'ttft_ms': 0.0,
+                'total_ms': round((time.time() - start_time) * 1000, 1)
+            }, ndjson)
+            return
+
+        first_token_time = None
+        parts = []
+        error_msg = None
+        retry_after = None
+        generated_tier = tier.name
+        generation = None
+
+        chunks, shared = stream_flight.subscribe(cache_key, lambda: scheduled_stream(prompt, priority, tier, route))
+        if shared:
+            logger.info("Joined in-flight stream")
+        async for chunk in chunks:
+            if not chunk["success"]:
+                error_msg = chunk["error"]
+                retry_after = chunk.get("retry_after")
+                break
+            generated_tier = chunk.get("tier", generated_tier)
+            generation = chunk.get("generation") or generation
+            text = chunk["response"]
+            if text:
+                if first_token_time is None:
+                    first_token_time = time.time()
+                    ttft_ms = round((first_token_time - start_time) * 1000, 1)
+                    yield format_stream_event('meta', {'ttft_ms': ttft_ms}, ndjson)
+                parts.append(text)
+                yield format_stream_event('token', {'text': text}, ndjson)
+
+        advice = "".join(parts).strip()
+        if error_msg is None and not advice:
+            error_msg = "Received empty response from Ollama"
+
+        done = {
+            'success': True,
+            'ttft_ms': round((first_token_time - start_time) * 1000, 1) if first_token_time else None,
+            'total_ms': round((time.time() - start_time) * 1000, 1)
+        }
+        logger.info("Stream finished", extra={"ttft_ms": done['ttft_ms'], "total_ms": done['total_ms'],
+                                              "shared": shared})
+        if error_msg is None:
+            done['advice'] = advice
+            done['cached'] = False
+            done['tier'] = generated_tier
+            done.update(route.fields())
+            done.update(open_session(data, goal, advice, route, generation))
+            await off_loop(store_advice, goal, cache_key, fingerprint, advice, goal_vector, generated_tier)
+        else:
+            fallbacks.inc(route='stream')
+            note_capture(fallback=True)
+            logger.warning("Using fallback advice", extra={"error": error_msg})
+            done['advice'] = build_fallback_advice(goal, error_msg)
+            done['fallback'] = True
+            if retry_after:
+                done['retry_after'] = retry_after
+        yield format_stream_event('done', done, ndjson)
+
+    return StreamingResponse(
+        generate(),
+        media_type='application/x-ndjson' if ndjson else 'text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
+async def follow_up_advice(request: Request) -> Response:
+    """Follow-up on an earlier answer ("more tips", "make it easier"), continuing its Ollama context"""
+    if request.method == 'OPTIONS':
+        return JSONResponse({'status': 'ok'})
+
+    parse_started = time.monotonic()
+    try:
+        data = await request.json()
+    except ValueError:
+        data = None
+    session, message, error = parse_follow_up(data)
+    if error is not None:
+        return JSONResponse({
+            'success': False,
+            'error': error[0]
+        }, status_code=error[1])
+    observe_stage('parse', parse_started)
+
+    tier = budget_policy.current()
+    if not tier.generate:
+        return JSONResponse({**busy_response(session.goal), 'session_id': session.id})
+    try:
+        await off_loop(scheduler.check_rate, get_client_id(request))
+    except RateLimitedError as e:
+        return rate_limited_response(e)
+
+    prompt, session_kwargs = build_follow_up_prompt(session, message, tier)
+    result = await scheduled_call(prompt, PRIORITY_INTERACTIVE, tier, session.route, session_kwargs)
+    if not result["success"]:
+        fallbacks.inc(route='follow_up')
+        logger.warning("Using fallback advice", extra={"error": result["error"]})
+        headers = {'Retry-After': str(result["retry_after"])} if result.get("retry_after") else None
+        return JSONResponse({
+            'success': True,
+            'advice': build_fallback_advice(session.goal, result["error"]),
+            'fallback': True,
+            'session_id': session.id
+        }, headers=headers)
+
+    advice = result["response"].strip()
+    sessions.record(session, advice, result["generation"], bool(session_kwargs))
+    return JSONResponse({
+        'success': True,
+        'advice': advice,
+        'cached': False,
+        'tier': result["tier"],
+        'session_id': session.id,
+        'turn': session.turns,
+        'context_reused': bool(session_kwargs)
+    })
+
+
+async def batch_advice(goal: str, use_rag: bool, fresh: bool, priority: int,
+                       route: GoalRoute = BIG_ROUTE) -> Dict[str, Any]:
+    """Advice fields for one batch goal: semantic cache, then a scheduled generation"""
+    cache_key = advice_cache_key(goal, use_rag, route)
+    fingerprint = advice_fingerprint(use_rag, route)
+    goal_vector = await embed_goal(goal)
+    if not fresh:
+        cache_hit = await off_loop(semantic_cache_hit, cache_key, fingerprint, goal_vector)
+        observe_cache_lookup(cache_hit)
+        if cache_hit is not None:
+            return {'status': 'cached', 'success': True, **cache_hit}
+    tier = budget_policy.current()
+    if not tier.generate:
+        return {'status': 'fallback', **busy_response(goal)}
+    references = await references_for(goal, goal_vector) if use_rag else []
+    prompt = build_advice_prompt(goal, references, tier, route)
+    result, _ = await advice_flight.do(cache_key, lambda: scheduled_call(prompt, priority, tier, route))
+    return await off_loop(generated_item, goal, cache_key, fingerprint, result, goal_vector, references, route)
+
+
+async def batch_advice_route(request: Request) -> Response:
+    """Batch advice API: one NDJSON line per unique goal, in completion order"""
+    if request.method == 'OPTIONS':
+        return JSONResponse({'status': 'ok'})
+
+    parse_started = time.monotonic()
+    try:
+        data = await request.json()
+    except ValueError:
+        data = None
+    goals = data.get('goals') if isinstance(data, dict) else None
+    if not isinstance(goals, list) or not goals:
+        return JSONResponse({
+            'success': False,
+            'error': 'Please enter a list of goals.'
+        }, status_code=400)
+    if len(goals) > BATCH_MAX_GOALS:
+        return JSONResponse({
+            'success': False,
+            'error': f'Too many goals (max {BATCH_MAX_GOALS}).'
+        }, status_code=400)
+
+    unique_goals, invalid = dedupe_goals(goals)
+    use_rag = wants_rag(data)
+    fresh = wants_fresh_advice(data, request.headers.get('Cache-Control', ''))
+    priority = request_priority({'priority': 'batch', **data})
+    observe_stage('parse', parse_started)
+
+    # Templates and exact/precomputed hits go out first; everything else needs embeddings or Ollama
+    hits, misses = [], []
+    for goal, indices in unique_goals:
+        route = choose_route(goal, use_rag, fresh)
+        if route.name == ROUTE_TEMPLATE:
+            hits.append((goal, indices, {'status': 'template', 'success': True, **template_response(goal, route)}))
+            continue
+        cache_hit = None if fresh else await off_loop(
+            instant_cache_hit, goal, advice_cache_key(goal, use_rag, route), use_rag)
+        if cache_hit is not None:
+            observe_cache_lookup(cache_hit)
+            hits.append((goal, indices, {'status': 'cached', 'success': True, **cache_hit}))
+        else:
+            misses.append((goal, indices, route))
+    if misses:
+        try:
+            await off_loop(scheduler.check_rate, get_client_id(request))
+        except RateLimitedError as e:
+            return rate_limited_response(e)
+    logger.info("Batch received", extra={"goals": len(goals), "cached": len(hits), "to_generate": len(misses)})
+
+    async def generate():
+        start_time = time.time()
+        counts = {'total': len(unique_goals), 'cached': 0, 'template': 0, 'generated': 0, 'fallback': 0,
+                  'invalid': len(invalid)}
+        for index in invalid:
+            yield batch_line(None, [index], {
+                'status': 'invalid',
+                'success': False,
+                'error': 'Goal is empty.'
+            }, start_time)
+        for goal, indices, item in hits:
+            counts[item['status']] += 1
+            yield batch_line(goal, indices, item, start_time)
+
+        workers = asyncio.Semaphore(BATCH_MAX_WORKERS)
+
+        async def run(goal: str, indices: List[int], route: GoalRoute):
+            async with workers:
+                try:
+                    item = await batch_advice(goal, use_rag, fresh, priority, route)
+                except Exception as e:
+                    logger.error("Batch item failed", extra={"error": f"{type(e).__name__}: {e}"})
+                    item = generated_item(goal, '', '', {'success': False, 'error': str(e)}, None, [])
+            return goal, indices, item
+
+        tasks = [asyncio.ensure_future(run(goal, indices, route)) for goal, indices, route in misses]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                goal, indices, item = await next_done
+                counts[item['status']] += 1
+                yield batch_line(goal, indices, item, start_time)
+        finally:
+            # Client went away: stop the goals that are still running
+            for task in tasks:
+                task.cancel()
+        yield batch_summary(counts, start_time)
+
+    return StreamingResponse(
+        generate(),
+        media_type='application/x-ndjson',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
+async def run_advice_job(job: Job) -> Dict[str, Any]:
+    """Job worker handler: the body /api/llama-advice would have returned for the job's goal.
+
+    While the job can still wait, scheduler rejections, an open circuit and the
+    shed tier put it back in the queue instead of settling for fallback advice.
+    """
+    data = job.payload
+    goal = data['goal']
+    use_rag = wants_rag(data)
+    route = choose_route(goal, use_rag, data['fresh'])
+    if route.name == ROUTE_TEMPLATE:
+        return {'success': True, **template_response(goal, route)}
+    cache_key = advice_cache_key(goal, use_rag, route)
+    fingerprint = advice_fingerprint(use_rag, route)
+    if data['fresh']:
+        cache_hit, goal_vector = None, await embed_goal(goal)
+    else:
+        cache_hit, goal_vector = await lookup_cached_advice(goal, cache_key, fingerprint, use_rag)
+    if cache_hit is not None:
+        return {'success': True, **cache_hit}
+    tier = budget_policy.current()
+    if not tier.generate:
+        if job_can_wait(job):
+            raise JobRetry(LOAD_RECOVER_SECONDS)
+        return busy_response(goal)
+    references = await references_for(goal, goal_vector) if use_rag else []
+    prompt = build_advice_prompt(goal, references, tier, route)
+    priority = request_priority(data)
+    result, _ = await advice_flight.do(cache_key, lambda: scheduled_call(prompt, priority, tier, route))
+    if not result["success"] and result.get("retry_after") and job_can_wait(job):
+        raise JobRetry(result["retry_after"])
+    item = await off_loop(generated_item, goal, cache_key, fingerprint, result, goal_vector, references, route, 'job')
+    del item['status']
+    return item
+
+
+async def run_prefetch(item: PrefetchItem) -> str:
+    """Prefetch worker handler: generate and cache one goal's advice.
+
+    Streams the generation so it can stop between tokens once interactive work
+    needs the slot; closing the stream makes Ollama stop generating.
+    """
+    if await off_loop(advice_cache.contains, item.key):
+        return PREFETCH_SKIPPED
+    tier = budget_policy.current()
+    if tier.name != TIER_FULL:
+        return PREFETCH_DEFERRED
+    goal_vector = await embed_goal(item.goal)
+    references = await references_for(item.goal, goal_vector) if item.use_rag else []
+    prompt = build_advice_prompt(item.goal, references, tier, item.route)
+    parts = []
+    chunks = scheduled_stream(prompt, PRIORITY_PREFETCH, tier, item.route)
+    try:
+        async for chunk in chunks:
+            if not chunk["success"]:
+                return PREFETCH_DEFERRED if chunk.get("retry_after") else PREFETCH_FAILED
+            parts.append(chunk["response"])
+            if not chunk["done"] and prefetcher.preempted():
+                logger.info("Prefetch preempted", extra={"tokens": len(parts)})
+                return PREFETCH_CANCELLED
+    finally:
+        await chunks.aclose()
+    advice = "".join(parts).strip()
+    if not advice:
+        return PREFETCH_FAILED
+    await off_loop(store_advice, item.goal, item.key, advice_fingerprint(item.use_rag, item.route), advice,
+                   goal_vector, tier.name)
+    return PREFETCH_GENERATED
+
+
+async def prefetch_advice(request: Request) -> Response:
+    """Queue low-priority generations for goals the user will likely ask about (new todos)"""
+    if request.method == 'OPTIONS':
+        return JSONResponse({'status': 'ok'})
+
+    if not PREFETCH_ENABLED:
+        return JSONResponse({
+            'success': False,
+            'error': 'Prefetch is disabled.'
+        }, status_code=404)
+    try:
+        data = await request.json()
+    except ValueError:
+        data = None
+    goals = data.get('goals', [data.get('goal')] if 'goal' in data else None) if isinstance(data, dict) else None
+    if not isinstance(goals, list) or not goals:
+        return JSONResponse({
+            'success': False,
+            'error': 'Please enter a list of goals.'
+        }, status_code=400)
+    if len(goals) > PREFETCH_MAX_GOALS:
+        return JSONResponse({
+            'success': False,
+            'error': f'Too many goals (max {PREFETCH_MAX_GOALS}).'
+        }, status_code=400)
+
+    queued, _ = prefetcher.submit(await off_loop(prefetch_items, goals))
+    return JSONResponse({
+        'success': True,
+        'queued': queued,
+        'skipped': len(goals) - queued
+    }, status_code=202)
+
+
+def jobs_disabled_response() -> JSONResponse:
+    """503 for the job routes when JOBS_DB is empty"""
+    return JSONResponse({
+        'success': False,
+        'error': 'Jobs are disabled on this server.'
+    }, status_code=503)
+
+
+async def submit_job(request: Request) -> Response:
+    """Queue an advice generation; poll GET /api/jobs/{job_id} for the result"""
+    if request.method == 'OPTIONS':
+        return JSONResponse({'status': 'ok'})
+    if job_workers is None:
+        return jobs_disabled_response()
+
+    data, goal, error_response = await parse_goal(request)
+    if error_response is not None:
+        return error_response
+    try:
+        await off_loop(scheduler.check_rate, get_client_id(request))
+    except RateLimitedError as e:
+        return rate_limited_response(e)
+    queue = job_workers.queue
+    if await asyncio.to_thread(queue.pending) >= JOB_MAX_PENDING:
+        return JSONResponse({
+            'success': False,
+            'error': 'Too many pending jobs. Please try again later.'
+        }, status_code=503)
+
+    job_id = await asyncio.to_thread(queue.submit,
+                                     job_payload(data, goal, request.headers.get('Cache-Control', '')))
+    job_workers.notify()
+    logger.info("Job submitted", extra={"job_id": job_id})
+    return JSONResponse({
+        'success': True,
+        'job_id': job_id,
+        'status': JOB_QUEUED,
+        'poll': f'/api/jobs/{job_id}'
+    }, status_code=202, headers={'Location': f'/api/jobs/{job_id}'})
+
+
+async def get_job(request: Request) -> Response:
+    """Job status, with the advice once it is done; 404 after the result TTL"""
+    if job_workers is None:
+        return jobs_disabled_response()
+    job = await asyncio.to_thread(job_workers.queue.get, request.path_params['job_id'])
+    if job is None:
+        return JSONResponse({
+            'success': False,
+            'error': 'Job not found or expired.'
+        }, status_code=404)
+    headers = ({'Retry-After': str(math.ceil(JOB_POLL_INTERVAL))}
+               if job['status'] in (JOB_QUEUED, JOB_RUNNING) else None)
+    return JSONResponse({'success': True, **job}, headers=headers)
+
+
+async def check_status(request: Request) -> Response:
+    """Ollama status from the background snapshot (ETag / If-None-Match aware)"""
+    backends = ollama.stats()
+    resilience = resilience_stats()
+    body, etag, status_code = status_poller.render(
+        {'current_model': OLLAMA_MODEL, 'backends': backends, **resilience},
+        live_state=[[b['url'], b['healthy']] for b in backends['backends']] + [resilience['circuit']['state']])
+    headers = {'ETag': etag, 'Cache-Control': 'no-cache'}
+    if etag_matches(request.headers.get('If-None-Match'), etag):
+        return Response(status_code=304, headers=headers)
+    return JSONResponse(body, status_code=status_code, headers=headers)
+
+
+async def cache_stats(request: Request) -> Response:
+    """Advice cache hit/miss counters"""
+    return JSONResponse({
+        **await off_loop(core_cache_stats),
+        'coalescing': {
+            'advice': advice_flight.stats(),
+            'stream': stream_flight.stats()
+        },
+        'sessions': sessions.stats()
+    })
+
+
+async def scheduler_stats(request: Request) -> Response:
+    """Admission control queue, rejection counters, load budget tier, goal routing, jobs and prefetch"""
+    jobs = ({**await asyncio.to_thread(job_workers.queue.stats), **job_workers.stats()}
+            if job_workers is not None else None)
+    return JSONResponse({**scheduler.stats(), 'budget': budget_policy.stats(), 'routing': goal_router.stats(),
+                         'jobs': jobs,
+                         'prefetch': prefetcher.stats()})
+
+
+async def metrics(request: Request) -> Response:
+    """Prometheus text exposition of request stage timings and counters"""
+    # In a thread: gauges such as the job counts read SQLite
+    body = await asyncio.to_thread(METRICS.render)
+    return Response(body, headers={'Content-Type': METRICS_CONTENT_TYPE})
+
+
+async def debug_logging(request: Request) -> Response:
+    """Inspect or change log level, sampling and payload logging at runtime (needs LOG_ADMIN_TOKEN)"""
+    if not LOG_ADMIN_TOKEN or request.headers.get('X-Admin-Token') != LOG_ADMIN_TOKEN:
+        return JSONResponse({'success': False, 'error': 'Not found'}, status_code=404)
+    if request.method == 'GET':
+        return JSONResponse(log_settings.stats())
+    try:
+        data = await request.json()
+    except ValueError:
+        data = None
+    error = validate_log_settings(data)
+    if error is not None:
+        return JSONResponse({'success': False, 'error': error}, status_code=400)
+    logger.warning("Logging settings changed", extra={"changes": data})
+    return JSONResponse(update_log_settings(data))
+
+
+async def health(request: Request) -> Response:
+    """Server health check (503 until the model is resident)"""
+    if MODEL_WARMUP_ENABLED and not model_keeper.ready:
+        return JSONResponse({
+            'status': 'warming',
+            'message': f'Loading model {OLLAMA_MODEL}',
+            'models': model_keeper.status()
+        }, status_code=503)
+    return JSONResponse({
+        'status': 'healthy',
+        'message': 'ASGI server is running'
+    })
+
+
+async def simple_test(request: Request) -> Response:
+    """Simple test endpoint"""
+    try:
+        data = await request.json()
+        goal = data.get('goal', 'test')
+        return JSONResponse({
+            'success': True,
+            'advice': build_simple_test_advice(goal)
+        })
+    except Exception as e:
+        return JSONResponse({
+            'success': False,
+            'error': str(e)
+        }, status_code=500)
+
+
+@asynccontextmanager
+async def lifespan(app: Starlette):
+    global ollama, status_poller, job_workers
+    ollama = AsyncBackendPool(
+        [AsyncOllamaClient(url, OLLAMA_MODEL,
+                           timeouts=OLLAMA_TIMEOUTS,
+                           max_in_flight=OLLAMA_MAX_IN_FLIGHT,
+                           pool_size=OLLAMA_POOL_SIZE,
+                           keep_alive=OLLAMA_KEEP_ALIVE,
+                           on_connect=observe_connect)
+         for url in OLLAMA_BASE_URLS],
+        OLLAMA_MODEL, routing=OLLAMA_ROUTING, eject_after=BACKEND_EJECT_AFTER,
+        check_interval=BACKEND_CHECK_INTERVAL)
+    ollama.start()
+    status_poller = StatusPoller(ollama, interval=STATUS_POLL_INTERVAL, shared=shared_state)
+    status_poller.start_async()
+    if MODEL_WARMUP_ENABLED:
+        model_keeper.start()
+    if CAPTURE_ENABLED:
+        capture_writer.start()
+    job_workers = open_jobs()
+    if job_workers is not None:
+        job_workers.start_async(run_advice_job)
+    if PREFETCH_ENABLED:
+        prefetcher.start_async(run_prefetch)
+    try:
+        yield
+    finally:
+        await prefetcher.stop_async()
+        if job_workers is not None:
+            await job_workers.stop_async()
+        capture_writer.stop()
+        model_keeper.stop()
+        status_poller.stop()
+        await ollama.aclose()
+
+
+routes = [
+    Route('/api/llama-advice', get_advice, methods=['POST', 'OPTIONS']),
+    Route('/api/llama-advice/stream', stream_advice, methods=['POST', 'OPTIONS']),
+    Route('/api/llama-advice/follow-up', follow_up_advice, methods=['POST', 'OPTIONS']),
+    Route('/api/llama-advice/batch', batch_advice_route, methods=['POST', 'OPTIONS']),
+    Route('/api/llama-advice/prefetch', prefetch_advice, methods=['POST', 'OPTIONS']),
+    Route('/api/jobs', submit_job, methods=['POST', 'OPTIONS']),
+    Route('/api/jobs/{job_id}', get_job, methods=['GET']),
+    Route('/api/ollama-status', check_status, methods=['GET']),
+    Route('/api/cache-stats', cache_stats, methods=['GET']),
+    Route('/api/scheduler-stats', scheduler_stats, methods=['GET']),
+    Route('/api/metrics', metrics, methods=['GET']),
+    Route('/api/debug/logging', debug_logging, methods=['GET', 'POST']),
+    Route('/api/health', health, methods=['GET']),
+    Route('/api/simple-test', simple_test, methods=['POST']),
+]
+
+app = Starlette(
+    routes=routes,
+    middleware=[Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*'])],
+    lifespan=lifespan,
+)
+# Metrics outermost, so the total covers routing, CORS and every streamed byte
+if CAPTURE_ENABLED:
+    app.add_middleware(ASGICaptureMiddleware, routes=CAPTURED_ROUTES)
+app.add_middleware(ASGIRequestContextMiddleware, routes=[route.path for route in routes])
+app.add_middleware(ASGIMetricsMiddleware, routes=[route.path for route in routes])
+
+
+if __name__ == '__main__':
+    import uvicorn
+
+    print("🚀 Starting ASGI server")
+    print(f"📍 http://localhost:{PORT}")
+    print("🔧 Ollama URLs:", ", ".join(OLLAMA_BASE_URLS))
+    print("🤖 Model:", OLLAMA_MODEL)
+    print("👷 Workers:", WEB_CONCURRENCY)
+
+    uvicorn.run("app:app", host=HOST, port=PORT, workers=WEB_CONCURRENCY,
+                backlog=4096, timeout_keep_alive=75, log_level="warning")
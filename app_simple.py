@@ -1,89 +1,436 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context
 from flask_cors import CORS
-import requests
-from typing import Dict, Any
+from typing import Dict, Any, Iterator, List, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import contextvars
+import json
+import logging
+import math
+import os
 import time
 
+import numpy as np
+
+from advice_cache import normalize_goal
+from advice_core import (
+    BATCH_MAX_GOALS,
+    BATCH_MAX_WORKERS,
+    EMBED_TIMEOUTS,
+    JOB_MAX_PENDING,
+    JOB_POLL_INTERVAL,
+    LOAD_RECOVER_SECONDS,
+    BACKEND_CHECK_INTERVAL,
+    BACKEND_EJECT_AFTER,
+    OLLAMA_BASE_URLS,
+    OLLAMA_ROUTING,
+    OLLAMA_MAX_IN_FLIGHT,
+    OLLAMA_MODEL,
+    OLLAMA_TIMEOUTS,
+    OLLAMA_EMBED_MODEL,
+    OLLAMA_KEEP_ALIVE,
+    MODEL_WARMUP_ENABLED,
+    PREFETCH_ENABLED,
+    PREFETCH_MAX_GOALS,
+    SEMANTIC_CACHE_ENABLED,
+    STATUS_POLL_INTERVAL,
+    advice_cache_key,
+    advice_fingerprint,
+    build_advice_prompt,
+    build_fallback_advice,
+    build_follow_up_prompt,
+    busy_response,
+    build_simple_test_advice,
+    cached_tips,
+    capture_advice_request,
+    choose_route,
+    batch_line,
+    batch_summary,
+    budget_policy,
+    dedupe_goals,
+    fallback_tips,
+    generated_item,
+    goal_router,
+    cache_stats as core_cache_stats,
+    instant_cache_hit,
+    job_can_wait,
+    job_payload,
+    open_jobs,
+    advice_cache,
+    generation_timeouts,
+    hedge_delay,
+    latency_key,
+    observe_first_token,
+    observe_latency,
+    ollama_breaker,
+    open_session,
+    parse_follow_up,
+    prefetch_items,
+    prefetcher,
+    rag_model_for,
+    reference_ids,
+    request_priority,
+    requested_tips,
+    resilience_stats,
+    retrieve_references,
+    scheduler,
+    semantic_cache_hit,
+    sessions,
+    shared_state,
+    store_advice,
+    store_tips,
+    template_response,
+    tier_tip_count,
+    tips_cache_key,
+    validate_goal,
+    wants_fresh_advice,
+    wants_rag,
+)
+from backend_pool import BackendPool
+from goal_router import BIG_ROUTE, ROUTE_TEMPLATE, GoalRoute
+from job_queue import JOB_QUEUED, JOB_RUNNING, Job, JobRetry, JobWorkers
+from load_policy import TIER_FULL, BudgetTier
+from metrics import (
+    CONTENT_TYPE as METRICS_CONTENT_TYPE,
+    REGISTRY as METRICS,
+    WSGIMetricsMiddleware,
+    budget_tiers,
+    fallbacks,
+    observe_cache_lookup,
+    observe_connect,
+    observe_generation,
+    observe_stage,
+    ollama_errors,
+    route_seconds,
+    structured_tokens,
+)
+from circuit_breaker import CircuitOpenError
+from ollama_client import (
+    GenerateChunk,
+    GenerateResult,
+    OllamaClient,
+    OllamaError,
+    OllamaConnectionError,
+    OllamaHTTPError,
+    OllamaTimeoutError,
+    OllamaTimeouts,
+)
+from model_keeper import ModelKeeperGroup
+from prefetch import (
+    PREFETCH_CANCELLED,
+    PREFETCH_DEFERRED,
+    PREFETCH_FAILED,
+    PREFETCH_GENERATED,
+    PREFETCH_SKIPPED,
+    PrefetchItem,
+)
+from scheduler import PRIORITY_INTERACTIVE, PRIORITY_PREFETCH, RateLimitedError, SchedulerRejected
+from semantic_cache import SemanticCache
+from singleflight import SingleFlight, StreamFlight
+from status_poller import StatusPoller, etag_matches
+from structured_advice import FALLBACK_TIPS, TipStreamParser, build_tips_prompt, tips_from_text, tips_schema
+from structured_log import (
+    LOG_ADMIN_TOKEN,
+    WSGIRequestContextMiddleware,
+    log_payload,
+    settings as log_settings,
+    update_settings as update_log_settings,
+    validate_settings as validate_log_settings,
+)
+from traffic_capture import (
+    CAPTURE_ENABLED,
+    CAPTURED_ROUTES,
+    WSGICaptureMiddleware,
+    note as note_capture,
+    writer as capture_writer,
+)
+
+logger = logging.getLogger("app")
+
 app = Flask(__name__)
 CORS(app)
 
-# Ollama API Configuration
-OLLAMA_BASE_URL = "http://localhost:11434"
-OLLAMA_MODEL = "llama3:latest"
+# One keep-alive connection pool per Ollama node, shared by all routes
+ollama = BackendPool(
+    [OllamaClient(url, OLLAMA_MODEL,
+                  timeouts=OLLAMA_TIMEOUTS,
+                  max_in_flight=OLLAMA_MAX_IN_FLIGHT,
+                  keep_alive=OLLAMA_KEEP_ALIVE,
+                  on_connect=observe_connect)
+     for url in OLLAMA_BASE_URLS],
+    OLLAMA_MODEL, routing=OLLAMA_ROUTING, eject_after=BACKEND_EJECT_AFTER,
+    check_interval=BACKEND_CHECK_INTERVAL)
+METRICS.gauge('ollama_backend_healthy', 'Whether each Ollama node is in rotation',
+              lambda: [((b['url'],), int(b['healthy'])) for b in ollama.stats()['backends']],
+              ('backend',))
+
+# Keeps the model resident on every node so requests never pay the load time
+model_keeper = ModelKeeperGroup([backend.client for backend in ollama.backends],
+                                OLLAMA_MODEL, keep_alive=OLLAMA_KEEP_ALIVE)
+
+# /api/ollama-status serves this snapshot instead of calling Ollama per request
+status_poller = StatusPoller(ollama, interval=STATUS_POLL_INTERVAL, shared=shared_state)
+
+# Drain /api/jobs; pending jobs from before a restart are picked up again.
+# Opened with the first request; stays None when jobs are disabled
+job_workers: Optional[JobWorkers] = None
+
+def start_job_workers():
+    global job_workers
+    job_workers = open_jobs()
+    if job_workers is not None:
+        job_workers.start(run_advice_job)
+
+@app.before_request
+def start_background_tasks():
+    """Health checks, status polling and warm-up start with the first request"""
+    ollama.start()
+    status_poller.start()
+    if MODEL_WARMUP_ENABLED:
+        model_keeper.start()
+    if CAPTURE_ENABLED:
+        capture_writer.start()
+    start_job_workers()
+    if PREFETCH_ENABLED:
+        prefetcher.start(run_prefetch)
+
+# Identical concurrent goals share one upstream generation
+advice_flight = SingleFlight()
+stream_flight = StreamFlight()
+
+def embed_text(text: str, model: str) -> Optional[np.ndarray]:
+    """Unit-normalized embedding, or None when embeddings are unavailable"""
+    try:
+        result = ollama.embeddings(text, model=model, timeouts=EMBED_TIMEOUTS)
+        return SemanticCache.normalize(result.embedding)
+    except OllamaError as e:
+        logger.warning("Embedding failed", extra={"error": str(e)})
+        return None
+
+def embed_goal(goal: str) -> Optional[np.ndarray]:
+    """Embed a goal for the semantic cache"""
+    if not SEMANTIC_CACHE_ENABLED:
+        return None
+    return embed_text(normalize_goal(goal), OLLAMA_EMBED_MODEL)
 
-def call_ollama_api(prompt: str) -> Dict[str, Any]:
+def lookup_cached_advice(goal: str, cache_key: str, fingerprint: str, use_rag: bool = False) -> Tuple[Optional[Dict[str, Any]], Optional[np.ndarray]]:
+    """Exact cache, precomputed answers, then semantic cache; returns (response fields, goal vector)"""
+    cache_hit = instant_cache_hit(goal, cache_key, use_rag)
+    if cache_hit is None:
+        goal_vector = embed_goal(goal)
+        cache_hit = semantic_cache_hit(cache_key, fingerprint, goal_vector)
+    else:
+        goal_vector = None
+    observe_cache_lookup(cache_hit)
+    return cache_hit, goal_vector
+
+def references_for(goal: str, goal_vector: Optional[np.ndarray]) -> List[Dict[str, Any]]:
+    """Top-k corpus chunks, reusing the semantic-cache embedding when compatible"""
+    model = rag_model_for(goal_vector)
+    if model is not None:
+        goal_vector = embed_text(normalize_goal(goal), model)
+    return retrieve_references(goal_vector) if goal_vector is not None else []
+
+def guarded_generate(prompt: str, timeouts: OllamaTimeouts, options: Dict[str, Any], key: str,
+                     route: GoalRoute = BIG_ROUTE,
+                     session_kwargs: Optional[Dict[str, Any]] = None) -> GenerateResult:
+    """ollama.generate behind the circuit breaker, hedged to a second node when enabled.
+
+    `session_kwargs` (context, prefer) continue a follow-up session on the node
+    holding its context; those calls are never hedged. `key` (latency_key)
+    picks the latency trackers the call feeds.
+    """
+    ollama_breaker.allow()
+    start_time = time.monotonic()
+    try:
+        hedge_after = None if session_kwargs else hedge_delay(key)
+        if hedge_after is not None:
+            result = ollama.generate_hedged(prompt, hedge_after, options=options, model=route.model,
+                                            timeouts=timeouts)
+        else:
+            result = ollama.generate(prompt, options=options, model=route.model, timeouts=timeouts,
+                                     **(session_kwargs or {}))
+    except BaseException as e:
+        ollama_breaker.record(e)
+        if isinstance(e, OllamaTimeoutError):
+            observe_latency(key, time.monotonic() - start_time)
+        if isinstance(e, Exception):
+            ollama_errors.inc(type=type(e).__name__)
+        raise
+    ollama_breaker.record()
+    observe_latency(key, time.monotonic() - start_time)
+    observe_stage('generate', start_time)
+    route_seconds.observe(time.monotonic() - start_time, route=route.name)
+    observe_generation(result, 'reused' if session_kwargs else 'none')
+    return result
+
+def guarded_stream(prompt: str, timeouts: OllamaTimeouts, options: Dict[str, Any], key: str,
+                   route: GoalRoute = BIG_ROUTE, **extra: Any) -> Iterator[GenerateChunk]:
+    """ollama.generate_stream behind the circuit breaker, feeding the latency trackers.
+
+    `extra` goes into the /api/generate payload (e.g. a `format` schema).
+    """
+    ollama_breaker.allow()
+    start_time = time.monotonic()
+    first_chunk = True
+    recorded = False
+    try:
+        for chunk in ollama.generate_stream(prompt, options=options, model=route.model, timeouts=timeouts,
+                                            **extra):
+            if first_chunk:
+                observe_first_token(key, time.monotonic() - start_time)
+                observe_stage('ttft', start_time)
+                first_chunk = False
+            if chunk.done:
+                ollama_breaker.record()
+                observe_latency(key, time.monotonic() - start_time)
+                observe_stage('generate', start_time)
+                route_seconds.observe(time.monotonic() - start_time, route=route.name)
+                observe_generation(chunk.result)
+                recorded = True
+            yield chunk
+    except BaseException as e:
+        if not recorded and isinstance(e, GeneratorExit) and not first_chunk:
+            # Closed by the consumer after Ollama had answered (client gone, structured tips complete)
+            ollama_breaker.record()
+        elif not recorded:
+            ollama_breaker.record(e)
+            if isinstance(e, OllamaTimeoutError):
+                if first_chunk:
+                    observe_first_token(key, time.monotonic() - start_time)
+                observe_latency(key, time.monotonic() - start_time)
+            if isinstance(e, Exception):
+                ollama_errors.inc(type=type(e).__name__)
+        raise
+
+def call_ollama_api(prompt: str, tier: BudgetTier, route: GoalRoute = BIG_ROUTE,
+                    session_kwargs: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
     """Call Ollama API"""
+    key = latency_key(route, tier)
+    timeouts = generation_timeouts(key)
+    options = route.options(tier.options)
     try:
-        url = f"{OLLAMA_BASE_URL}/api/generate"
-        data = {
-            "model": OLLAMA_MODEL,
-            "prompt": prompt,
-            "stream": False,
-            "options": {
-                "temperature": 0.7,
-                "num_predict": 200,
-                "num_ctx": 1024
-            }
-        }
+        log_payload(logger, "Ollama request", prompt=prompt, options=options)
+        budget_tiers.inc(tier=tier.name)
         
-        print(f"🔄 Starting Ollama API call")
-        print(f"📍 URL: {url}")
-        print(f"🤖 Model: {OLLAMA_MODEL}")
-        print(f"📝 Prompt: {prompt[:100]}...")
-        print(f"📦 Request data: {data}")
-        
-        response = requests.post(url, json=data, timeout=80)  # Increased timeout to 80s
+        result = guarded_generate(prompt, timeouts, options, key, route, session_kwargs)
+        if route.model is None:
+            # Only the main model is kept resident; other models' load times are expected
+            model_keeper.observe(result)
+        logger.info("Generation finished", extra={
+            "backend": result.backend,
+            "eval_count": result.eval_count,
+            "tier": tier.name,
+            "route": route.name,
+            "prompt_eval_count": result.prompt_eval_count,
+            "context_reused": bool(session_kwargs),
+            "total_ms": round(result.total_duration / 1e6, 1),
+            "load_ms": round(result.load_duration / 1e6, 1),
+            "response_chars": len(result.response),
+            "first_byte_timeout": round(timeouts.first_byte), "total_timeout": round(timeouts.total)
+        })
         
-        print(f"📊 Response status code: {response.status_code}")
-        print(f"📄 Response headers: {dict(response.headers)}")
+        ollama_response = result.response
+        log_payload(logger, "Ollama response", response=ollama_response)
         
-        if response.status_code == 200:
-            result = response.json()
-            print(f"📥 Response JSON: {result}")
-            
-            ollama_response = result.get("response", "")
-            print(f"📏 Response length: {len(ollama_response)} characters")
-            print(f"📖 Response content: '{ollama_response}'")
-            
-            if ollama_response.strip():
-                return {
-                    "success": True,
-                    "response": ollama_response
-                }
-            else:
-                print("❌ Empty response received")
-                return {
-                    "success": False,
-                    "error": "Received empty response from Ollama"
-                }
+        if ollama_response.strip():
+            return {
+                "success": True,
+                "response": ollama_response,
+                "tier": tier.name,
+                "generation": result
+            }
         else:
-            error_text = response.text
-            print(f"❌ HTTP error: {response.status_code}")
-            print(f"📄 Error content: {error_text}")
+            logger.warning("Empty response received", extra={"backend": result.backend})
             return {
                 "success": False,
-                "error": f"HTTP {response.status_code}: {error_text}"
+                "error": "Received empty response from Ollama"
             }
             
-    except requests.exceptions.Timeout:
-        print("⏰ Request timeout (80s)")
+    except CircuitOpenError as e:
+        logger.warning("Circuit open", extra={"retry_after": round(e.retry_after, 1)})
+        return {
+            "success": False,
+            "error": str(e),
+            "retry_after": math.ceil(e.retry_after)
+        }
+    except OllamaHTTPError as e:
+        logger.error("Ollama HTTP error", extra={"status_code": e.status_code, "body": e.body})
+        return {
+            "success": False,
+            "error": str(e)
+        }
+    except OllamaTimeoutError as e:
+        logger.error("Ollama timeout", extra={"error": str(e)})
         return {
             "success": False,
-            "error": "Ollama API call timeout (80s)"
+            "error": f"Ollama API call timeout ({timeouts.total:.0f}s)"
         }
-    except requests.exceptions.ConnectionError:
-        print("❌ Connection error - Cannot connect to Ollama server")
+    except OllamaConnectionError as e:
+        logger.error("Cannot connect to Ollama", extra={"error": str(e)})
         return {
             "success": False,
             "error": "Failed to connect to Ollama server"
         }
     except Exception as e:
-        print(f"💥 Exception occurred: {type(e).__name__}: {str(e)}")
+        logger.exception("Ollama call failed")
         return {
             "success": False,
             "error": f"Exception occurred: {str(e)}"
         }
 
+def stream_ollama_api(prompt: str, tier: BudgetTier, route: GoalRoute = BIG_ROUTE,
+                      **extra: Any) -> Iterator[Dict[str, Any]]:
+    """Call Ollama API in streaming mode, yielding chunks as they arrive"""
+    key = latency_key(route, tier)
+    timeouts = generation_timeouts(key)
+    options = route.options(tier.options)
+    try:
+        log_payload(logger, "Ollama stream request", prompt=prompt, options=options)
+        budget_tiers.inc(tier=tier.name)
+
+        for chunk in guarded_stream(prompt, timeouts, options, key, route, **extra):
+            if chunk.result is not None and route.model is None:
+                model_keeper.observe(chunk.result)
+            yield {
+                "success": True,
+                "response": chunk.response,
+                "done": chunk.done,
+                "tier": tier.name,
+                "generation": chunk.result
+            }
+
+    except CircuitOpenError as e:
+        logger.warning("Circuit open", extra={"retry_after": round(e.retry_after, 1)})
+        yield {
+            "success": False,
+            "error": str(e),
+            "retry_after": math.ceil(e.retry_after)
+        }
+    except OllamaTimeoutError as e:
+        logger.error("Ollama stream timeout", extra={"error": str(e)})
+        yield {
+            "success": False,
+            "error": f"Ollama API call timeout ({timeouts.total:.0f}s)"
+        }
+    except OllamaConnectionError as e:
+        logger.error("Cannot connect to Ollama", extra={"error": str(e)})
+        yield {
+            "success": False,
+            "error": "Failed to connect to Ollama server"
+        }
+    except OllamaError as e:
+        logger.error("Ollama stream failed", extra={"error": str(e)})
+        yield {
+            "success": False,
+            "error": str(e)
+        }
+    except Exception as e:
+        logger.exception("Ollama stream failed")
+        yield {
+            "success": False,
+            "error": f"Exception occurred: {str(e)}"
+        }
+
 @app.route('/api/llama-advice', methods=['POST', 'OPTIONS'])
 def get_advice():
     """Advice API"""
@@ -92,93 +439,719 @@ def get_advice():
         return response
     
     try:
-        data = request.get_json()
-        print(f"📨 Request data: {data}")
-        
-        if not data or 'goal' not in data:
-            return jsonify({
-                'success': False,
-                'error': 'Please enter a goal.'
-            }), 400
-        
-        goal = data['goal'].strip()
-        if not goal:
-            return jsonify({
-                'success': False,
-                'error': 'Goal is empty.'
-            }), 400
-        
-        # Use English prompt
-        prompt = f"""Goal: {goal}
-
-Please provide practical advice to achieve this goal. Give 3-4 specific tips. Use emojis.
+        data, goal, error_response = parse_goal()
+        if error_response is not None:
+            return error_response
 
-Advice:"""
+        tip_count = requested_tips(data)
+        if tip_count is not None:
+            return structured_advice(data, goal, tip_count)
+        use_rag = wants_rag(data)
+        fresh = wants_fresh_advice(data, request.headers.get('Cache-Control', ''))
+        route = choose_route(goal, use_rag, fresh)
+        if route.name == ROUTE_TEMPLATE:
+            capture_advice_request(data, goal, None, fresh, route)
+            response = template_response(goal, route)
+            return jsonify({'success': True, **response, **open_session(data, goal, response['advice'], route)})
+        cache_key = advice_cache_key(goal, use_rag, route)
+        fingerprint = advice_fingerprint(use_rag, route)
+        if fresh:
+            cache_hit, goal_vector = None, embed_goal(goal)
+        else:
+            cache_hit, goal_vector = lookup_cached_advice(goal, cache_key, fingerprint, use_rag)
+        capture_advice_request(data, goal, cache_hit, fresh, route)
+        if cache_hit is not None:
+            logger.info("Cache hit", extra={"cache": cache_hit['cache']})
+            return jsonify({'success': True, **cache_hit, **open_session(data, goal, cache_hit['advice'], route)})
+        tier = budget_policy.current()
+        if not tier.generate:
+            return jsonify(busy_response(goal))
+        
+        try:
+            scheduler.check_rate(get_client_id())
+        except RateLimitedError as e:
+            return rate_limited_response(e)
+        priority = request_priority(data)
         
-        print(f"🎯 Goal to process: '{goal}'")
-        print(f"📝 Generated prompt:\n{prompt}")
+        # Use English prompt, with retrieved reference notes when enabled
+        references = references_for(goal, goal_vector) if use_rag else []
+        prompt = build_advice_prompt(goal, references, tier, route)
         
         # Call Ollama API
-        print("🔄 Starting Ollama API call...")
-        result = call_ollama_api(prompt)
-        print(f"📥 Ollama API result: {result}")
+        result, shared = advice_flight.do(cache_key, lambda: scheduled_call(prompt, priority, tier, route))
+        if shared:
+            logger.info("Joined in-flight generation")
         
         if result["success"]:
             advice = result["response"].strip()
-            print(f"✅ Advice generation successful!")
-            print(f"📋 Generated advice: '{advice}'")
+            log_payload(logger, "Advice generated", advice=advice)
+            store_advice(goal, cache_key, fingerprint, advice, goal_vector, result["tier"])
             
-            return jsonify({
+            response = {
                 'success': True,
-                'advice': advice
-            })
+                'advice': advice,
+                'cached': False,
+                'tier': result["tier"],
+                **route.fields(),
+                **open_session(data, goal, advice, route, result["generation"])
+            }
+            if references:
+                response['references'] = reference_ids(references)
+            return jsonify(response)
         else:
             error_msg = result["error"]
-            print(f"❌ Ollama API failed: {error_msg}")
-            print("🔄 Using fallback advice")
+            logger.warning("Using fallback advice", extra={"error": error_msg})
+            fallbacks.inc(route='advice')
+            note_capture(fallback=True)
             
             # Fallback advice
-            fallback = f"🎯 Advice for achieving '{goal}' goal:\n\n📋 Create a specific plan\n⏰ Execute a little each day\n📊 Record your progress\n🎉 Celebrate small achievements\n\n⚠️ AI advice generation failed: {error_msg}"
+            fallback = build_fallback_advice(goal, error_msg)
             
-            return jsonify({
+            response = jsonify({
                 'success': True,
-                'advice': fallback
+                'advice': fallback,
+                'fallback': True
             })
+            if result.get("retry_after"):
+                response.headers['Retry-After'] = str(result["retry_after"])
+            return response
             
     except Exception as e:
-        print(f"💥 Server error: {str(e)}")
+        logger.exception("Advice request failed")
         return jsonify({
             'success': False,
             'error': f'Server error: {str(e)}'
         }), 500
 
-@app.route('/api/ollama-status', methods=['GET'])
-def check_status():
-    """Check Ollama status"""
+def get_client_id() -> str:
+    """Client identity for fair-share rate limiting"""
+    return request.headers.get('X-Client-ID') or request.remote_addr or 'anonymous'
+
+def rate_limited_response(error: RateLimitedError):
+    """429 with Retry-After for clients over their fair share"""
+    retry_after = math.ceil(error.retry_after)
+    response = jsonify({
+        'success': False,
+        'error': 'Too many requests. Please try again later.',
+        'retry_after': retry_after
+    })
+    response.headers['Retry-After'] = str(retry_after)
+    return response, 429
+
+def parse_goal() -> Tuple[Optional[Dict[str, Any]], Optional[str], Optional[Tuple[Response, int]]]:
+    """Returns (data, goal, error response) for advice requests"""
+    parse_started = time.monotonic()
+    data = request.get_json(silent=True)
+    log_payload(logger, "Advice request", data=data)
+    goal, error = validate_goal(data)
+    if error is not None:
+        return None, None, (jsonify({
+            'success': False,
+            'error': error
+        }), 400)
+    observe_stage('parse', parse_started)
+    return data, goal, None
+
+def scheduled_call(prompt: str, priority: int, tier: BudgetTier, route: GoalRoute = BIG_ROUTE,
+                   session_kwargs: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """call_ollama_api once admitted by the scheduler"""
+    queued_at = time.monotonic()
     try:
-        response = requests.get(f"{OLLAMA_BASE_URL}/api/tags", timeout=5)
-        if response.status_code == 200:
-            data = response.json()
-            models = [m["name"] for m in data.get("models", [])]
-            return jsonify({
-                'status': 'connected',
-                'models': models,
-                'current_model': OLLAMA_MODEL
-            })
+        with scheduler.slot(priority):
+            observe_stage('queue_wait', queued_at)
+            return call_ollama_api(prompt, tier, route, session_kwargs)
+    except SchedulerRejected as e:
+        logger.warning("Not admitted", extra={"reason": type(e).__name__, "retry_after": round(e.retry_after, 1)})
+        return {
+            "success": False,
+            "error": str(e),
+            "retry_after": math.ceil(e.retry_after)
+        }
+
+def scheduled_stream(prompt: str, priority: int, tier: BudgetTier,
+                     route: GoalRoute = BIG_ROUTE, **extra: Any) -> Iterator[Dict[str, Any]]:
+    """stream_ollama_api once admitted by the scheduler"""
+    queued_at = time.monotonic()
+    try:
+        scheduler.acquire(priority)
+    except SchedulerRejected as e:
+        logger.warning("Not admitted", extra={"reason": type(e).__name__, "retry_after": round(e.retry_after, 1)})
+        yield {
+            "success": False,
+            "error": str(e),
+            "retry_after": math.ceil(e.retry_after)
+        }
+        return
+    observe_stage('queue_wait', queued_at)
+    start_time = time.monotonic()
+    try:
+        yield from stream_ollama_api(prompt, tier, route, **extra)
+    finally:
+        scheduler.release(time.monotonic() - start_time)
+
+def scheduled_tips(prompt: str, priority: int, tier: BudgetTier, count: int,
+                   route: GoalRoute = BIG_ROUTE) -> Dict[str, Any]:
+    """Schema-constrained tips, closing the stream as soon as `count` of them are complete"""
+    parser = TipStreamParser(count)
+    tokens, done = 0, False
+    chunks = scheduled_stream(prompt, priority, tier, route, format=tips_schema(count))
+    try:
+        for chunk in chunks:
+            if not chunk["success"]:
+                return chunk
+            done = chunk["done"]
+            if chunk["response"]:
+                tokens += 1
+                parser.feed(chunk["response"])
+            if parser.complete:
+                break
+    finally:
+        chunks.close()
+    structured_tokens.observe(tokens, end='done' if done else 'early')
+    log_payload(logger, "Ollama tips", tips=parser.tips)
+    if not parser.tips:
+        return {"success": False, "error": "Received no tips from Ollama"}
+    return {"success": True, "tips": parser.tips, "tier": tier.name}
+
+def structured_advice(data: Dict[str, Any], goal: str, count: int):
+    """Advice API in structured mode: a list of tips instead of one advice text"""
+    fresh = wants_fresh_advice(data, request.headers.get('Cache-Control', ''))
+    route = choose_route(goal, False, fresh)
+    if route.name == ROUTE_TEMPLATE:
+        capture_advice_request(data, goal, None, fresh, route)
+        return jsonify({'success': True, 'tips': tips_from_text(route.template_advice(goal), count),
+                        'cached': False, **route.fields()})
+    cache_key = tips_cache_key(goal, count, route)
+    cache_hit = None if fresh else cached_tips(cache_key)
+    capture_advice_request(data, goal, cache_hit, fresh, route)
+    if cache_hit is not None:
+        return jsonify({'success': True, **cache_hit})
+    tier = budget_policy.current()
+    if not tier.generate:
+        return jsonify(fallback_tips(busy_response(goal), count))
+
+    try:
+        scheduler.check_rate(get_client_id())
+    except RateLimitedError as e:
+        return rate_limited_response(e)
+    tier_count = tier_tip_count(count, tier)
+    prompt = build_tips_prompt(goal, tier_count)
+    result, shared = advice_flight.do(
+        cache_key, lambda: scheduled_tips(prompt, request_priority(data), tier, tier_count, route))
+    if shared:
+        logger.info("Joined in-flight generation")
+
+    if result["success"]:
+        store_tips(cache_key, result["tips"], count, result["tier"])
+        return jsonify({'success': True, 'tips': result["tips"], 'cached': False,
+                        'tier': result["tier"], **route.fields()})
+    logger.warning("Using fallback tips", extra={"error": result["error"]})
+    fallbacks.inc(route='advice')
+    note_capture(fallback=True)
+    response = jsonify({'success': True, 'tips': FALLBACK_TIPS[:count], 'fallback': True,
+                        'error': result["error"]})
+    if result.get("retry_after"):
+        response.headers['Retry-After'] = str(result["retry_after"])
+    return response
+
+def format_stream_event(event: str, payload: Dict[str, Any], ndjson: bool) -> str:
+    """Serialize a stream event as SSE or NDJSON"""
+    if ndjson:
+        return json.dumps({"event": event, **payload}, ensure_ascii=False) + "\n"
+    return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+@app.route('/api/llama-advice/stream', methods=['POST', 'OPTIONS'])
+def stream_advice():
+    """Streaming advice API (Server-Sent Events, or NDJSON with ?format=ndjson)"""
+    if request.method == 'OPTIONS':
+        response = jsonify({'status': 'ok'})
+        return response
+
+    data, goal, error_response = parse_goal()
+    if error_response is not None:
+        return error_response
+
+    ndjson = (request.args.get('format') == 'ndjson'
+              or 'application/x-ndjson' in request.headers.get('Accept', ''))
+    use_rag = wants_rag(data)
+    fresh = wants_fresh_advice(data, request.headers.get('Cache-Control', ''))
+    route = choose_route(goal, use_rag, fresh)
+    cache_key = advice_cache_key(goal, use_rag, route)
+    fingerprint = advice_fingerprint(use_rag, route)
+    if route.name == ROUTE_TEMPLATE:
+        # Answered at once from the category template, like a cache hit
+        cache_hit, goal_vector = template_response(goal, route), None
+    elif fresh:
+        cache_hit, goal_vector = None, embed_goal(goal)
+    else:
+        cache_hit, goal_vector = lookup_cached_advice(goal, cache_key, fingerprint, use_rag)
+    capture_advice_request(data, goal, cache_hit, fresh, route)
+    tier = budget_policy.current()
+    if cache_hit is None and not tier.generate:
+        # Extreme load: answer at once, like a cache hit, with templated advice
+        cache_hit = busy_response(goal)
+    if cache_hit is None:
+        try:
+            scheduler.check_rate(get_client_id())
+        except RateLimitedError as e:
+            return rate_limited_response(e)
+    priority = request_priority(data)
+    references = references_for(goal, goal_vector) if use_rag and cache_hit is None else []
+    prompt = build_advice_prompt(goal, references, tier, route)
+
+    def generate():
+        start_time = time.time()
+        if cache_hit is not None:
+            session = {} if cache_hit.get('fallback') else open_session(data, goal, cache_hit['advice'], route)
+            yield format_stream_event('done', {
+                'success': True,
+                **cache_hit,
+                **session,
+                'ttft_ms': 0.0,
+                'total_ms': round((time.time() - start_time) * 1000, 1)
+            }, ndjson)
+            return
+
+        first_token_time = None
+        parts = []
+        error_msg = None
+        retry_after = None
+        generated_tier = tier.name
+        generation = None
+
+        chunks, shared = stream_flight.subscribe(cache_key, lambda: scheduled_stream(prompt, priority, tier, route))
+        if shared:
+            logger.info("Joined in-flight stream")
+        for chunk in chunks:
+            if not chunk["success"]:
+                error_msg = chunk["error"]
+                retry_after = chunk.get("retry_after")
+                break
+            generated_tier = chunk.get("tier", generated_tier)
+            generation = chunk.get("generation") or generation
+            text = chunk["response"]
+            if text:
+                if first_token_time is None:
+                    first_token_time = time.time()
+                    ttft_ms = round((first_token_time - start_time) * 1000, 1)
+                    yield format_stream_event('meta', {'ttft_ms': ttft_ms}, ndjson)
+                parts.append(text)
+                yield format_stream_event('token', {'text': text}, ndjson)
+
+        advice = "".join(parts).strip()
+        if error_msg is None and not advice:
+            error_msg = "Received empty response from Ollama"
+
+        done = {
+            'success': True,
+            'ttft_ms': round((first_token_time - start_time) * 1000, 1) if first_token_time else None,
+            'total_ms': round((time.time() - start_time) * 1000, 1)
+        }
+        logger.info("Stream finished", extra={"ttft_ms": done['ttft_ms'], "total_ms": done['total_ms'],
+                                              "shared": shared})
+        if error_msg is None:
+            done['advice'] = advice
+            done['cached'] = False
+            done['tier'] = generated_tier
+            done.update(route.fields())
+            done.update(open_session(data, goal, advice, route, generation))
+            store_advice(goal, cache_key, fingerprint, advice, goal_vector, generated_tier)
         else:
-            return jsonify({
-                'status': 'error',
-                'message': f'Server error: {response.status_code}'
-            }), 500
-    except Exception as e:
+            logger.warning("Using fallback advice", extra={"error": error_msg})
+            fallbacks.inc(route='stream')
+            note_capture(fallback=True)
+            done['advice'] = build_fallback_advice(goal, error_msg)
+            done['fallback'] = True
+            if retry_after:
+                done['retry_after'] = retry_after
+        yield format_stream_event('done', done, ndjson)
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='application/x-ndjson' if ndjson else 'text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@app.route('/api/llama-advice/follow-up', methods=['POST', 'OPTIONS'])
+def follow_up_advice():
+    """Follow-up on an earlier answer ("more tips", "make it easier"), continuing its Ollama context"""
+    if request.method == 'OPTIONS':
+        response = jsonify({'status': 'ok'})
+        return response
+
+    parse_started = time.monotonic()
+    session, message, error = parse_follow_up(request.get_json(silent=True))
+    if error is not None:
+        return jsonify({
+            'success': False,
+            'error': error[0]
+        }), error[1]
+    observe_stage('parse', parse_started)
+
+    tier = budget_policy.current()
+    if not tier.generate:
+        return jsonify({**busy_response(session.goal), 'session_id': session.id})
+    try:
+        scheduler.check_rate(get_client_id())
+    except RateLimitedError as e:
+        return rate_limited_response(e)
+
+    prompt, session_kwargs = build_follow_up_prompt(session, message, tier)
+    result = scheduled_call(prompt, PRIORITY_INTERACTIVE, tier, session.route, session_kwargs)
+    if not result["success"]:
+        logger.warning("Using fallback advice", extra={"error": result["error"]})
+        fallbacks.inc(route='follow_up')
+        response = jsonify({
+            'success': True,
+            'advice': build_fallback_advice(session.goal, result["error"]),
+            'fallback': True,
+            'session_id': session.id
+        })
+        if result.get("retry_after"):
+            response.headers['Retry-After'] = str(result["retry_after"])
+        return response
+
+    advice = result["response"].strip()
+    sessions.record(session, advice, result["generation"], bool(session_kwargs))
+    return jsonify({
+        'success': True,
+        'advice': advice,
+        'cached': False,
+        'tier': result["tier"],
+        'session_id': session.id,
+        'turn': session.turns,
+        'context_reused': bool(session_kwargs)
+    })
+
+def batch_advice(goal: str, use_rag: bool, fresh: bool, priority: int,
+                 route: GoalRoute = BIG_ROUTE) -> Dict[str, Any]:
+    """Advice fields for one batch goal: semantic cache, then a scheduled generation"""
+    cache_key = advice_cache_key(goal, use_rag, route)
+    fingerprint = advice_fingerprint(use_rag, route)
+    goal_vector = embed_goal(goal)
+    if not fresh:
+        cache_hit = semantic_cache_hit(cache_key, fingerprint, goal_vector)
+        observe_cache_lookup(cache_hit)
+        if cache_hit is not None:
+            return {'status': 'cached', 'success': True, **cache_hit}
+    tier = budget_policy.current()
+    if not tier.generate:
+        return {'status': 'fallback', **busy_response(goal)}
+    references = references_for(goal, goal_vector) if use_rag else []
+    prompt = build_advice_prompt(goal, references, tier, route)
+    result, _ = advice_flight.do(cache_key, lambda: scheduled_call(prompt, priority, tier, route))
+    return generated_item(goal, cache_key, fingerprint, result, goal_vector, references, route)
+
+@app.route('/api/llama-advice/batch', methods=['POST', 'OPTIONS'])
+def batch_advice_route():
+    """Batch advice API: one NDJSON line per unique goal, in completion order"""
+    if request.method == 'OPTIONS':
+        response = jsonify({'status': 'ok'})
+        return response
+
+    parse_started = time.monotonic()
+    data = request.get_json(silent=True)
+    goals = data.get('goals') if isinstance(data, dict) else None
+    if not isinstance(goals, list) or not goals:
+        return jsonify({
+            'success': False,
+            'error': 'Please enter a list of goals.'
+        }), 400
+    if len(goals) > BATCH_MAX_GOALS:
+        return jsonify({
+            'success': False,
+            'error': f'Too many goals (max {BATCH_MAX_GOALS}).'
+        }), 400
+
+    unique_goals, invalid = dedupe_goals(goals)
+    use_rag = wants_rag(data)
+    fresh = wants_fresh_advice(data, request.headers.get('Cache-Control', ''))
+    priority = request_priority({'priority': 'batch', **data})
+    observe_stage('parse', parse_started)
+
+    # Templates and exact/precomputed hits go out first; everything else needs embeddings or Ollama
+    hits, misses = [], []
+    for goal, indices in unique_goals:
+        route = choose_route(goal, use_rag, fresh)
+        if route.name == ROUTE_TEMPLATE:
+            hits.append((goal, indices, {'status': 'template', 'success': True, **template_response(goal, route)}))
+            continue
+        cache_hit = None if fresh else instant_cache_hit(goal, advice_cache_key(goal, use_rag, route), use_rag)
+        if cache_hit is not None:
+            observe_cache_lookup(cache_hit)
+            hits.append((goal, indices, {'status': 'cached', 'success': True, **cache_hit}))
+        else:
+            misses.append((goal, indices, route))
+    if misses:
+        try:
+            scheduler.check_rate(get_client_id())
+        except RateLimitedError as e:
+            return rate_limited_response(e)
+    logger.info("Batch received", extra={"goals": len(goals), "cached": len(hits), "to_generate": len(misses)})
+
+    def generate():
+        start_time = time.time()
+        counts = {'total': len(unique_goals), 'cached': 0, 'template': 0, 'generated': 0, 'fallback': 0,
+                  'invalid': len(invalid)}
+        for index in invalid:
+            yield batch_line(None, [index], {
+                'status': 'invalid',
+                'success': False,
+                'error': 'Goal is empty.'
+            }, start_time)
+        for goal, indices, item in hits:
+            counts[item['status']] += 1
+            yield batch_line(goal, indices, item, start_time)
+        if misses:
+            executor = ThreadPoolExecutor(max_workers=min(len(misses), BATCH_MAX_WORKERS),
+                                          thread_name_prefix="batch")
+            try:
+                # Each worker runs in a copy of this request's context so its logs keep the request ID
+                futures = {executor.submit(contextvars.copy_context().run, batch_advice,
+                                           goal, use_rag, fresh, priority, route): (goal, indices)
+                           for goal, indices, route in misses}
+                for future in as_completed(futures):
+                    goal, indices = futures[future]
+                    try:
+                        item = future.result()
+                    except Exception as e:
+                        logger.error("Batch item failed", extra={"error": f"{type(e).__name__}: {e}"})
+                        item = generated_item(goal, '', '', {'success': False, 'error': str(e)}, None, [])
+                    counts[item['status']] += 1
+                    yield batch_line(goal, indices, item, start_time)
+            finally:
+                # Client went away: drop goals that have not started yet
+                executor.shutdown(wait=False, cancel_futures=True)
+        yield batch_summary(counts, start_time)
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='application/x-ndjson',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+def run_advice_job(job: Job) -> Dict[str, Any]:
+    """Job worker handler: the body /api/llama-advice would have returned for the job's goal.
+
+    While the job can still wait, scheduler rejections, an open circuit and the
+    shed tier put it back in the queue instead of settling for fallback advice.
+    """
+    data = job.payload
+    goal = data['goal']
+    use_rag = wants_rag(data)
+    route = choose_route(goal, use_rag, data['fresh'])
+    if route.name == ROUTE_TEMPLATE:
+        return {'success': True, **template_response(goal, route)}
+    cache_key = advice_cache_key(goal, use_rag, route)
+    fingerprint = advice_fingerprint(use_rag, route)
+    if data['fresh']:
+        cache_hit, goal_vector = None, embed_goal(goal)
+    else:
+        cache_hit, goal_vector = lookup_cached_advice(goal, cache_key, fingerprint, use_rag)
+    if cache_hit is not None:
+        return {'success': True, **cache_hit}
+    tier = budget_policy.current()
+    if not tier.generate:
+        if job_can_wait(job):
+            raise JobRetry(LOAD_RECOVER_SECONDS)
+        return busy_response(goal)
+    references = references_for(goal, goal_vector) if use_rag else []
+    prompt = build_advice_prompt(goal, references, tier, route)
+    priority = request_priority(data)
+    result, _ = advice_flight.do(cache_key, lambda: scheduled_call(prompt, priority, tier, route))
+    if not result["success"] and result.get("retry_after") and job_can_wait(job):
+        raise JobRetry(result["retry_after"])
+    item = generated_item(goal, cache_key, fingerprint, result, goal_vector, references, route, source='job')
+    del item['status']
+    return item
+
+def run_prefetch(item: PrefetchItem) -> str:
+    """Prefetch worker handler: generate and cache one goal's advice.
+
+    Streams the generation so it can stop between tokens once interactive work
+    needs the slot; closing the stream makes Ollama stop generating.
+    """
+    if advice_cache.contains(item.key):
+        return PREFETCH_SKIPPED
+    tier = budget_policy.current()
+    if tier.name != TIER_FULL:
+        return PREFETCH_DEFERRED
+    goal_vector = embed_goal(item.goal)
+    references = references_for(item.goal, goal_vector) if item.use_rag else []
+    prompt = build_advice_prompt(item.goal, references, tier, item.route)
+    parts = []
+    chunks = scheduled_stream(prompt, PRIORITY_PREFETCH, tier, item.route)
+    try:
+        for chunk in chunks:
+            if not chunk["success"]:
+                return PREFETCH_DEFERRED if chunk.get("retry_after") else PREFETCH_FAILED
+            parts.append(chunk["response"])
+            if not chunk["done"] and prefetcher.preempted():
+                logger.info("Prefetch preempted", extra={"tokens": len(parts)})
+                return PREFETCH_CANCELLED
+    finally:
+        chunks.close()
+    advice = "".join(parts).strip()
+    if not advice:
+        return PREFETCH_FAILED
+    store_advice(item.goal, item.key, advice_fingerprint(item.use_rag, item.route), advice, goal_vector, tier.name)
+    return PREFETCH_GENERATED
+
+@app.route('/api/llama-advice/prefetch', methods=['POST', 'OPTIONS'])
+def prefetch_advice():
+    """Queue low-priority generations for goals the user will likely ask about (new todos)"""
+    if request.method == 'OPTIONS':
+        response = jsonify({'status': 'ok'})
+        return response
+
+    if not PREFETCH_ENABLED:
+        return jsonify({
+            'success': False,
+            'error': 'Prefetch is disabled.'
+        }), 404
+    data = request.get_json(silent=True)
+    goals = data.get('goals', [data.get('goal')] if 'goal' in data else None) if isinstance(data, dict) else None
+    if not isinstance(goals, list) or not goals:
+        return jsonify({
+            'success': False,
+            'error': 'Please enter a list of goals.'
+        }), 400
+    if len(goals) > PREFETCH_MAX_GOALS:
+        return jsonify({
+            'success': False,
+            'error': f'Too many goals (max {PREFETCH_MAX_GOALS}).'
+        }), 400
+
+    queued, _ = prefetcher.submit(prefetch_items(goals))
+    return jsonify({
+        'success': True,
+        'queued': queued,
+        'skipped': len(goals) - queued
+    }), 202
+
+def jobs_disabled_response():
+    """503 for the job routes when JOBS_DB is empty"""
+    return jsonify({
+        'success': False,
+        'error': 'Jobs are disabled on this server.'
+    }), 503
+
+@app.route('/api/jobs', methods=['POST', 'OPTIONS'])
+def submit_job():
+    """Queue an advice generation; poll GET /api/jobs/<job_id> for the result"""
+    if request.method == 'OPTIONS':
+        response = jsonify({'status': 'ok'})
+        return response
+    if job_workers is None:
+        return jobs_disabled_response()
+
+    data, goal, error_response = parse_goal()
+    if error_response is not None:
+        return error_response
+
+    try:
+        scheduler.check_rate(get_client_id())
+    except RateLimitedError as e:
+        return rate_limited_response(e)
+    queue = job_workers.queue
+    if queue.pending() >= JOB_MAX_PENDING:
         return jsonify({
-            'status': 'disconnected',
-            'message': f'Connection failed: {str(e)}'
+            'success': False,
+            'error': 'Too many pending jobs. Please try again later.'
         }), 503
 
+    job_id = queue.submit(job_payload(data, goal, request.headers.get('Cache-Control', '')))
+    job_workers.notify()
+    logger.info("Job submitted", extra={"job_id": job_id})
+    response = jsonify({
+        'success': True,
+        'job_id': job_id,
+        'status': JOB_QUEUED,
+        'poll': f'/api/jobs/{job_id}'
+    })
+    response.headers['Location'] = f'/api/jobs/{job_id}'
+    return response, 202
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id: str):
+    """Job status, with the advice once it is done; 404 after the result TTL"""
+    if job_workers is None:
+        return jobs_disabled_response()
+    job = job_workers.queue.get(job_id)
+    if job is None:
+        return jsonify({
+            'success': False,
+            'error': 'Job not found or expired.'
+        }), 404
+    response = jsonify({'success': True, **job})
+    if job['status'] in (JOB_QUEUED, JOB_RUNNING):
+        response.headers['Retry-After'] = str(math.ceil(JOB_POLL_INTERVAL))
+    return response
+
+@app.route('/api/ollama-status', methods=['GET'])
+def check_status():
+    """Ollama status from the background snapshot (ETag / If-None-Match aware)"""
+    backends = ollama.stats()
+    resilience = resilience_stats()
+    body, etag, status_code = status_poller.render(
+        {'current_model': OLLAMA_MODEL, 'backends': backends, **resilience},
+        live_state=[[b['url'], b['healthy']] for b in backends['backends']] + [resilience['circuit']['state']])
+    if etag_matches(request.headers.get('If-None-Match'), etag):
+        response = app.response_class(status=304)
+    else:
+        response = jsonify(body)
+        response.status_code = status_code
+    response.headers['ETag'] = etag
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+@app.route('/api/cache-stats', methods=['GET'])
+def cache_stats():
+    """Advice cache hit/miss counters"""
+    return jsonify({
+        **core_cache_stats(),
+        'coalescing': {
+            'advice': advice_flight.stats(),
+            'stream': stream_flight.stats()
+        },
+        'sessions': sessions.stats()
+    })
+
+@app.route('/api/scheduler-stats', methods=['GET'])
+def scheduler_stats():
+    """Admission control queue, rejection counters, load budget tier, goal routing, jobs and prefetch"""
+    return jsonify({**scheduler.stats(), 'budget': budget_policy.stats(), 'routing': goal_router.stats(),
+                    'jobs': {**job_workers.queue.stats(), **job_workers.stats()} if job_workers else None,
+                    'prefetch': prefetcher.stats()})
+
+@app.route('/api/metrics', methods=['GET'])
+def metrics():
+    """Prometheus text exposition of request stage timings and counters"""
+    return Response(METRICS.render(), content_type=METRICS_CONTENT_TYPE)
+
+@app.route('/api/debug/logging', methods=['GET', 'POST'])
+def debug_logging():
+    """Inspect or change log level, sampling and payload logging at runtime (needs LOG_ADMIN_TOKEN)"""
+    if not LOG_ADMIN_TOKEN or request.headers.get('X-Admin-Token') != LOG_ADMIN_TOKEN:
+        return jsonify({'success': False, 'error': 'Not found'}), 404
+    if request.method == 'GET':
+        return jsonify(log_settings.stats())
+    data = request.get_json(silent=True)
+    error = validate_log_settings(data)
+    if error is not None:
+        return jsonify({'success': False, 'error': error}), 400
+    logger.warning("Logging settings changed", extra={"changes": data})
+    return jsonify(update_log_settings(data))
+
 @app.route('/api/health', methods=['GET'])
 def health():
-    """Server health check"""
+    """Server health check (503 until the model is resident)"""
+    if MODEL_WARMUP_ENABLED and not model_keeper.ready:
+        return jsonify({
+            'status': 'warming',
+            'message': f'Loading model {OLLAMA_MODEL}',
+            'models': model_keeper.status()
+        }), 503
     return jsonify({
         'status': 'healthy',
         'message': 'Flask server is running'
@@ -191,7 +1164,7 @@ def simple_test():
         data = request.get_json()
         goal = data.get('goal', 'test')
         
-        advice = f"🎯 Test advice for '{goal}':\n\n📋 Create a plan\n⏰ Execute consistently\n📊 Track progress\n🎉 Celebrate achievements"
+        advice = build_simple_test_advice(goal)
         
         return jsonify({
             'success': True,
@@ -203,10 +1176,25 @@ def simple_test():
             'error': str(e)
         }), 500
 
+# Metrics outermost, so the total covers Flask itself and every streamed byte
+api_routes = [rule.rule for rule in app.url_map.iter_rules()]
+if CAPTURE_ENABLED:
+    app.wsgi_app = WSGICaptureMiddleware(app.wsgi_app, CAPTURED_ROUTES)
+app.wsgi_app = WSGIMetricsMiddleware(WSGIRequestContextMiddleware(app.wsgi_app, api_routes), api_routes)
+
 if __name__ == '__main__':
+    ollama.start()
+    status_poller.start()
+    if MODEL_WARMUP_ENABLED:
+        model_keeper.start()
+    start_job_workers()
+    if PREFETCH_ENABLED:
+        prefetcher.start(run_prefetch)
     print("🚀 Starting Flask server")
     print("📍 http://localhost:5000")
-    print("🔧 Ollama URL:", OLLAMA_BASE_URL)
+    print("🔧 Ollama URLs:", ", ".join(OLLAMA_BASE_URLS))
     print("🤖 Model:", OLLAMA_MODEL)
-    
-    app.run(debug=True, host='0.0.0.0', port=5000)
+
+    # No reloader: its parent process would run this block too, pinning models and
+    # claiming jobs a second time
+    app.run(debug=os.environ.get("FLASK_DEBUG") == "1", use_reloader=False, host='0.0.0.0', port=5000)
@@ -0,0 +1,475 @@
+"""
+Ollama Backend Pool
+Routes generations across several Ollama nodes with health checks and failover
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures import wait as wait_futures
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Sequence, Set
+
+from circuit_breaker import is_outage
+from ollama_client import (
+    AsyncOllamaClient,
+    EmbedBatchResult,
+    EmbeddingsResult,
+    GenerateChunk,
+    GenerateResult,
+    OllamaClient,
+    OllamaConnectionError,
+    OllamaError,
+    OllamaTimeouts,
+    PsResult,
+    TagsResult,
+)
+
+logger = logging.getLogger(__name__)
+
+ROUTING_LEAST_OUTSTANDING = "least_outstanding"
+ROUTING_EWMA = "ewma"
+
+HEALTH_TIMEOUTS = OllamaTimeouts(connect=2, first_byte=5, total=5)
+# Calls whose latency feeds a node's EWMA; status and embedding calls take milliseconds
+# and would drown out how slowly the node generates
+GENERATE_METHODS = ("generate", "generate_stream")
+
+
+def parse_base_urls(value: str) -> List[str]:
+    """Comma- or whitespace-separated Ollama URLs, deduplicated in order"""
+    urls: List[str] = []
+    for url in value.replace(",", " ").split():
+        url = url.rstrip("/")
+        if url not in urls:
+            urls.append(url)
+    return urls
+
+
+class Backend:
+    """One Ollama node and its routing state"""
+
+    def __init__(self, client):
+        self.client = client
+        self.url = client.base_url
+        self.healthy = True
+        self.models: Optional[Set[str]] = None  # unknown until the first health check
+        self.outstanding = 0
+        self.ewma_latency: Optional[float] = None
+        self.requests = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.ejections = 0
+        self.last_error: Optional[str] = None
+        self.last_checked: Optional[float] = None
+
+    def serves(self, model: str) -> bool:
+        if self.models is None:
+            return True
+        return model in self.models or f"{model}:latest" in self.models
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "url": self.url,
+            "healthy": self.healthy,
+            "models": sorted(self.models) if self.models is not None else None,
+            "outstanding": self.outstanding,
+            "ewma_latency_ms": round(self.ewma_latency * 1000, 1) if self.ewma_latency is not None else None,
+            "requests": self.requests,
+            "failures": self.failures,
+            "consecutive_failures": self.consecutive_failures,
+            "ejections": self.ejections,
+            "last_error": self.last_error,
+            "last_checked": self.last_checked
+        }
+
+
+class _BackendPoolBase:
+    """Node selection and bookkeeping shared by the sync and asyncio pools.
+
+    A node is ejected after `eject_after` consecutive failures (or a failed
+    health check) and re-admitted by the next successful health check. When
+    every node is ejected the pool still routes to the least loaded one
+    rather than failing outright.
+    """
+
+    def __init__(self, clients: Sequence[Any], model: str,
+                 routing: str = ROUTING_LEAST_OUTSTANDING, eject_after: int = 3,
+                 check_interval: float = 10.0, max_attempts: int = 2,
+                 health_timeouts: Optional[OllamaTimeouts] = None):
+        if not clients:
+            raise ValueError("BackendPool needs at least one client")
+        if routing not in (ROUTING_LEAST_OUTSTANDING, ROUTING_EWMA):
+            raise ValueError(f"Unknown routing strategy: {routing!r}")
+        self.backends = [Backend(client) for client in clients]
+        self.model = model
+        self.base_url = self.backends[0].url
+        self.routing = routing
+        self.eject_after = eject_after
+        self.check_interval = check_interval
+        self.max_attempts = max(1, min(max_attempts, len(self.backends)))
+        self.health_timeouts = health_timeouts or HEALTH_TIMEOUTS
+        self.retries = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self._started = False
+        self._lock = threading.Lock()
+
+    def _score(self, backend: Backend):
+        if self.routing == ROUTING_EWMA:
+            # Peak-EWMA: expected wait grows with both latency and queue length
+            latency = backend.ewma_latency if backend.ewma_latency is not None else 0.0
+            return ((backend.outstanding + 1) * latency, backend.outstanding)
+        return (backend.outstanding, backend.ewma_latency or 0.0)
+
+    def _pick(self, model: Optional[str], tried: Set[str], prefer: Optional[str] = None) -> Backend:
+        """Least-loaded healthy node that has the model, or `prefer` when it is one of
+        them (a session's context is cached there); reserves an outstanding slot"""
+        model = model or self.model
+        with self._lock:
+            candidates = [b for b in self.backends if b.url not in tried] or self.backends
+            eligible = ([b for b in candidates if b.healthy and b.serves(model)]
+                        or [b for b in candidates if b.healthy]
+                        or candidates)
+            backend = next((b for b in eligible if b.url == prefer), None) if prefer else None
+            if backend is None:
+                backend = min(eligible, key=self._score)
+            tried.add(backend.url)
+            backend.outstanding += 1
+            backend.requests += 1
+            return backend
+
+    def _finish(self, backend: Backend, method: str, started: float, error: Optional[BaseException]):
+        with self._lock:
+            backend.outstanding -= 1
+            if error is not None and is_outage(error):
+                backend.failures += 1
+                backend.consecutive_failures += 1
+                backend.last_error = f"{type(error).__name__}: {error}"
+                if backend.healthy and backend.consecutive_failures >= self.eject_after:
+                    backend.healthy = False
+                    backend.ejections += 1
+                    logger.warning("Ejected Ollama backend", extra={"backend": backend.url,
+                                                                    "error": backend.last_error})
+                return
+            if error is None or isinstance(error, Exception):
+                # The node answered; only abandoned calls (cancelled, closed) say nothing
+                backend.consecutive_failures = 0
+            if error is None and method in GENERATE_METHODS:
+                elapsed = time.monotonic() - started
+                backend.ewma_latency = (elapsed if backend.ewma_latency is None
+                                        else 0.8 * backend.ewma_latency + 0.2 * elapsed)
+
+    def _should_retry(self, error: BaseException, tried: Set[str]) -> bool:
+        if isinstance(error, OllamaConnectionError) and len(tried) < self.max_attempts:
+            with self._lock:
+                self.retries += 1
+            return True
+        return False
+
+    def _hedge_exclusions(self, model: Optional[str], tried: Set[str]) -> Optional[Set[str]]:
+        """Nodes a hedge must avoid, or None when no other healthy node has the model"""
+        model = model or self.model
+        with self._lock:
+            if not any(b.healthy and b.serves(model) and b.url not in tried for b in self.backends):
+                return None
+            self.hedges += 1
+            return set(tried)
+
+    def _hedge_won(self):
+        with self._lock:
+            self.hedge_wins += 1
+
+    def _record_health(self, backend: Backend, tags: Optional[TagsResult], error: Optional[Exception]):
+        with self._lock:
+            backend.last_checked = time.time()
+            if error is not None:
+                backend.last_error = f"{type(error).__name__}: {error}"
+                if backend.healthy:
+                    backend.healthy = False
+                    backend.ejections += 1
+                    logger.warning("Ejected Ollama backend: health check failed",
+                                   extra={"backend": backend.url, "error": backend.last_error})
+                return
+            backend.models = set(tags.names)
+            backend.consecutive_failures = 0
+            if not backend.healthy:
+                backend.healthy = True
+                logger.info("Re-admitted Ollama backend", extra={"backend": backend.url})
+
+    def _claim_start(self) -> bool:
+        with self._lock:
+            if self._started:
+                return False
+            self._started = True
+            return True
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "routing": self.routing,
+                "healthy": sum(1 for b in self.backends if b.healthy),
+                "total": len(self.backends),
+                "retries": self.retries,
+                "hedges": self.hedges,
+                "hedge_wins": self.hedge_wins,
+                "backends": [b.stats() for b in self.backends]
+            }
+
+
+class BackendPool(_BackendPoolBase):
+    """Drop-in replacement for OllamaClient that spreads calls over several nodes"""
+
+    def __init__(self, clients: Sequence[OllamaClient], model: str, **kwargs):
+        super().__init__(clients, model, **kwargs)
+        self._stop = threading.Event()
+        self._hedge_executor: Optional[ThreadPoolExecutor] = None
+
+    def start(self):
+        """Start background health checks once; safe to call on every request"""
+        if self._claim_start():
+            threading.Thread(target=self._run_checks, name="backend-health", daemon=True).start()
+
+    def close(self):
+        self._stop.set()
+        if self._hedge_executor is not None:
+            self._hedge_executor.shutdown(wait=False)
+        for backend in self.backends:
+            backend.client.close()
+
+    def check_health(self):
+        """Probe every node's /api/tags once"""
+        for backend in self.backends:
+            try:
+                self._record_health(backend, backend.client.tags(timeouts=self.health_timeouts), None)
+            except OllamaError as e:
+                self._record_health(backend, None, e)
+
+    def _run_checks(self):
+        while not self._stop.is_set():
+            self.check_health()
+            self._stop.wait(self.check_interval)
+
+    def _call(self, route_model: Optional[str], method: str, *args,
+              tried: Optional[Set[str]] = None, prefer: Optional[str] = None, **kwargs):
+        tried = set() if tried is None else tried
+        while True:
+            backend = self._pick(route_model, tried, prefer)
+            started = time.monotonic()
+            try:
+                result = getattr(backend.client, method)(*args, **kwargs)
+            except BaseException as e:
+                self._finish(backend, method, started, e)
+                if self._should_retry(e, tried):
+                    continue
+                raise
+            self._finish(backend, method, started, None)
+            return result
+
+    def generate(self, prompt: str, options: Optional[Dict[str, Any]] = None,
+                 model: Optional[str] = None, timeouts: Optional[OllamaTimeouts] = None,
+                 prefer: Optional[str] = None, **extra) -> GenerateResult:
+        return self._call(model, "generate", prompt, options=options, model=model,
+                          timeouts=timeouts, prefer=prefer, **extra)
+
+    def generate_hedged(self, prompt: str, hedge_after: float,
+                        options: Optional[Dict[str, Any]] = None, model: Optional[str] = None,
+                        timeouts: Optional[OllamaTimeouts] = None, **extra) -> GenerateResult:
+        """generate(), duplicated on a second node if the first has not answered within
+        `hedge_after` seconds; the first success wins. A blocking request cannot be
+        aborted, so the losing one runs to completion in the background.
+        """
+        with self._lock:
+            if self._hedge_executor is None:
+                self._hedge_executor = ThreadPoolExecutor(max_workers=64, thread_name_prefix="hedge")
+
+        def call(tried: Set[str]) -> GenerateResult:
+            return self._call(model, "generate", prompt, options=options, model=model,
+                              timeouts=timeouts, tried=tried, **extra)
+
+        tried: Set[str] = set()
+        primary = self._hedge_executor.submit(call, tried)
+        try:
+            return primary.result(timeout=hedge_after)
+        except FutureTimeoutError:
+            pass
+        exclusions = self._hedge_exclusions(model, tried)
+        if exclusions is None:
+            return primary.result()
+        hedge = self._hedge_executor.submit(call, exclusions)
+        pending = {primary, hedge}
+        while pending:
+            done, pending = wait_futures(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is hedge:
+                        self._hedge_won()
+                    return future.result()
+        return primary.result()
+
+    def generate_stream(self, prompt: str, options: Optional[Dict[str, Any]] = None,
+                        model: Optional[str] = None, timeouts: Optional[OllamaTimeouts] = None,
+                        prefer: Optional[str] = None, **extra) -> Iterator[GenerateChunk]:
+        """Streams from one node; fails over only if no chunk was sent yet"""
+        tried: Set[str] = set()
+        while True:
+            backend = self._pick(model, tried, prefer)
+            started = time.monotonic()
+            sent = False
+            try:
+                for chunk in backend.client.generate_stream(prompt, options=options, model=model,
+                                                            timeouts=timeouts, **extra):
+                    sent = True
+                    yield chunk
+            except BaseException as e:
+                self._finish(backend, "generate_stream", started, e)
+                if not sent and self._should_retry(e, tried):
+                    continue
+                raise
+            self._finish(backend, "generate_stream", started, None)
+            return
+
+    def tags(self, timeouts: Optional[OllamaTimeouts] = None) -> TagsResult:
+        return self._call(None, "tags", timeouts=timeouts)
+
+    def ps(self, timeouts: Optional[OllamaTimeouts] = None) -> PsResult:
+        return self._call(None, "ps", timeouts=timeouts)
+
+    def embeddings(self, prompt: str, model: Optional[str] = None,
+                   timeouts: Optional[OllamaTimeouts] = None) -> EmbeddingsResult:
+        return self._call(model, "embeddings", prompt, model=model, timeouts=timeouts)
+
+    def embed_batch(self, inputs: List[str], model: Optional[str] = None,
+                    timeouts: Optional[OllamaTimeouts] = None) -> EmbedBatchResult:
+        return self._call(model, "embed_batch", inputs, model=model, timeouts=timeouts)
+
+
+class AsyncBackendPool(_BackendPoolBase):
+    """asyncio flavour of BackendPool over AsyncOllamaClient nodes"""
+
+    def __init__(self, clients: Sequence[AsyncOllamaClient], model: str, **kwargs):
+        super().__init__(clients, model, **kwargs)
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        """Start background health checks on the running loop"""
+        if self._claim_start():
+            self._task = asyncio.ensure_future(self._run_checks())
+
+    async def aclose(self):
+        if self._task is not None:
+            self._task.cancel()
+        for backend in self.backends:
+            await backend.client.aclose()
+
+    async def _check_one(self, backend: Backend):
+        try:
+            self._record_health(backend, await backend.client.tags(timeouts=self.health_timeouts), None)
+        except OllamaError as e:
+            self._record_health(backend, None, e)
+
+    async def check_health(self):
+        """Probe every node's /api/tags concurrently"""
+        await asyncio.gather(*(self._check_one(b) for b in self.backends))
+
+    async def _run_checks(self):
+        while True:
+            await self.check_health()
+            await asyncio.sleep(self.check_interval)
+
+    async def _call(self, route_model: Optional[str], method: str, *args,
+              tried: Optional[Set[str]] = None, prefer: Optional[str] = None, **kwargs):
+        tried = set() if tried is None else tried
+        while True:
+            backend = self._pick(route_model, tried, prefer)
+            started = time.monotonic()
+            try:
+                result = await getattr(backend.client, method)(*args, **kwargs)
+            except BaseException as e:
+                self._finish(backend, method, started, e)
+                if self._should_retry(e, tried):
+                    continue
+                raise
+            self._finish(backend, method, started, None)
+            return result
+
+    async def generate(self, prompt: str, options: Optional[Dict[str, Any]] = None,
+                       model: Optional[str] = None, timeouts: Optional[OllamaTimeouts] = None,
+                       prefer: Optional[str] = None, **extra) -> GenerateResult:
+        return await self._call(model, "generate", prompt, options=options, model=model,
+                                timeouts=timeouts, prefer=prefer, **extra)
+
+    async def generate_hedged(self, prompt: str, hedge_after: float,
+                              options: Optional[Dict[str, Any]] = None, model: Optional[str] = None,
+                              timeouts: Optional[OllamaTimeouts] = None, **extra) -> GenerateResult:
+        """generate(), duplicated on a second node if the first has not answered within
+        `hedge_after` seconds; the first success wins and the loser is cancelled
+        """
+        def call(tried: Set[str]) -> asyncio.Task:
+            return asyncio.ensure_future(self._call(model, "generate", prompt, options=options,
+                                                    model=model, timeouts=timeouts,
+                                                    tried=tried, **extra))
+
+        tried: Set[str] = set()
+        primary = call(tried)
+        tasks = [primary]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=hedge_after)
+            if done:
+                return primary.result()
+            exclusions = self._hedge_exclusions(model, tried)
+            if exclusions is None:
+                return await primary
+            hedge = call(exclusions)
+            tasks.append(hedge)
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            self._hedge_won()
+                        return task.result()
+            return primary.result()
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    async def generate_stream(self, prompt: str, options: Optional[Dict[str, Any]] = None,
+                              model: Optional[str] = None, timeouts: Optional[OllamaTimeouts] = None,
+                              prefer: Optional[str] = None, **extra) -> AsyncIterator[GenerateChunk]:
+        """Streams from one node; fails over only if no chunk was sent yet"""
+        tried: Set[str] = set()
+        while True:
+            backend = self._pick(model, tried, prefer)
+            started = time.monotonic()
+            sent = False
+            try:
+                async for chunk in backend.client.generate_stream(prompt, options=options, model=model,
+                                                                  timeouts=timeouts, **extra):
+                    sent = True
+                    yield chunk
+            except BaseException as e:
+                self._finish(backend, "generate_stream", started, e)
+                if not sent and self._should_retry(e, tried):
+                    continue
+                raise
+            self._finish(backend, "generate_stream", started, None)
+            return
+
+    async def tags(self, timeouts: Optional[OllamaTimeouts] = None) -> TagsResult:
+        return await self._call(None, "tags", timeouts=timeouts)
+
+    async def ps(self, timeouts: Optional[OllamaTimeouts] = None) -> PsResult:
+        return await self._call(None, "ps", timeouts=timeouts)
+
+    async def embeddings(self, prompt: str, model: Optional[str] = None,
+                         timeouts: Optional[OllamaTimeouts] = None) -> EmbeddingsResult:
+        return await self._call(model, "embeddings", prompt, model=model, timeouts=timeouts)
+
+    async def embed_batch(self, inputs: List[str], model: Optional[str] = None,
+                          timeouts: Optional[OllamaTimeouts] = None) -> EmbedBatchResult:
+        return await self._call(model, "embed_batch", inputs, model=model, timeouts=timeouts)
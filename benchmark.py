@@ -0,0 +1,618 @@
+#!/usr/bin/env python3
+"""
+Benchmark
+Concurrency / request-rate load profiles against the app or Ollama directly, with JSON results
+and regression checks against a stored baseline
+
+    # closed loop: 1, 4 and 16 clients for 30s each against the app
+    python benchmark.py run --target app --url http://localhost:5000 --concurrency 1,4,16 --duration 30
+
+    # open loop: 2 then 5 requests/s straight at Ollama, streaming, sweeping generation options
+    python benchmark.py run --target ollama --rate 2,5 --stream --num-predict 64,200 --num-ctx 1024,2048
+
+    # offline: start mock_ollama.py in-process and benchmark against it
+    python benchmark.py run --target ollama --mock --concurrency 8 --requests 200 --out results.json
+
+    # flag regressions (exit code 1) against a stored baseline
+    python benchmark.py compare baseline.json results.json --threshold 0.1
+
+    # re-issue traffic recorded with CAPTURE_ENABLED=true, 10x faster than it arrived
+    python benchmark.py replay captures/requests.jsonl --speed 10
+"""
+
+import argparse
+import itertools
+import json
+import math
+import random
+import re
+import socket
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import requests
+
+from ollama_client import OllamaClient, OllamaError, OllamaTimeouts
+
+DEFAULT_GOALS = [
+    "learn Python programming",
+    "exercise daily",
+    "save money",
+    "read more books",
+    "wake up early",
+    "learn to play guitar",
+    "run a half marathon",
+    "improve my sleep",
+]
+
+PROMPT_TEMPLATE = """Goal: {goal}
+
+Please provide practical advice to achieve this goal. Give 3-4 specific tips. Use emojis.
+
+Advice:"""
+
+# metric -> (better direction, smallest absolute change worth reporting)
+REGRESSION_RULES = {
+    "latency_ms.p50": ("lower", 5.0),
+    "latency_ms.p95": ("lower", 5.0),
+    "latency_ms.p99": ("lower", 5.0),
+    "ttft_ms.p50": ("lower", 5.0),
+    "ttft_ms.p95": ("lower", 5.0),
+    "throughput_rps": ("higher", 0.05),
+    "tokens_per_sec.mean": ("higher", 0.5),
+    "error_rate": ("lower", 0.01),
+    "fallback_rate": ("lower", 0.01),
+}
+
+
+@dataclass
+class Sample:
+    """Outcome of one request"""
+    ok: bool
+    latency: float
+    ttft: Optional[float] = None
+    tokens_per_sec: Optional[float] = None
+    fallback: bool = False
+    cached: bool = False
+    error: Optional[str] = None
+
+
+def percentiles(values: List[float], scale: float = 1000.0) -> Optional[Dict[str, float]]:
+    """p50/p95/p99/mean/max (nearest rank), scaled (seconds -> ms by default)"""
+    if not values:
+        return None
+    ordered = sorted(values)
+
+    def rank(q: float) -> float:
+        return ordered[min(len(ordered) - 1, max(0, math.ceil(q / 100 * len(ordered)) - 1))]
+
+    return {
+        "p50": round(rank(50) * scale, 1),
+        "p95": round(rank(95) * scale, 1),
+        "p99": round(rank(99) * scale, 1),
+        "mean": round(statistics.fmean(ordered) * scale, 1),
+        "max": round(ordered[-1] * scale, 1),
+    }
+
+
+class OllamaTarget:
+    """Requests straight to Ollama's /api/generate"""
+
+    def __init__(self, url: str, model: str, stream: bool, options: Dict[str, Any],
+                 concurrency: int, timeout: float):
+        self.stream = stream
+        self.options = options
+        self.client = OllamaClient(url, model, max_in_flight=concurrency, pool_size=concurrency,
+                                   timeouts=OllamaTimeouts(connect=10, first_byte=timeout, total=timeout))
+
+    def request(self, goal: str) -> Sample:
+        prompt = PROMPT_TEMPLATE.format(goal=goal)
+        started = time.monotonic()
+        ttft = None
+        try:
+            if self.stream:
+                result = None
+                for chunk in self.client.generate_stream(prompt, options=self.options):
+                    if ttft is None and chunk.response:
+                        ttft = time.monotonic() - started
+                    result = chunk.result or result
+            else:
+                result = self.client.generate(prompt, options=self.options)
+        except OllamaError as e:
+            return Sample(False, time.monotonic() - started, error=f"{type(e).__name__}: {e}")
+        latency = time.monotonic() - started
+        if result is None or not result.response.strip():
+            return Sample(False, latency, ttft, error="empty response")
+        tokens_per_sec = (result.eval_count / (result.eval_duration / 1e9)
+                          if result.eval_count and result.eval_duration else None)
+        return Sample(True, latency, ttft, tokens_per_sec)
+
+    def close(self):
+        self.client.close()
+
+
+class AppTarget:
+    """Requests to /api/llama-advice (or its NDJSON stream) on the app"""
+
+    def __init__(self, url: str, stream: bool, fresh: bool, timeout: float):
+        self.url = url.rstrip("/")
+        self.stream = stream
+        self.fresh = fresh
+        self.timeout = timeout
+        self._local = threading.local()
+
+    @property
+    def session(self) -> requests.Session:
+        if not hasattr(self._local, "session"):
+            self._local.session = requests.Session()
+        return self._local.session
+
+    def request(self, goal: str, options: Optional[Dict[str, Any]] = None,
+                client_id: Optional[str] = None) -> Sample:
+        payload = {"goal": goal, "fresh": self.fresh, **(options or {})}
+        headers = {"X-Client-ID": client_id} if client_id else None
+        started = time.monotonic()
+        try:
+            if self.stream:
+                return self._stream(payload, headers, started)
+            response = self.session.post(f"{self.url}/api/llama-advice", json=payload, headers=headers,
+                                         timeout=self.timeout)
+            latency = time.monotonic() - started
+            body = response.json()
+        except (requests.RequestException, ValueError) as e:
+            return Sample(False, time.monotonic() - started, error=type(e).__name__)
+        if response.status_code != 200 or not body.get("success"):
+            return Sample(False, latency, error=f"HTTP {response.status_code}: {body.get('error', '')}"[:200])
+        return Sample(True, latency, fallback=bool(body.get("fallback")), cached=bool(body.get("cached")))
+
+    def _stream(self, payload: Dict[str, Any], headers: Optional[Dict[str, str]], started: float) -> Sample:
+        ttft = None
+        done: Dict[str, Any] = {}
+        with self.session.post(f"{self.url}/api/llama-advice/stream?format=ndjson", json=payload,
+                               headers=headers, stream=True, timeout=self.timeout) as response:
+            if response.status_code != 200:
+                return Sample(False, time.monotonic() - started, error=f"HTTP {response.status_code}")
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                event = json.loads(line)
+                if event.get("event") == "token" and ttft is None:
+                    ttft = time.monotonic() - started
+                elif event.get("event") == "done":
+                    done = event
+        latency = time.monotonic() - started
+        if not done.get("success"):
+            return Sample(False, latency, ttft, error=str(done.get("error", "stream ended without done")))
+        return Sample(True, latency, ttft, fallback=bool(done.get("fallback")), cached=bool(done.get("cached")))
+
+    def scrape_tokens(self) -> Optional[Tuple[float, float]]:
+        """(eval tokens, eval seconds) from the app's /api/metrics, or None"""
+        try:
+            response = requests.get(f"{self.url}/api/metrics", timeout=5)
+        except requests.RequestException:
+            return None
+        if response.status_code != 200:
+            return None
+        text = response.text
+        tokens = re.search(r'^ollama_tokens_total\{kind="eval"\} (\S+)$', text, re.M)
+        seconds = re.search(r'^ollama_duration_seconds_sum\{phase="eval"\} (\S+)$', text, re.M)
+        return (float(tokens.group(1)) if tokens else 0.0, float(seconds.group(1)) if seconds else 0.0)
+
+    def close(self):
+        pass
+
+
+def goal_stream(goals: List[str], unique: bool) -> Iterator[str]:
+    """Goals in a loop; `unique` appends a counter so no two requests share a cache entry"""
+    for n, goal in enumerate(itertools.cycle(goals)):
+        yield f"{goal} #{n}" if unique else goal
+
+
+def run_closed_loop(target, goals: Iterator[str], concurrency: int, duration: Optional[float],
+                    total: Optional[int]) -> Tuple[List[Sample], float]:
+    """`concurrency` clients each send their next request as soon as the last one finishes"""
+    samples: List[Sample] = []
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration if duration else None
+    issued = itertools.count()
+
+    def client():
+        while True:
+            if deadline is not None and time.monotonic() >= deadline:
+                return
+            if total is not None and next(issued) >= total:
+                return
+            with lock:
+                goal = next(goals)
+            sample = target.request(goal)
+            with lock:
+                samples.append(sample)
+
+    started = time.monotonic()
+    threads = [threading.Thread(target=client, daemon=True) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return samples, time.monotonic() - started
+
+
+def run_open_loop(target, goals: Iterator[str], rate: float, duration: Optional[float],
+                  total: Optional[int], max_in_flight: int, poisson: bool) -> Tuple[List[Sample], float]:
+    """Requests arrive at `rate`/s regardless of how fast they finish.
+
+    Latency is measured from the scheduled arrival time, so a saturated server
+    shows up as queueing delay instead of silently lowering the offered load.
+    """
+    samples: List[Sample] = []
+    lock = threading.Lock()
+    if total is None:
+        total = max(1, int(rate * duration))
+    rng = random.Random(0)
+
+    def send(goal: str, scheduled: float):
+        sample = target.request(goal)
+        sample.latency = time.monotonic() - scheduled
+        with lock:
+            samples.append(sample)
+
+    started = time.monotonic()
+    arrival = started
+    with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+        for _ in range(total):
+            delay = arrival - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            executor.submit(send, next(goals), arrival)
+            arrival += rng.expovariate(rate) if poisson else 1.0 / rate
+    return samples, time.monotonic() - started
+
+
+def summarize(samples: List[Sample], elapsed: float) -> Dict[str, Any]:
+    ok = [s for s in samples if s.ok]
+    errors: Dict[str, int] = {}
+    for s in samples:
+        if not s.ok:
+            errors[s.error or "unknown"] = errors.get(s.error or "unknown", 0) + 1
+    tokens_per_sec = [s.tokens_per_sec for s in ok if s.tokens_per_sec]
+    count = len(samples)
+    return {
+        "requests": count,
+        "ok": len(ok),
+        "errors": count - len(ok),
+        "error_rate": round((count - len(ok)) / count, 4) if count else None,
+        "fallbacks": sum(s.fallback for s in ok),
+        "fallback_rate": round(sum(s.fallback for s in ok) / count, 4) if count else None,
+        "cached": sum(s.cached for s in ok),
+        "elapsed_s": round(elapsed, 2),
+        "throughput_rps": round(len(ok) / elapsed, 3) if elapsed else None,
+        "latency_ms": percentiles([s.latency for s in ok]),
+        "ttft_ms": percentiles([s.ttft for s in ok if s.ttft is not None]),
+        "tokens_per_sec": ({"p50": round(statistics.median(tokens_per_sec), 1),
+                            "mean": round(statistics.fmean(tokens_per_sec), 1)}
+                           if tokens_per_sec else None),
+        "top_errors": dict(sorted(errors.items(), key=lambda item: -item[1])[:5]),
+    }
+
+
+def parse_list(value: Optional[str], cast) -> List[Any]:
+    return [cast(v) for v in value.split(",")] if value else [None]
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def run(args) -> int:
+    if args.target == "app" and (args.num_predict or args.num_ctx):
+        print("❌ --num-predict/--num-ctx need --target ollama (the app uses its own OLLAMA_OPTIONS)")
+        return 2
+    url = args.url or ("http://localhost:5000" if args.target == "app" else "http://localhost:11434")
+    if args.mock:
+        from mock_ollama import MockConfig, serve
+
+        config = MockConfig()
+        config.update(json.loads(args.mock_config or "{}"))
+        port = free_port()
+        serve(config, port=port)
+        url = f"http://127.0.0.1:{port}"
+        print(f"🦙 Mock Ollama on {url}")
+
+    goals = DEFAULT_GOALS
+    if args.goals:
+        with open(args.goals, encoding="utf-8") as f:
+            goals = [line.strip() for line in f if line.strip()]
+    loads = ([("rate", r) for r in parse_list(args.rate, float)] if args.rate
+             else [("concurrency", c) for c in parse_list(args.concurrency or "1", int)])
+    duration = args.duration or (None if args.requests else 30.0)
+
+    result = {
+        "meta": {
+            "target": args.target,
+            "url": url,
+            "model": args.model,
+            "stream": args.stream,
+            "mock": args.mock,
+            "duration_s": duration,
+            "requests": args.requests,
+            "started_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        },
+        "runs": [],
+    }
+    for (mode, level), num_predict, num_ctx in itertools.product(
+            loads, parse_list(args.num_predict, int), parse_list(args.num_ctx, int)):
+        params = {mode: level, "stream": args.stream}
+        options = {}
+        if num_predict is not None:
+            params["num_predict"] = options["num_predict"] = num_predict
+        if num_ctx is not None:
+            params["num_ctx"] = options["num_ctx"] = num_ctx
+        in_flight = int(level) if mode == "concurrency" else args.max_in_flight
+        if args.target == "app":
+            target = AppTarget(url, args.stream, args.fresh, args.timeout)
+        else:
+            target = OllamaTarget(url, args.model, args.stream, options, in_flight, args.timeout)
+        stream = goal_stream(goals, args.unique)
+        try:
+            for _ in range(args.warmup):
+                target.request(next(stream))
+            before = target.scrape_tokens() if isinstance(target, AppTarget) else None
+            print(f"▶️  {params}")
+            if mode == "concurrency":
+                samples, elapsed = run_closed_loop(target, stream, int(level), duration, args.requests)
+            else:
+                samples, elapsed = run_open_loop(target, stream, level, duration, args.requests,
+                                                 args.max_in_flight, args.poisson)
+            summary = summarize(samples, elapsed)
+            after = target.scrape_tokens() if before is not None else None
+            if after is not None and after[1] > before[1]:
+                # Server-side eval counters: the app does not return eval_count per response
+                summary["tokens_per_sec"] = {"mean": round((after[0] - before[0]) / (after[1] - before[1]), 1)}
+        finally:
+            target.close()
+        result["runs"].append({"params": params, **summary})
+        print_summary(summary)
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"💾 Results written to {args.out}")
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            return 1 if report_regressions(json.load(f), result, args.threshold) else 0
+    return 0
+
+
+def load_capture(paths: List[str]) -> List[Dict[str, Any]]:
+    """Captured records (see traffic_capture.py) from one or more files, oldest first"""
+    records = []
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            records.extend(json.loads(line) for line in f if line.strip())
+    return sorted(records, key=lambda r: r["ts"])
+
+
+def peak_concurrency(records: List[Dict[str, Any]]) -> int:
+    """Most requests that were in flight at once when the traffic was recorded"""
+    events = sorted([(r["ts"], 1) for r in records]
+                    + [(r["ts"] + r.get("latency_ms", 0) / 1000, -1) for r in records])
+    peak = current = 0
+    for _, change in events:
+        current += change
+        peak = max(peak, current)
+    return max(1, peak)
+
+
+def run_replay(records: List[Dict[str, Any]], url: str, speed: float, max_in_flight: int,
+               timeout: float) -> Tuple[List[Sample], float]:
+    """Re-issue captured requests with their original spacing divided by `speed`.
+
+    speed 0 sends as fast as possible with `max_in_flight` requests outstanding.
+    As in run_open_loop, scheduled requests are timed from their scheduled send time.
+    """
+    targets = {stream: AppTarget(url, stream, fresh=False, timeout=timeout) for stream in (False, True)}
+    samples: List[Sample] = []
+    lock = threading.Lock()
+
+    def send(record: Dict[str, Any], scheduled: Optional[float]):
+        target = targets[record["route"].endswith("/stream")]
+        options = {k: record[k] for k in ("fresh", "rag", "priority") if k in record}
+        sample = target.request(record["goal"], options, record.get("client_id"))
+        if scheduled is not None:
+            sample.latency = time.monotonic() - scheduled
+        with lock:
+            samples.append(sample)
+
+    started = time.monotonic()
+    first_ts = records[0]["ts"] if records else 0.0
+    with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+        for record in records:
+            if speed <= 0:
+                executor.submit(send, record, None)
+                continue
+            scheduled = started + (record["ts"] - first_ts) / speed
+            delay = scheduled - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            executor.submit(send, record, scheduled)
+    return samples, time.monotonic() - started
+
+
+def recorded_summary(records: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """What the captured traffic looked like when it was served originally"""
+    caches: Dict[str, int] = {}
+    for r in records:
+        caches[r.get("cache", "unknown")] = caches.get(r.get("cache", "unknown"), 0) + 1
+    span = records[-1]["ts"] - records[0]["ts"] if records else 0.0
+    return {
+        "requests": len(records),
+        "span_s": round(span, 1),
+        "peak_concurrency": peak_concurrency(records) if records else 0,
+        "latency_ms": percentiles([r["latency_ms"] / 1000 for r in records if "latency_ms" in r]),
+        "cache": caches,
+        "fallback_rate": round(sum(bool(r.get("fallback")) for r in records) / len(records), 4) if records else None,
+    }
+
+
+def replay(args) -> int:
+    records = load_capture(args.capture)
+    if args.limit:
+        records = records[:args.limit]
+    if not records:
+        print("❌ No captured requests to replay")
+        return 2
+    speed = 0.0 if args.speed == "max" else float(args.speed)
+    recorded = recorded_summary(records)
+    in_flight = args.max_in_flight or (recorded["peak_concurrency"] if speed <= 0 else 256)
+    label = "as fast as possible" if speed <= 0 else f"{speed:g}x"
+    print(f"🔁 Replaying {len(records)} requests ({recorded['span_s']}s recorded) at {label}, "
+          f"up to {in_flight} in flight")
+    samples, elapsed = run_replay(records, args.url, speed, in_flight, args.timeout)
+    summary = summarize(samples, elapsed)
+    print_summary(summary)
+    latency = recorded["latency_ms"] or {}
+    print(f"   recorded p50/p95/p99 {latency.get('p50')}/{latency.get('p95')}/{latency.get('p99')} ms, "
+          f"cache {recorded['cache']}")
+
+    result = {
+        "meta": {"target": "app", "url": args.url, "capture": args.capture, "recorded": recorded,
+                 "started_at": time.strftime("%Y-%m-%dT%H:%M:%S%z")},
+        "runs": [{"params": {"replay": len(records), "speed": args.speed}, **summary}],
+    }
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"💾 Results written to {args.out}")
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            return 1 if report_regressions(json.load(f), result, args.threshold) else 0
+    return 0
+
+
+def print_summary(summary: Dict[str, Any]):
+    latency = summary["latency_ms"] or {}
+    ttft = summary["ttft_ms"] or {}
+    tps = summary["tokens_per_sec"] or {}
+    print(f"   {summary['ok']}/{summary['requests']} ok, {summary['throughput_rps']} req/s, "
+          f"errors {summary['error_rate']}, fallbacks {summary['fallback_rate']}")
+    print(f"   latency p50/p95/p99 {latency.get('p50')}/{latency.get('p95')}/{latency.get('p99')} ms"
+          + (f", ttft p50/p95 {ttft.get('p50')}/{ttft.get('p95')} ms" if ttft else "")
+          + (f", {tps.get('mean')} tok/s" if tps else ""))
+    for error, count in summary["top_errors"].items():
+        print(f"   ❌ {count}x {error}")
+
+
+def _metric(run: Dict[str, Any], path: str) -> Optional[float]:
+    value: Any = run
+    for part in path.split("."):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+    return value if isinstance(value, (int, float)) else None
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any], threshold: float) -> List[Dict[str, Any]]:
+    """Per-run metric changes beyond `threshold` (relative) in the worse direction"""
+    baseline_runs = {json.dumps(run["params"], sort_keys=True): run for run in baseline["runs"]}
+    regressions = []
+    for run in current["runs"]:
+        key = json.dumps(run["params"], sort_keys=True)
+        before = baseline_runs.get(key)
+        if before is None:
+            continue
+        for path, (better, min_delta) in REGRESSION_RULES.items():
+            old, new = _metric(before, path), _metric(run, path)
+            if old is None or new is None:
+                continue
+            delta = new - old if better == "lower" else old - new
+            if delta > min_delta and delta > threshold * abs(old):
+                regressions.append({"params": run["params"], "metric": path, "baseline": old,
+                                    "current": new, "change": round(delta / old, 3) if old else None})
+    return regressions
+
+
+def report_regressions(baseline: Dict[str, Any], current: Dict[str, Any], threshold: float) -> bool:
+    shared = ({json.dumps(run["params"], sort_keys=True) for run in baseline["runs"]}
+              & {json.dumps(run["params"], sort_keys=True) for run in current["runs"]})
+    if not shared:
+        print("⚠️ No runs with the same parameters in the baseline; nothing compared")
+        return False
+    regressions = compare(baseline, current, threshold)
+    if not regressions:
+        print(f"✅ No regressions beyond {threshold:.0%} against the baseline")
+        return False
+    print(f"⚠️ {len(regressions)} regression(s) beyond {threshold:.0%}:")
+    for r in regressions:
+        change = f"{r['change']:+.1%}" if r["change"] is not None else "new"
+        print(f"   {r['params']} {r['metric']}: {r['baseline']} -> {r['current']} ({change} worse)")
+    return True
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the advice app or Ollama")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = sub.add_parser("run", help="Run load profiles")
+    run_parser.add_argument("--target", choices=["app", "ollama"], default="app")
+    run_parser.add_argument("--url", help="default: http://localhost:5000 (app) or :11434 (ollama)")
+    run_parser.add_argument("--model", default="llama3:latest")
+    run_parser.add_argument("--concurrency", help="closed-loop clients, comma-separated to sweep (default 1)")
+    run_parser.add_argument("--rate", help="open-loop requests/s, comma-separated to sweep")
+    run_parser.add_argument("--poisson", action="store_true", help="exponential inter-arrival times")
+    run_parser.add_argument("--max-in-flight", type=int, default=64, help="open-loop worker cap")
+    run_parser.add_argument("--duration", type=float, help="seconds per run (default 30)")
+    run_parser.add_argument("--requests", type=int, help="requests per run instead of a duration")
+    run_parser.add_argument("--warmup", type=int, default=1, help="requests sent before measuring")
+    run_parser.add_argument("--stream", action="store_true", help="stream and measure time-to-first-token")
+    run_parser.add_argument("--num-predict", help="ollama target: comma-separated values to sweep")
+    run_parser.add_argument("--num-ctx", help="ollama target: comma-separated values to sweep")
+    run_parser.add_argument("--goals", help="file with one goal per line")
+    run_parser.add_argument("--unique", action="store_true", help="make every goal distinct (no cache hits)")
+    run_parser.add_argument("--fresh", action="store_true", help="app target: bypass the advice caches")
+    run_parser.add_argument("--timeout", type=float, default=120.0)
+    run_parser.add_argument("--mock", action="store_true", help="start mock_ollama.py in-process and target it")
+    run_parser.add_argument("--mock-config", help='JSON MockConfig overrides, e.g. \'{"tokens_per_sec": 200}\'')
+    run_parser.add_argument("--out", help="write JSON results here")
+    run_parser.add_argument("--baseline", help="compare against this results file (exit 1 on regression)")
+    run_parser.add_argument("--threshold", type=float, default=0.10, help="relative change that counts")
+
+    replay_parser = sub.add_parser("replay", help="Re-issue captured traffic against the app")
+    replay_parser.add_argument("capture", nargs="+", help="capture files, e.g. captures/requests.jsonl*")
+    replay_parser.add_argument("--url", default="http://localhost:5000")
+    replay_parser.add_argument("--speed", default="1", help="time scale: 1 (as recorded), 10 (10x faster) or max")
+    replay_parser.add_argument("--max-in-flight", type=int,
+                               help="worker cap (default: recorded peak for max, otherwise 256)")
+    replay_parser.add_argument("--limit", type=int, help="replay only the first N requests")
+    replay_parser.add_argument("--timeout", type=float, default=120.0)
+    replay_parser.add_argument("--out", help="write JSON results here")
+    replay_parser.add_argument("--baseline", help="compare against this results file (exit 1 on regression)")
+    replay_parser.add_argument("--threshold", type=float, default=0.10)
+
+    compare_parser = sub.add_parser("compare", help="Compare two result files")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--threshold", type=float, default=0.10)
+
+    args = parser.parse_args(argv)
+    if args.command == "compare":
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        with open(args.current, encoding="utf-8") as f:
+            current = json.load(f)
+        return 1 if report_regressions(baseline, current, args.threshold) else 0
+    if args.command == "replay":
+        return replay(args)
+    if args.mock and args.target != "ollama":
+        parser.error("--mock needs --target ollama; point the app at a mock with OLLAMA_BASE_URL instead")
+    return run(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,221 @@
+"""
+Circuit Breaker and Adaptive Timeouts
+Fail fast while Ollama is down and size deadlines from observed latency
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+from ollama_client import OllamaConnectionError, OllamaError, OllamaHTTPError, OllamaTimeoutError
+from shared_state import SharedState
+
+logger = logging.getLogger(__name__)
+
+STATE_CLOSED = "closed"
+STATE_OPEN = "open"
+STATE_HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(OllamaError):
+    """Calls are short-circuited; `retry_after` is seconds until the next probe"""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"Ollama is unavailable (circuit open, retry in {retry_after:.0f}s)")
+        self.retry_after = retry_after
+
+
+def is_outage(error: BaseException) -> bool:
+    """Transport problems and 5xx mean the server is unwell; client errors do not"""
+    if isinstance(error, (OllamaConnectionError, OllamaTimeoutError)):
+        return True
+    return isinstance(error, OllamaHTTPError) and error.status_code >= 500
+
+
+class CircuitBreaker:
+    """Closed -> open after `failure_threshold` consecutive outages; open -> half-open
+    after `reset_timeout`, where up to `half_open_max` probes decide whether to close
+    again or re-open. A probe that never reports back is forgotten after
+    `reset_timeout` so the breaker cannot wedge half-open.
+
+    With `shared` set, opening is published host-wide: a closed breaker in
+    another worker process picks it up (checked at most every `shared_check`
+    seconds) and fails fast for the rest of the reset timeout instead of
+    finding the outage with its own failures. Each process still probes on
+    its own. The shared store is only touched from a background thread, so
+    allow() and record() never wait on another process's lock; a breaker
+    adopts what the last read saw.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0,
+                 half_open_max: int = 1, shared: Optional[SharedState] = None,
+                 shared_check: float = 1.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_max = half_open_max
+        self.shared = shared
+        self.shared_check = shared_check
+        self._shared_checked = 0.0
+        self._shared_open_until = 0.0
+        self._shared_executor: Optional[ThreadPoolExecutor] = None
+        self._shared_pid = 0
+        self.state = STATE_CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.opens = 0
+        self.short_circuited = 0
+        self._probes: Deque[float] = deque()
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Admit a call or raise CircuitOpenError"""
+        with self._lock:
+            now = time.monotonic()
+            if self.state == STATE_CLOSED and self.shared is not None:
+                self._adopt_shared(now)
+            if self.state == STATE_OPEN:
+                remaining = self.opened_at + self.reset_timeout - now
+                if remaining > 0:
+                    self.short_circuited += 1
+                    raise CircuitOpenError(remaining)
+                self.state = STATE_HALF_OPEN
+                self._probes.clear()
+            if self.state == STATE_HALF_OPEN:
+                while self._probes and now - self._probes[0] > self.reset_timeout:
+                    self._probes.popleft()
+                if len(self._probes) >= self.half_open_max:
+                    self.short_circuited += 1
+                    raise CircuitOpenError(self.reset_timeout)
+                self._probes.append(now)
+
+    def record(self, error: Optional[BaseException] = None):
+        """Report the outcome of an admitted call; None means success"""
+        with self._lock:
+            if self._probes:
+                self._probes.popleft()
+            if error is not None and not isinstance(error, Exception):
+                return  # cancelled or closed by the caller: says nothing about Ollama
+            if error is not None and is_outage(error):
+                self.consecutive_failures += 1
+                if self.state == STATE_HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                    if self.state != STATE_OPEN:
+                        self.opens += 1
+                        logger.error("Circuit opened", extra={"failures": self.consecutive_failures,
+                                                              "error": str(error)})
+                    self.state = STATE_OPEN
+                    self.opened_at = time.monotonic()
+                    if self.shared is not None:
+                        open_until = time.time() + self.reset_timeout
+                        self._shared_open_until = open_until
+                        self._in_background(lambda: self.shared.set(
+                            "circuit", "open_until", str(open_until), ttl=self.reset_timeout))
+                return
+            self.consecutive_failures = 0
+            if self.state != STATE_CLOSED:
+                logger.info("Circuit closed")
+                self.state = STATE_CLOSED
+                if self.shared is not None:
+                    self._shared_open_until = 0.0
+                    self._in_background(lambda: self.shared.delete("circuit", "open_until"))
+
+    def _in_background(self, work: Callable[[], Any]):
+        # One thread, so publishes and reads reach the store in the order they were made
+        if self._shared_executor is None or self._shared_pid != os.getpid():
+            self._shared_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="circuit-shared")
+            self._shared_pid = os.getpid()
+        self._shared_executor.submit(work)
+
+    def _read_shared(self):
+        open_until = self.shared.get("circuit", "open_until")
+        self._shared_open_until = float(open_until) if open_until is not None else 0.0
+
+    def _adopt_shared(self, now: float):
+        if now - self._shared_checked >= self.shared_check:
+            self._shared_checked = now
+            self._in_background(self._read_shared)
+        remaining = self._shared_open_until - time.time()
+        if remaining > 0:
+            logger.warning("Circuit opened by another worker", extra={"retry_after": round(remaining, 1)})
+            self.state = STATE_OPEN
+            self.opened_at = now - self.reset_timeout + remaining
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "state": self.state,
+                "consecutive_failures": self.consecutive_failures,
+                "opens": self.opens,
+                "short_circuited": self.short_circuited
+            }
+
+
+class LatencyTracker:
+    """Sliding window of recent latencies with percentile-based deadlines.
+
+    Add a call that timed out at the deadline it hit: it took at least that
+    long, and leaving it out would keep a deadline the backend has outgrown
+    from ever growing back.
+    """
+
+    def __init__(self, window: int = 200, min_samples: int = 20):
+        self.min_samples = min_samples
+        self._samples: Deque[float] = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, q: float) -> Optional[float]:
+        """q-th percentile (0-100) in seconds, or None until `min_samples` are seen"""
+        with self._lock:
+            if len(self._samples) < self.min_samples:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * q / 100))]
+
+    def timeout(self, default: float, floor: float, headroom: float = 2.0, q: float = 99) -> float:
+        """headroom x p`q`, clamped to [floor, default]; `default` until warmed up"""
+        observed = self.percentile(q)
+        if observed is None:
+            return default
+        return max(floor, min(default, observed * headroom))
+
+    def stats(self) -> Dict[str, Any]:
+        p50, p95, p99 = (self.percentile(q) for q in (50, 95, 99))
+        with self._lock:
+            samples = len(self._samples)
+        return {
+            "samples": samples,
+            "p50_ms": round(p50 * 1000, 1) if p50 is not None else None,
+            "p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+            "p99_ms": round(p99 * 1000, 1) if p99 is not None else None
+        }
+
+
+class LatencyTrackers:
+    """A LatencyTracker per kind of call (e.g. model and budget tier), created on first use,
+    so short calls never set the deadlines of long ones"""
+
+    def __init__(self, **kwargs: Any):
+        self._kwargs = kwargs
+        self._trackers: Dict[str, LatencyTracker] = {}
+        self._lock = threading.Lock()
+
+    def __getitem__(self, key: str) -> LatencyTracker:
+        with self._lock:
+            tracker = self._trackers.get(key)
+            if tracker is None:
+                tracker = self._trackers[key] = LatencyTracker(**self._kwargs)
+            return tracker
+
+    def keys(self) -> List[str]:
+        with self._lock:
+            return sorted(self._trackers)
+
+    def stats(self) -> Dict[str, Any]:
+        return {key: self[key].stats() for key in self.keys()}
@@ -0,0 +1,212 @@
+"""
+Goal Router
+Microsecond goal classification (character n-grams) and routing to a template, a fast model or the main model
+"""
+
+import re
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from advice_cache import normalize_goal
+
+ROUTE_TEMPLATE = "template"
+ROUTE_FAST = "fast"
+ROUTE_BIG = "big"
+
+CATEGORIES = ("exercise", "study", "reading", "diet", "coding")
+
+# Seed vocabulary per category (English and Korean); n-grams of these become the weights
+SEED_PHRASES: Dict[str, Tuple[str, ...]] = {
+    "exercise": ("exercise", "workout", "work out", "running", "run", "jogging", "gym", "fitness",
+                 "push-ups", "squats", "yoga", "swimming", "cycling", "marathon", "stretching",
+                 "walking", "steps", "strength", "cardio", "운동", "헬스", "달리기", "조깅", "요가",
+                 "수영", "걷기", "스트레칭", "마라톤", "근력", "체력", "만보", "자전거"),
+    "study": ("study", "studying", "learn", "learning", "exam", "test", "language", "english",
+              "vocabulary", "lecture", "homework", "certificate", "memorize", "course", "grades",
+              "공부", "시험", "영어", "자격증", "학습", "강의", "암기", "수능", "토익", "단어", "외국어"),
+    "reading": ("read", "reading", "book", "books", "novel", "novels", "library", "chapter",
+                "pages", "literature", "audiobook", "독서", "책", "읽기", "소설", "도서관", "권"),
+    "diet": ("diet", "lose weight", "weight loss", "calories", "eat healthy", "healthy eating",
+             "nutrition", "sugar", "vegetables", "meals", "fasting", "snacks", "kg", "protein",
+             "다이어트", "체중", "살 빼기", "식단", "칼로리", "감량", "채소", "간식", "단식", "야식"),
+    "coding": ("code", "coding", "programming", "python", "javascript", "algorithm", "algorithms",
+               "developer", "leetcode", "software", "build an app", "git", "web development",
+               "코딩", "프로그래밍", "개발", "알고리즘", "파이썬", "자바스크립트", "앱 만들기", "깃허브"),
+}
+
+# Several goals in one, or a goal with conditions attached, needs the big model
+_CLAUSE_MARKERS = re.compile(r",|;| and | while | but | so that | because |그리고|하면서|동시에| 및 |면서")
+
+CATEGORY_PROMPT_TEMPLATE = """Goal: {goal}
+
+You are a practical {coach}. Give 3-4 specific tips. Use emojis. Keep each tip to one sentence.
+
+Advice:"""
+
+COACHES = {
+    "exercise": "fitness coach",
+    "study": "study coach",
+    "reading": "reading coach",
+    "diet": "nutrition coach",
+    "coding": "programming mentor",
+}
+
+TEMPLATES = {
+    "exercise": ("💪 Advice for '{goal}':\n\n"
+                 "📅 Schedule it: pick fixed days and a time, and put them in your calendar.\n"
+                 "🐢 Start small: 10-15 minutes is enough at first; add 10% per week.\n"
+                 "🔥 Warm up 5 minutes before and stretch after to avoid injuries.\n"
+                 "📈 Log every session so you can see your progress and keep the streak going."),
+    "study": ("📚 Advice for '{goal}':\n\n"
+              "🎯 Break it into weekly topics and a concrete goal for each session.\n"
+              "⏱️ Study in 25-minute focused blocks with 5-minute breaks (Pomodoro).\n"
+              "🔁 Review with active recall and spaced repetition instead of re-reading.\n"
+              "📝 Test yourself regularly; mistakes show what to study next."),
+    "reading": ("📖 Advice for '{goal}':\n\n"
+                "⏰ Read at a fixed time every day, even if only 10-20 pages.\n"
+                "🎒 Keep a book (or e-reader) with you for spare minutes.\n"
+                "✏️ Note one idea or quote per chapter to remember what you read.\n"
+                "🔄 It is fine to drop a book you do not enjoy and pick the next one."),
+    "diet": ("🥗 Advice for '{goal}':\n\n"
+             "🍽️ Plan meals ahead and build each plate around vegetables and protein.\n"
+             "💧 Drink water before meals and cut sugary drinks first.\n"
+             "🍪 Keep snacks out of sight and out of the house where you can.\n"
+             "📊 Track weight or meals weekly, not daily, and aim for slow steady change."),
+    "coding": ("💻 Advice for '{goal}':\n\n"
+               "🛠️ Build a small project you care about instead of only following tutorials.\n"
+               "⏱️ Code a little every day; consistency beats long weekend sessions.\n"
+               "🐛 Read error messages carefully and debug step by step before searching.\n"
+               "🤝 Share your code on GitHub and ask for reviews to learn faster."),
+}
+
+
+_HANGUL = re.compile(r"[\uac00-\ud7a3]")
+
+
+def _ngrams(text: str) -> List[str]:
+    """3- and 4-grams over the space-padded text; 2-grams too for Korean, whose words are short (책, 운동)"""
+    padded = f" {text} "
+    sizes = (2, 3, 4) if _HANGUL.search(text) else (3, 4)
+    return [padded[i:i + n] for n in sizes for i in range(len(padded) - n + 1)]
+
+
+@dataclass(frozen=True)
+class GoalRoute:
+    """Where a goal's advice comes from; `model`/`prompt_template` None means the defaults"""
+    name: str
+    category: Optional[str] = None
+    confidence: float = 0.0
+    model: Optional[str] = None
+    prompt_template: Optional[str] = None
+    num_predict: Optional[int] = None
+
+    def options(self, options: Dict[str, Any]) -> Dict[str, Any]:
+        """Generation options with this route's num_predict cap applied"""
+        if self.num_predict is None or options.get("num_predict", 0) <= self.num_predict:
+            return options
+        return {**options, "num_predict": self.num_predict}
+
+    def prompt(self, goal: str) -> str:
+        return self.prompt_template.format(goal=goal)
+
+    def template_advice(self, goal: str) -> str:
+        return TEMPLATES[self.category].format(goal=goal)
+
+    def fields(self) -> Dict[str, Any]:
+        """Response fields naming the route; none for the plain main-model path"""
+        if self.name == ROUTE_BIG and self.category is None:
+            return {}
+        return {"route": self.name, "category": self.category}
+
+
+BIG_ROUTE = GoalRoute(ROUTE_BIG)
+
+
+class GoalClassifier:
+    """Category scores from a (n-gram x category) weight matrix built from SEED_PHRASES.
+
+    Weights are tf-idf style: n-grams shared by many categories count for less.
+    """
+
+    def __init__(self, seeds: Dict[str, Sequence[str]] = SEED_PHRASES):
+        self.categories = list(seeds)
+        counts: Dict[str, np.ndarray] = {}
+        for column, category in enumerate(self.categories):
+            for phrase in seeds[category]:
+                for gram in _ngrams(normalize_goal(phrase)):
+                    counts.setdefault(gram, np.zeros(len(self.categories), dtype=np.float32))[column] += 1
+        self.vocabulary = {gram: row for row, gram in enumerate(counts)}
+        weights = np.stack(list(counts.values())) if counts else np.zeros((0, len(self.categories)))
+        document_frequency = (weights > 0).sum(axis=1, keepdims=True)
+        self.weights = (np.log1p(weights) * np.log(1 + len(self.categories) / document_frequency)).astype(np.float32)
+
+    def scores(self, goal: str) -> np.ndarray:
+        rows = [self.vocabulary[gram] for gram in set(_ngrams(normalize_goal(goal))) if gram in self.vocabulary]
+        if not rows:
+            return np.zeros(len(self.categories), dtype=np.float32)
+        return self.weights[rows].sum(axis=0)
+
+    def classify(self, goal: str) -> Tuple[Optional[str], float]:
+        """(best category, its share of the total score), or (None, 0.0) when nothing matches"""
+        scores = self.scores(goal)
+        total = float(scores.sum())
+        if total <= 0:
+            return None, 0.0
+        best = int(scores.argmax())
+        return self.categories[best], float(scores[best]) / total
+
+
+def goal_complexity(goal: str) -> float:
+    """Rough 0..1+ figure: long goals and goals with several clauses score higher"""
+    words = len(goal.split())
+    clauses = len(_CLAUSE_MARKERS.findall(f" {goal.casefold()} "))
+    return words / 12 + clauses * 0.5 + (0.25 if re.search(r"\d", goal) and words > 6 else 0.0)
+
+
+class GoalRouter:
+    """template for short, clear-cut goals; fast model with a category prompt for other
+    confident single-topic goals; the main model for everything ambiguous or complex"""
+
+    def __init__(self, enabled: bool = False, fast_model: Optional[str] = None,
+                 templates: bool = True, min_confidence: float = 0.6,
+                 template_confidence: float = 0.8, template_max_words: int = 3,
+                 max_complexity: float = 0.75, fast_num_predict: Optional[int] = 120,
+                 classifier: Optional[GoalClassifier] = None):
+        self.enabled = enabled
+        self.fast_model = fast_model or None
+        self.templates = templates
+        self.min_confidence = min_confidence
+        self.template_confidence = template_confidence
+        self.template_max_words = template_max_words
+        self.max_complexity = max_complexity
+        self.fast_num_predict = fast_num_predict
+        self.classifier = classifier or GoalClassifier()
+
+    def route(self, goal: str, allow_template: bool = True) -> GoalRoute:
+        """`allow_template=False` for clients that asked for freshly generated advice"""
+        if not self.enabled:
+            return BIG_ROUTE
+        category, confidence = self.classifier.classify(goal)
+        if category is None or confidence < self.min_confidence:
+            return GoalRoute(ROUTE_BIG, category, confidence)
+        if goal_complexity(goal) > self.max_complexity:
+            return GoalRoute(ROUTE_BIG, category, confidence)
+        if (self.templates and allow_template and confidence >= self.template_confidence
+                and len(goal.split()) <= self.template_max_words):
+            return GoalRoute(ROUTE_TEMPLATE, category, confidence)
+        prompt = CATEGORY_PROMPT_TEMPLATE.replace("{coach}", COACHES[category])
+        return GoalRoute(ROUTE_FAST, category, confidence, self.fast_model, prompt, self.fast_num_predict)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "fast_model": self.fast_model,
+            "templates": self.templates,
+            "min_confidence": self.min_confidence,
+            "template_confidence": self.template_confidence,
+            "max_complexity": self.max_complexity,
+            "fast_num_predict": self.fast_num_predict
+        }
+
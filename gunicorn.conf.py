@@ -0,0 +1,19 @@
+"""
+Gunicorn configuration for the ASGI server in app.py
+
+    gunicorn app:app -c gunicorn.conf.py
+"""
+
+import multiprocessing
+import os
+
+bind = f"{os.environ.get('HOST', '0.0.0.0')}:{os.environ.get('PORT', '5000')}"
+worker_class = "uvicorn.workers.UvicornWorker"
+# Each worker is a single asyncio loop; generations wait on I/O, so a few
+# workers per host are enough. Ollama's parallelism is the real bottleneck.
+workers = int(os.environ.get("WEB_CONCURRENCY", min(4, multiprocessing.cpu_count())))
+backlog = 4096
+# Streams can stay open for the whole generation (up to OLLAMA_TOTAL_TIMEOUT)
+timeout = int(float(os.environ.get("OLLAMA_TOTAL_TIMEOUT", "80"))) + 40
+graceful_timeout = 30
+keepalive = 75
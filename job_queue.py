@@ -0,0 +1,379 @@
+"""
+Advice Jobs
+Durable submit/poll job queue on SQLite (WAL) and the worker pool that drains it
+"""
+
+import asyncio
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from structured_log import begin_request
+
+logger = logging.getLogger(__name__)
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+JOB_STATUSES = (JOB_QUEUED, JOB_RUNNING, JOB_DONE, JOB_FAILED)
+
+# Log context route for work done by job workers (the job ID is the request ID)
+JOB_LOG_ROUTE = "/api/jobs"
+
+
+@dataclass(frozen=True)
+class Job:
+    id: str
+    payload: Dict[str, Any]
+    created_at: float
+    attempts: int
+
+    @property
+    def age(self) -> float:
+        return time.time() - self.created_at
+
+
+class JobRetry(Exception):
+    """Raised by a job handler to put the job back in the queue for `retry_after` seconds"""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"Retry in {retry_after:.1f}s")
+        self.retry_after = retry_after
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class JobQueue:
+    """Jobs in one SQLite table, shared by every worker process on the host.
+
+    A job is claimed inside BEGIN IMMEDIATE so two processes never run the
+    same one. Running jobs record their owner (host:pid); `recover()` puts
+    them back in the queue once that process is gone, or once they have run
+    longer than `stale_after` (no generation outlives its timeout). Finished
+    jobs are kept for `result_ttl` seconds.
+    """
+
+    def __init__(self, db_path: str, result_ttl: float = 3600.0, stale_after: float = 300.0,
+                 max_attempts: int = 3):
+        self.db_path = db_path
+        self.result_ttl = result_ttl
+        self.stale_after = stale_after
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        # Autocommit, with explicit transactions where a read and a write must be atomic
+        self._db = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None, timeout=10)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, status TEXT NOT NULL, payload TEXT NOT NULL, "
+            "result TEXT, error TEXT, owner TEXT, attempts INTEGER NOT NULL DEFAULT 0, "
+            "created_at REAL NOT NULL, started_at REAL, finished_at REAL, "
+            "not_before REAL NOT NULL DEFAULT 0, expires_at REAL)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)")
+
+    @property
+    def owner(self) -> str:
+        # Read per call: a server that forks workers after import has a different pid in each
+        return f"{socket.gethostname()}:{os.getpid()}"
+
+    def _transaction(self, work: Callable[[], Any]) -> Any:
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                result = work()
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+            return result
+
+    def submit(self, payload: Dict[str, Any]) -> str:
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO jobs (id, status, payload, created_at) VALUES (?, ?, ?, ?)",
+                (job_id, JOB_QUEUED, json.dumps(payload, ensure_ascii=False), time.time()))
+        return job_id
+
+    def claim(self) -> Optional[Job]:
+        """Oldest queued job that is due, marked running by this process"""
+        def work():
+            now = time.time()
+            row = self._db.execute(
+                "SELECT id, payload, created_at, attempts FROM jobs "
+                "WHERE status = ? AND not_before <= ? ORDER BY created_at LIMIT 1",
+                (JOB_QUEUED, now)).fetchone()
+            if row is None:
+                return None
+            self._db.execute(
+                "UPDATE jobs SET status = ?, owner = ?, started_at = ?, attempts = attempts + 1 "
+                "WHERE id = ?", (JOB_RUNNING, self.owner, now, row[0]))
+            return Job(row[0], json.loads(row[1]), row[2], row[3] + 1)
+        return self._transaction(work)
+
+    def complete(self, job_id: str, result: Dict[str, Any]):
+        self._finish(job_id, JOB_DONE, json.dumps(result, ensure_ascii=False), None)
+
+    def fail(self, job_id: str, error: str):
+        self._finish(job_id, JOB_FAILED, None, error)
+
+    def _finish(self, job_id: str, status: str, result: Optional[str], error: Optional[str]):
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, owner = NULL, finished_at = ?, "
+                "expires_at = ? WHERE id = ?",
+                (status, result, error, now, now + self.result_ttl, job_id))
+
+    def release(self, job_id: str, delay: float = 0.0, attempt_used: bool = False):
+        """Back to the queue, not before `delay` seconds; the claim only counts if `attempt_used`"""
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET status = ?, owner = NULL, not_before = ?, "
+                "attempts = attempts - ? WHERE id = ?",
+                (JOB_QUEUED, time.time() + delay, 0 if attempt_used else 1, job_id))
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Public view of a job, or None when unknown or expired"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT status, result, error, attempts, created_at, started_at, finished_at "
+                "FROM jobs WHERE id = ? AND (expires_at IS NULL OR expires_at > ?)",
+                (job_id, time.time())).fetchone()
+        if row is None:
+            return None
+        status, result, error, attempts, created_at, started_at, finished_at = row
+        job = {
+            "job_id": job_id,
+            "status": status,
+            "attempts": attempts,
+            "created_at": created_at,
+            "started_at": started_at,
+            "finished_at": finished_at
+        }
+        if result is not None:
+            job["result"] = json.loads(result)
+        if error is not None:
+            job["error"] = error
+        return job
+
+    def recover(self) -> int:
+        """Requeue running jobs whose process is gone or that ran past `stale_after`"""
+        def work():
+            now = time.time()
+            host = socket.gethostname()
+            orphans: List[str] = []
+            failed: List[str] = []
+            for job_id, owner, started_at, attempts in self._db.execute(
+                    "SELECT id, owner, started_at, attempts FROM jobs WHERE status = ?", (JOB_RUNNING,)):
+                owner_host, _, pid = (owner or "").rpartition(":")
+                dead = owner_host == host and pid.isdigit() and not _pid_alive(int(pid))
+                if not dead and now - (started_at or 0) < self.stale_after:
+                    continue
+                (failed if attempts >= self.max_attempts else orphans).append(job_id)
+            for job_id in orphans:
+                self._db.execute("UPDATE jobs SET status = ?, owner = NULL WHERE id = ?", (JOB_QUEUED, job_id))
+            for job_id in failed:
+                self._db.execute(
+                    "UPDATE jobs SET status = ?, owner = NULL, error = ?, finished_at = ?, expires_at = ? "
+                    "WHERE id = ?", (JOB_FAILED, f"Gave up after {self.max_attempts} attempts",
+                                     now, now + self.result_ttl, job_id))
+            return len(orphans) + len(failed)
+        recovered = self._transaction(work)
+        if recovered:
+            logger.warning("Recovered interrupted jobs", extra={"jobs": recovered})
+        return recovered
+
+    def purge(self) -> int:
+        """Delete finished jobs past their TTL"""
+        with self._lock:
+            return self._db.execute("DELETE FROM jobs WHERE expires_at <= ?", (time.time(),)).rowcount
+
+    def pending(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM jobs WHERE status = ?", (JOB_QUEUED,)).fetchone()[0]
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        counts = dict.fromkeys(JOB_STATUSES, 0)
+        counts.update(rows)
+        return counts
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "path": self.db_path,
+            **self.counts(),
+            "result_ttl": self.result_ttl
+        }
+
+
+class JobWorkers:
+    """`workers` loops that claim jobs and run `handler` on them.
+
+    Workers wake on notify() for jobs submitted by this process and poll every
+    `poll_interval` seconds for the rest (other processes, retries coming due,
+    jobs recovered after a restart). A handler raising JobRetry sends the job
+    back to the queue; any other exception fails it.
+
+    Async workers run every queue call in a thread: a claim can wait up to the
+    busy timeout for another process's write lock, and must not stall the loop.
+    """
+
+    def __init__(self, queue: JobQueue, workers: int = 4, poll_interval: float = 1.0,
+                 maintenance_interval: float = 30.0):
+        self.queue = queue
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.maintenance_interval = maintenance_interval
+        self.completed = 0
+        self.failed = 0
+        self.retried = 0
+        self._maintained_at: Optional[float] = None
+        self._started = False
+        self._stop = threading.Event()
+        self._wakeup = threading.Event()
+        self._async_wakeup: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._tasks: List[asyncio.Task] = []
+        self._lock = threading.Lock()
+
+    def _claim_start(self) -> bool:
+        with self._lock:
+            if self._started:
+                return False
+            self._started = True
+            return True
+
+    def start(self, handler: Callable[[Job], Dict[str, Any]]):
+        """Run jobs on daemon threads (sync handler); safe to call on every request"""
+        if self._claim_start():
+            self.queue.recover()
+            for n in range(self.workers):
+                threading.Thread(target=self._run, args=(handler,), name=f"job-worker-{n}", daemon=True).start()
+
+    def start_async(self, handler: Callable[[Job], Awaitable[Dict[str, Any]]]):
+        """Run jobs as tasks on the running loop (async handler)"""
+        if self._claim_start():
+            # recover() runs with the first claim, off the loop
+            self._loop = asyncio.get_running_loop()
+            self._async_wakeup = asyncio.Event()
+            self._tasks = [asyncio.ensure_future(self._run_async(handler)) for _ in range(self.workers)]
+
+    async def stop_async(self):
+        """Cancel the worker tasks; jobs they were running go back to the queue"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def stop(self):
+        self._stop.set()
+        self._wakeup.set()
+
+    def notify(self):
+        """A job was just submitted by this process"""
+        self._wakeup.set()
+        if self._async_wakeup is not None:
+            self._loop.call_soon_threadsafe(self._async_wakeup.set)
+
+    def _maintain(self):
+        # Any worker may do it; the first one past the interval wins
+        now = time.monotonic()
+        with self._lock:
+            if self._maintained_at is not None and now - self._maintained_at < self.maintenance_interval:
+                return
+            self._maintained_at = now
+        try:
+            self.queue.recover()
+            self.queue.purge()
+        except Exception:
+            logger.exception("Job queue maintenance failed")
+
+    def _claim(self) -> Optional[Job]:
+        self._maintain()
+        try:
+            return self.queue.claim()
+        except Exception:
+            logger.exception("Job claim failed")
+            return None
+
+    def _settle(self, job: Job, result: Optional[Dict[str, Any]], error: Optional[BaseException]):
+        # Counters under the lock: async workers settle from executor threads
+        if isinstance(error, JobRetry):
+            with self._lock:
+                self.retried += 1
+            self.queue.release(job.id, error.retry_after)
+            self.notify()
+        elif error is not None:
+            with self._lock:
+                self.failed += 1
+            logger.error("Job failed", extra={"job_id": job.id, "error": f"{type(error).__name__}: {error}"})
+            self.queue.fail(job.id, str(error))
+        else:
+            with self._lock:
+                self.completed += 1
+            self.queue.complete(job.id, result)
+
+    def _run(self, handler: Callable[[Job], Dict[str, Any]]):
+        while not self._stop.is_set():
+            job = self._claim()
+            if job is None:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+            begin_request(JOB_LOG_ROUTE, job.id)
+            try:
+                result = handler(job)
+            except Exception as e:
+                self._settle(job, None, e)
+            else:
+                self._settle(job, result, None)
+
+    async def _run_async(self, handler: Callable[[Job], Awaitable[Dict[str, Any]]]):
+        while True:
+            job = await asyncio.to_thread(self._claim)
+            if job is None:
+                try:
+                    await asyncio.wait_for(self._async_wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._async_wakeup.clear()
+                continue
+            begin_request(JOB_LOG_ROUTE, job.id)
+            try:
+                result = await handler(job)
+            except asyncio.CancelledError:
+                # Shutting down: the job has not really been attempted
+                await asyncio.to_thread(self.queue.release, job.id)
+                raise
+            except Exception as e:
+                await asyncio.to_thread(self._settle, job, None, e)
+            else:
+                await asyncio.to_thread(self._settle, job, result, None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "completed": self.completed,
+            "failed": self.failed,
+            "retried": self.retried
+        }
@@ -0,0 +1,127 @@
+"""
+Load-Aware Generation Budgets
+Shrink num_predict (and optionally num_ctx) in steps while the backend is busy, restore them when it is not
+"""
+
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Sequence
+
+logger = logging.getLogger(__name__)
+
+TIER_FULL = "full"
+TIER_REDUCED = "reduced"
+TIER_SHORT = "short"
+TIER_SHED = "shed"
+
+
+@dataclass(frozen=True)
+class BudgetTier:
+    """Generation settings for one load level; `generate=False` means templated advice only"""
+    name: str
+    options: Dict[str, Any]
+    tips: str = "3-4"
+    generate: bool = True
+
+
+def build_tiers(base_options: Dict[str, Any], num_predict: Sequence[int],
+                num_ctx: Sequence[int] = ()) -> List[BudgetTier]:
+    """full / reduced / short from per-tier budgets, then shed.
+
+    The full tier uses `base_options` unchanged so its answers (and cache keys)
+    are exactly what the server produced before budgets existed. Missing
+    num_ctx values keep the base context: Ollama reloads the model whenever
+    num_ctx changes, which costs far more than a shorter context saves.
+    """
+    tiers = [BudgetTier(TIER_FULL, dict(base_options))]
+    for index, (name, tips) in enumerate(((TIER_REDUCED, "3"), (TIER_SHORT, "2")), start=1):
+        options = dict(base_options)
+        if index < len(num_predict):
+            options["num_predict"] = num_predict[index]
+        if index < len(num_ctx):
+            options["num_ctx"] = num_ctx[index]
+        tiers.append(BudgetTier(name, options, tips))
+    tiers.append(BudgetTier(TIER_SHED, dict(base_options), generate=False))
+    return tiers
+
+
+class BudgetPolicy:
+    """Picks a tier from a load figure where 1.0 means "at capacity".
+
+    Tier i (i >= 1) is entered as soon as pressure reaches `thresholds[i - 1]`,
+    jumping straight to the matching tier. Recovery is one step per
+    `recover_seconds` that pressure stays below `recover_ratio` x the current
+    tier's threshold, so a burst that clears for a moment does not flap between
+    tiers. Pressure is only read when a request asks for a tier, at most every
+    `interval` seconds.
+    """
+
+    def __init__(self, tiers: List[BudgetTier], thresholds: Sequence[float],
+                 pressure: Callable[[], float], recover_ratio: float = 0.5,
+                 recover_seconds: float = 10.0, interval: float = 0.5, enabled: bool = True):
+        self.tiers = tiers[:len(thresholds) + 1]
+        self.thresholds = list(thresholds)[:len(self.tiers) - 1]
+        self.pressure = pressure
+        self.recover_ratio = recover_ratio
+        self.recover_seconds = recover_seconds
+        self.interval = interval
+        self.enabled = enabled
+        self.level = 0
+        self.last_pressure = 0.0
+        self.changes = 0
+        self._calm_since = time.monotonic()
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def _target(self, pressure: float) -> int:
+        level = 0
+        for index, threshold in enumerate(self.thresholds, start=1):
+            if pressure >= threshold:
+                level = index
+        return level
+
+    def current(self) -> BudgetTier:
+        if not self.enabled:
+            return self.tiers[0]
+        now = time.monotonic()
+        with self._lock:
+            if now - self._checked_at >= self.interval:
+                self._checked_at = now
+                self._update(self.pressure(), now)
+            return self.tiers[self.level]
+
+    def _update(self, pressure: float, now: float):
+        self.last_pressure = pressure
+        target = self._target(pressure)
+        if target > self.level:
+            self._set_level(target, pressure)
+        if self.level == 0 or pressure >= self.thresholds[self.level - 1] * self.recover_ratio:
+            self._calm_since = now
+            return
+        # Calm since the last high reading, possibly long ago if traffic stopped:
+        # one step per full `recover_seconds` elapsed
+        steps = int((now - self._calm_since) // self.recover_seconds)
+        if steps > 0:
+            self._set_level(max(target, self.level - steps), pressure)
+            self._calm_since = now
+
+    def _set_level(self, level: int, pressure: float):
+        logger.warning("Generation budget changed", extra={
+            "from_tier": self.tiers[self.level].name, "to_tier": self.tiers[level].name,
+            "pressure": round(pressure, 2)})
+        self.level = level
+        self.changes += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            tier = self.tiers[self.level]
+            return {
+                "enabled": self.enabled,
+                "tier": tier.name,
+                "pressure": round(self.last_pressure, 2),
+                "thresholds": dict(zip((t.name for t in self.tiers[1:]), self.thresholds)),
+                "num_predict": tier.options.get("num_predict") if tier.generate else None,
+                "changes": self.changes
+            }
@@ -0,0 +1,320 @@
+"""
+Request Metrics
+Per-stage timing histograms and counters rendered in the Prometheus text format for /api/metrics
+"""
+
+import bisect
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from ollama_client import GenerateResult
+from structured_log import match_route
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds; wide enough for a cold model load at the top end
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 40.0, 80.0)
+TOKENS_PER_SECOND_BUCKETS = (1, 2, 5, 10, 20, 30, 50, 75, 100, 150, 200, 300)
+PROMPT_TOKEN_BUCKETS = (8, 16, 32, 64, 128, 256, 512, 1024, 2048, 4096)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> LabelValues:
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {_escape(self.documentation)}", f"# TYPE {self.name} {self.kind}"]
+
+    def collect(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """Monotonic counter, one series per label combination"""
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def collect(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+                for key, value in values]
+
+
+class Histogram(_Metric):
+    """Fixed-bucket histogram; observe() is a bisect plus a few adds under a short lock"""
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per series: [count per bucket..., count above the last bucket, sum]
+        self._series: Dict[LabelValues, List[float]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def collect(self) -> List[str]:
+        with self._lock:
+            snapshot = sorted((key, list(series)) for key, series in self._series.items())
+        names = self.labelnames + ("le",)
+        lines = []
+        for key, series in snapshot:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(names, key + (_format_value(bound),))} "
+                             f"{cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(series[-1])}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Gauge(_Metric):
+    """Value read from `callback` at scrape time, so the hot path pays nothing.
+
+    The callback returns a number, or (label values, number) pairs when
+    `labelnames` is set.
+    """
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, callback: Callable[[], Any],
+                 labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self.callback = callback
+
+    def collect(self) -> List[str]:
+        try:
+            value = self.callback()
+        except Exception:
+            return []
+        pairs: Iterable[Tuple[LabelValues, float]] = (
+            value if self.labelnames else [((), value)])
+        return [f"{self.name}{_format_labels(self.labelnames, tuple(map(str, key)))} {_format_value(v)}"
+                for key, v in pairs if v is not None]
+
+
+class Registry:
+    """Ordered set of metrics rendered together"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        # Re-registering replaces, so reloading an app module does not duplicate series
+        with self._lock:
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge(self, name: str, documentation: str, callback: Callable[[], Any],
+              labelnames: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, callback, labelnames))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            samples = metric.collect()
+            if samples:
+                lines.extend(metric.header())
+                lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+http_request_seconds = REGISTRY.histogram(
+    "advice_http_request_duration_seconds",
+    "Whole request from arrival to the last body byte (streams included)",
+    ("route", "method", "status"))
+stage_seconds = REGISTRY.histogram(
+    "advice_stage_duration_seconds",
+    "Per-stage latency: parse, queue_wait, connect, ttft, generate",
+    ("stage",))
+ollama_seconds = REGISTRY.histogram(
+    "ollama_duration_seconds",
+    "Durations reported by Ollama: total, load, prompt_eval, eval",
+    ("phase",))
+ollama_tokens = REGISTRY.counter(
+    "ollama_tokens_total", "Tokens processed by Ollama", ("kind",))
+ollama_tokens_per_second = REGISTRY.histogram(
+    "ollama_eval_tokens_per_second", "Generation speed (eval_count / eval_duration)",
+    buckets=TOKENS_PER_SECOND_BUCKETS)
+ollama_errors = REGISTRY.counter(
+    "ollama_errors_total", "Failed generations by error type", ("type",))
+cache_lookups = REGISTRY.counter(
+    "advice_cache_lookups_total", "Advice cache lookups by outcome (exact, precomputed, semantic, miss)",
+    ("result",))
+fallbacks = REGISTRY.counter(
+    "advice_fallbacks_total", "Responses served from fallback advice", ("route",))
+budget_tiers = REGISTRY.counter(
+    "advice_budget_tier_total", "Generations started (or requests shed) per load budget tier", ("tier",))
+goal_routes = REGISTRY.counter(
+    "advice_goal_route_total", "Advice requests per goal route (template, fast, big) and category",
+    ("route", "category"))
+route_seconds = REGISTRY.histogram(
+    "advice_route_generate_seconds", "Generation time per goal route, to compare fast and big",
+    ("route",))
+prefetches = REGISTRY.counter(
+    "advice_prefetch_total", "Prefetch outcomes: queued, generated, skipped, cancelled, dropped, failed, "
+    "used (a request was answered from it), wasted (never asked for)", ("outcome",))
+structured_tokens = REGISTRY.histogram(
+    "advice_structured_tokens", "Tokens generated per structured (tips) answer, by how it ended "
+    "(early: stopped once the tips were complete, done: the model finished)",
+    ("end",), buckets=PROMPT_TOKEN_BUCKETS)
+prompt_eval_tokens = REGISTRY.histogram(
+    "advice_prompt_eval_tokens", "Prompt tokens Ollama evaluated per generation, by session context "
+    "(reused for follow-ups that continue from a stored context, else none)",
+    ("context",), buckets=PROMPT_TOKEN_BUCKETS)
+prompt_eval_seconds = REGISTRY.histogram(
+    "advice_prompt_eval_seconds", "Prompt evaluation time per generation, by session context (reused, none)",
+    ("context",))
+
+
+def observe_stage(stage: str, started: float):
+    """Record time.monotonic() - `started` for one request stage"""
+    stage_seconds.observe(time.monotonic() - started, stage=stage)
+
+
+def observe_cache_lookup(cache_hit: Optional[Dict[str, Any]]):
+    cache_lookups.inc(result=cache_hit["cache"] if cache_hit is not None else "miss")
+
+
+def observe_generation(result: GenerateResult, context: str = "none"):
+    """Ollama's own timings (nanoseconds) and token counts for one finished generation;
+    `context` is "reused" when it continued from a stored session context"""
+    for phase, duration in (("total", result.total_duration), ("load", result.load_duration),
+                            ("prompt_eval", result.prompt_eval_duration),
+                            ("eval", result.eval_duration)):
+        if duration:
+            ollama_seconds.observe(duration / 1e9, phase=phase)
+    if result.prompt_eval_count:
+        ollama_tokens.inc(result.prompt_eval_count, kind="prompt")
+        prompt_eval_tokens.observe(result.prompt_eval_count, context=context)
+    if result.prompt_eval_duration:
+        prompt_eval_seconds.observe(result.prompt_eval_duration / 1e9, context=context)
+    if result.eval_count:
+        ollama_tokens.inc(result.eval_count, kind="eval")
+        if result.eval_duration:
+            ollama_tokens_per_second.observe(result.eval_count / (result.eval_duration / 1e9))
+
+
+def observe_connect(seconds: float):
+    """OllamaClient on_connect hook: a new upstream connection was opened"""
+    stage_seconds.observe(seconds, stage="connect")
+
+
+class WSGIMetricsMiddleware:
+    """Times every request until its body iterator is closed, so streams count in full"""
+
+    def __init__(self, app, routes: Iterable[str]):
+        self.app = app
+        self.routes = frozenset(routes)
+
+    def __call__(self, environ, start_response):
+        started = time.monotonic()
+        status = ["500"]
+
+        def recording_start_response(status_line, headers, exc_info=None):
+            status[0] = status_line[:3]
+            return start_response(status_line, headers, exc_info)
+
+        body = self.app(environ, recording_start_response)
+        return self._iterate(body, started, status, environ)
+
+    def _iterate(self, body, started: float, status: List[str], environ):
+        try:
+            yield from body
+        finally:
+            close = getattr(body, "close", None)
+            if close is not None:
+                close()
+            http_request_seconds.observe(
+                time.monotonic() - started,
+                route=match_route(environ.get("PATH_INFO", ""), self.routes),
+                method=environ.get("REQUEST_METHOD", ""), status=status[0])
+
+
+class ASGIMetricsMiddleware:
+    """ASGI flavour of WSGIMetricsMiddleware (add with app.add_middleware)"""
+
+    def __init__(self, app, routes: Iterable[str]):
+        self.app = app
+        self.routes = frozenset(routes)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.monotonic()
+        status = ["500"]
+
+        async def recording_send(message):
+            if message["type"] == "http.response.start":
+                status[0] = str(message["status"])
+            await send(message)
+
+        try:
+            await self.app(scope, receive, recording_send)
+        finally:
+            http_request_seconds.observe(
+                time.monotonic() - started,
+                route=match_route(scope.get("path", ""), self.routes),
+                method=scope.get("method", ""), status=status[0])
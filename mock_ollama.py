@@ -0,0 +1,422 @@
+#!/usr/bin/env python3
+"""
+Mock Ollama Server
+Deterministic stand-in for /api/generate, /api/tags, /api/ps and /api/embeddings with
+configurable load time, time-to-first-token, tokens/sec, parallelism and injected failures
+
+    python mock_ollama.py --port 11434 --tokens-per-sec 40 --ttft 0.15 --load-delay 2
+    python mock_ollama.py --error-rate 0.05 --hang-rate 0.01 --empty-rate 0.02
+
+Settings can be changed while running with POST /mock/config (same names as the flags,
+underscored) and inspected with GET /mock/config.
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import random
+import re
+import threading
+import time
+from dataclasses import asdict, dataclass, fields
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+
+from model_keeper import parse_keep_alive
+
+# Advice-shaped vocabulary so responses look like what the app expects
+_TIPS = [
+    "💪 Start small and build the habit a little every day.",
+    "📅 Block a fixed time slot in your calendar and protect it.",
+    "📚 Learn from one good resource instead of ten mediocre ones.",
+    "🎯 Break the goal into weekly milestones you can measure.",
+    "🤝 Find a partner or community to keep you accountable.",
+    "📝 Track your progress in a simple log and review it weekly.",
+    "🌱 Focus on consistency over intensity in the first month.",
+    "⏰ Use a timer and work in short, focused sessions.",
+    "🧘 Rest deliberately so you can keep going for the long run.",
+    "🏆 Celebrate small wins to stay motivated.",
+]
+
+
+@dataclass
+class MockConfig:
+    models: str = "llama3:latest,nomic-embed-text:latest"
+    load_delay: float = 2.0          # seconds to "load" a cold model
+    ttft: float = 0.15               # prompt evaluation before the first token
+    tokens_per_sec: float = 40.0
+    response_tokens: int = 120       # typical answer length, capped by num_predict
+    parallel: int = 4                # like OLLAMA_NUM_PARALLEL
+    max_queue: int = 512             # like OLLAMA_MAX_QUEUE; beyond it requests get 503
+    keep_alive: str = "5m"           # default when a request does not send keep_alive
+    embed_dim: int = 64
+    error_rate: float = 0.0          # HTTP 500
+    hang_rate: float = 0.0           # accept, then never answer for hang_seconds
+    hang_seconds: float = 600.0
+    empty_rate: float = 0.0          # done with an empty response
+    seed: int = 0
+
+    def update(self, values: Dict[str, Any]):
+        known = {f.name: f.type for f in fields(self)}
+        for name, value in values.items():
+            if name not in known:
+                raise ValueError(f"Unknown setting: {name}")
+            setattr(self, name, type(getattr(self, name))(value))
+
+
+def _words(text: str) -> List[str]:
+    return text.lower().split()
+
+
+def embed(text: str, dim: int) -> List[float]:
+    """Hashed bag of words, unit length: similar texts get similar vectors"""
+    vector = [0.0] * dim
+    for word in _words(text):
+        digest = int(hashlib.md5(word.encode("utf-8")).hexdigest(), 16)
+        vector[digest % dim] += 1.0 if (digest >> 64) & 1 else -1.0
+    norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+    return [v / norm for v in vector]
+
+
+def response_tokens(prompt: str, count: int, seed: int) -> List[str]:
+    """Deterministic advice text for `prompt`, split into roughly `count` tokens"""
+    rng = random.Random(f"{seed}:{prompt}")
+    text = "\n".join(rng.sample(_TIPS, k=4))
+    # Each word keeps its leading whitespace, so joining the tokens restores the text
+    tokens = re.findall(r"\s*\S+", text)
+    while tokens and len(tokens) < count:
+        tokens += re.findall(r"\s*\S+", "\n" + text)
+    return tokens[:count]
+
+
+def json_response_tokens(prompt: str, count: int, seed: int, schema: Any) -> List[str]:
+    """`{"tips": [...]}` for a `format` request, holding the schema's maxItems tips.
+
+    Like JSON mode on a real model, the answer runs on with whitespace until
+    `count` tokens once the object is closed.
+    """
+    rng = random.Random(f"{seed}:{prompt}")
+    items = schema.get("properties", {}).get("tips", {}) if isinstance(schema, dict) else {}
+    tips = rng.sample(_TIPS, k=min(int(items.get("maxItems", 4)), len(_TIPS)))
+    tokens = re.findall(r"\s*\S+", json.dumps({"tips": tips}, ensure_ascii=False))
+    return (tokens + ["\n"] * count)[:max(count, len(tokens))]
+
+
+class MockOllama:
+    """Model residency, the parallelism cap and failure injection shared by all handlers"""
+
+    def __init__(self, config: MockConfig):
+        self.config = config
+        self.expires: Dict[str, float] = {}  # model -> unix time it unloads
+        self.loading: Dict[str, threading.Event] = {}
+        self.active = 0
+        self.queued = 0
+        self.requests = 0
+        self._cond = threading.Condition()
+        self._lock = threading.Lock()
+        self._rng = random.Random(config.seed)
+
+    @property
+    def model_names(self) -> List[str]:
+        return [m.strip() for m in self.config.models.split(",") if m.strip()]
+
+    def canonical(self, name: str) -> Optional[str]:
+        """Installed name for `name` ("llama3" -> "llama3:latest"), or None"""
+        names = self.model_names
+        if name in names:
+            return name
+        return f"{name}:latest" if f"{name}:latest" in names else None
+
+    def unload(self, model: str):
+        with self._lock:
+            self.expires.pop(model, None)
+
+    def roll(self) -> Optional[str]:
+        """Injected failure for this request: "error", "hang", "empty" or None"""
+        with self._lock:
+            self.requests += 1
+            draw = self._rng.random()
+        config = self.config
+        for kind, rate in (("error", config.error_rate), ("hang", config.hang_rate),
+                           ("empty", config.empty_rate)):
+            if draw < rate:
+                return kind
+            draw -= rate
+        return None
+
+    def acquire(self) -> bool:
+        with self._cond:
+            if self.active >= self.config.parallel and self.queued >= self.config.max_queue:
+                return False
+            self.queued += 1
+            while self.active >= self.config.parallel:
+                self._cond.wait()
+            self.queued -= 1
+            self.active += 1
+            return True
+
+    def release(self):
+        with self._cond:
+            self.active -= 1
+            self._cond.notify()
+
+    def ensure_loaded(self, model: str, seconds: Optional[float]) -> float:
+        """Load `model` if it is not resident and keep it for `seconds` (None: forever);
+        returns the load time paid by this request"""
+        started = time.monotonic()
+        with self._lock:
+            resident = self.expires.get(model, 0) > time.time()
+            event = self.loading.get(model)
+            owner = not resident and event is None
+            if owner:
+                event = self.loading[model] = threading.Event()
+        if owner:
+            time.sleep(self.config.load_delay)
+            with self._lock:
+                del self.loading[model]
+            event.set()
+        elif event is not None:
+            event.wait()
+        with self._lock:
+            if seconds is None:
+                self.expires[model] = float("inf")
+            elif seconds <= 0:
+                self.expires.pop(model, None)
+            else:
+                self.expires[model] = time.time() + seconds
+        return time.monotonic() - started if owner or event is not None else 0.0
+
+    def running(self) -> List[Dict[str, Any]]:
+        now = time.time()
+        with self._lock:
+            live = {m: t for m, t in self.expires.items() if t > now}
+        return [{
+            "name": model,
+            "model": model,
+            "size_vram": 4_900_000_000,
+            "expires_at": (datetime(9999, 1, 1, tzinfo=timezone.utc) if expires == float("inf")
+                           else datetime.fromtimestamp(expires, timezone.utc)).isoformat(),
+        } for model, expires in live.items()]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {"active": self.active, "queued": self.queued, "requests": self.requests,
+                    "config": asdict(self.config)}
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "MockOllama/1.0"
+    mock: MockOllama
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, payload: Any, status: int = 200):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self) -> Dict[str, Any]:
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def do_GET(self):
+        if self.path == "/api/tags":
+            self._send_json({"models": [
+                {"name": name, "model": name, "size": 4_700_000_000,
+                 "digest": hashlib.sha256(name.encode()).hexdigest(),
+                 "modified_at": "2024-06-01T00:00:00Z"}
+                for name in self.mock.model_names]})
+        elif self.path == "/api/ps":
+            self._send_json({"models": self.mock.running()})
+        elif self.path == "/api/version":
+            self._send_json({"version": "0.0.0-mock"})
+        elif self.path == "/mock/config":
+            self._send_json(self.mock.stats())
+        else:
+            self._send_json({"error": "not found"}, 404)
+
+    def do_POST(self):
+        try:
+            data = self._read_json()
+        except ValueError:
+            self._send_json({"error": "invalid JSON"}, 400)
+            return
+        if self.path == "/api/generate":
+            self._generate(data)
+        elif self.path == "/api/embeddings":
+            self._send_json({"embedding": embed(data.get("prompt", ""), self.mock.config.embed_dim)})
+        elif self.path == "/api/embed":
+            inputs = data.get("input", [])
+            inputs = [inputs] if isinstance(inputs, str) else inputs
+            self._send_json({"model": data.get("model", ""),
+                             "embeddings": [embed(text, self.mock.config.embed_dim) for text in inputs]})
+        elif self.path == "/mock/config":
+            try:
+                self.mock.config.update(data)
+            except (TypeError, ValueError) as e:
+                self._send_json({"error": str(e)}, 400)
+                return
+            self._send_json(self.mock.stats())
+        else:
+            self._send_json({"error": "not found"}, 404)
+
+    def _generate(self, data: Dict[str, Any]):
+        config = self.mock.config
+        model = self.mock.canonical(data.get("model", ""))
+        if model is None:
+            self._send_json({"error": f"model '{data.get('model', '')}' not found, try pulling it first"}, 404)
+            return
+        try:
+            keep_alive = parse_keep_alive(str(data.get("keep_alive", config.keep_alive)))
+        except ValueError as e:
+            self._send_json({"error": str(e)}, 400)
+            return
+        if not data.get("prompt") and keep_alive is not None and keep_alive <= 0:
+            self.mock.unload(model)
+            self._respond(data.get("stream", True), [], {
+                "model": model, "created_at": datetime.now(timezone.utc).isoformat(),
+                "response": "", "done": True, "done_reason": "unload"})
+            return
+        failure = self.mock.roll()
+        if failure == "error":
+            self._send_json({"error": "mock: injected server error"}, 500)
+            return
+        if failure == "hang":
+            time.sleep(config.hang_seconds)
+            return
+        if not self.mock.acquire():
+            self._send_json({"error": "server busy, please try again.  maximum pending requests exceeded"}, 503)
+            return
+        try:
+            self._run_generation(data, model, keep_alive, failure == "empty")
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # client gave up
+        finally:
+            self.mock.release()
+
+    def _run_generation(self, data: Dict[str, Any], model: str, keep_alive: Optional[float],
+                        empty: bool):
+        config = self.mock.config
+        started = time.monotonic()
+        load_seconds = self.mock.ensure_loaded(model, keep_alive)
+        prompt = data.get("prompt", "")
+        stream = data.get("stream", True)
+        options = data.get("options") or {}
+        final = {"model": model, "created_at": datetime.now(timezone.utc).isoformat(), "done": True}
+
+        if not prompt:
+            # Empty prompt only loads the model, like Ollama
+            self._respond(stream, [], {**final, "response": "", "done_reason": "load",
+                                       "load_duration": int(load_seconds * 1e9),
+                                       "total_duration": int((time.monotonic() - started) * 1e9)})
+            return
+
+        num_predict = int(options.get("num_predict", -1))
+        count = config.response_tokens if num_predict < 0 else min(config.response_tokens, num_predict)
+        if empty:
+            tokens = []
+        elif data.get("format"):
+            tokens = json_response_tokens(prompt, count, config.seed, data["format"])
+        else:
+            tokens = response_tokens(prompt, count, config.seed)
+        num_ctx = int(options.get("num_ctx", 2048))
+        prompt_tokens = min(len(_words(prompt)) * 4 // 3 + 1, num_ctx)
+        # A context from an earlier answer is already in the KV cache: only the
+        # new prompt is evaluated, taking that share of the full time-to-first-token
+        context = [int(t) for t in data.get("context") or []][-num_ctx:]
+        prompt_eval_seconds = config.ttft * prompt_tokens / (len(context) + prompt_tokens)
+
+        time.sleep(prompt_eval_seconds)
+        eval_started = time.monotonic()
+        if stream:
+            self._start_stream()
+        for index, token in enumerate(tokens):
+            # Pace against the start so per-token sleep overhead does not accumulate
+            delay = eval_started + (index + 1) / config.tokens_per_sec - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            if stream:
+                self._write_line({"model": model, "created_at": datetime.now(timezone.utc).isoformat(),
+                                  "response": token, "done": False})
+        eval_seconds = time.monotonic() - eval_started
+        final.update({
+            "response": "" if stream else "".join(tokens),
+            "done_reason": "length" if num_predict >= 0 and len(tokens) >= num_predict else "stop",
+            "context": (context + list(range(prompt_tokens + len(tokens))))[-num_ctx:],
+            "total_duration": int((time.monotonic() - started) * 1e9),
+            "load_duration": int(load_seconds * 1e9),
+            "prompt_eval_count": prompt_tokens,
+            "prompt_eval_duration": int(prompt_eval_seconds * 1e9),
+            "eval_count": len(tokens),
+            "eval_duration": int(eval_seconds * 1e9),
+        })
+        if stream:
+            self._write_line(final)
+            self.wfile.write(b"0\r\n\r\n")
+        else:
+            self._send_json(final)
+
+    def _respond(self, stream: bool, lines: List[Dict[str, Any]], final: Dict[str, Any]):
+        if not stream:
+            self._send_json(final)
+            return
+        self._start_stream()
+        for line in lines + [final]:
+            self._write_line(line)
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _start_stream(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+    def _write_line(self, payload: Dict[str, Any]):
+        line = (json.dumps(payload) + "\n").encode("utf-8")
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(line), line))
+        self.wfile.flush()
+
+
+def serve(config: MockConfig, host: str = "127.0.0.1", port: int = 11434) -> ThreadingHTTPServer:
+    """Start the mock in a daemon thread (for scripts and benchmarks); returns the server"""
+    server = _make_server(config, host, port)
+    threading.Thread(target=server.serve_forever, name="mock-ollama", daemon=True).start()
+    return server
+
+
+def _make_server(config: MockConfig, host: str, port: int) -> ThreadingHTTPServer:
+    handler = type("BoundMockHandler", (MockHandler,), {"mock": MockOllama(config)})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Deterministic mock Ollama server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    for field in fields(MockConfig):
+        default = field.default
+        parser.add_argument(f"--{field.name.replace('_', '-')}", dest=field.name,
+                            type=type(default), default=default, help=f"(default: {default})")
+    args = parser.parse_args(argv)
+    config = MockConfig(**{f.name: getattr(args, f.name) for f in fields(MockConfig)})
+    server = _make_server(config, args.host, args.port)
+    print(f"🦙 Mock Ollama on http://{args.host}:{args.port} "
+          f"(models: {config.models}, {config.tokens_per_sec:g} tok/s, parallel {config.parallel})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
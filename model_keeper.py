@@ -0,0 +1,189 @@
+"""
+Model Keeper
+Startup warm-up, keep_alive re-pinning and readiness for the Ollama model
+"""
+
+import logging
+import re
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Sequence
+
+from ollama_client import GenerateResult, OllamaClient, OllamaError, OllamaTimeouts
+
+logger = logging.getLogger(__name__)
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+_FRACTION = re.compile(r"\.(\d{6})\d+")
+
+
+def parse_keep_alive(value: str) -> Optional[float]:
+    """Seconds for an Ollama keep_alive value ("30m", "1h30m", "300"); None means forever"""
+    value = value.strip()
+    if value.startswith("-"):
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION_PART.findall(value)
+    if not parts or "".join(n + u for n, u in parts) != value:
+        raise ValueError(f"Invalid keep_alive duration: {value!r}")
+    return sum(float(n) * _DURATION_UNITS[u] for n, u in parts)
+
+
+def parse_expires_at(value: str) -> Optional[float]:
+    """Unix time for an /api/ps expires_at timestamp (RFC 3339, nanoseconds allowed)"""
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(_FRACTION.sub(r".\1", value.replace("Z", "+00:00")))
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+class ModelKeeper:
+    """Preloads `model`, re-pins it before keep_alive runs out and reports readiness.
+
+    `ready` turns true only once /api/ps shows the model resident, so health
+    checks can keep load balancers away from a cold instance.
+    """
+
+    def __init__(self, client: OllamaClient, model: str, keep_alive: str = "30m",
+                 check_interval: float = 60.0,
+                 load_timeouts: Optional[OllamaTimeouts] = None):
+        self.client = client
+        self.model = model
+        self.keep_alive = keep_alive
+        self.keep_alive_seconds = parse_keep_alive(keep_alive)
+        if self.keep_alive_seconds:
+            check_interval = min(check_interval, max(5.0, self.keep_alive_seconds / 4))
+        self.check_interval = check_interval
+        self.load_timeouts = load_timeouts or OllamaTimeouts(connect=10, first_byte=300, total=300)
+        self.ready = False
+        self.expires_at: Optional[float] = None
+        self.last_pinned_at: Optional[float] = None
+        self.last_load_ms: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.pins = 0
+        self.cold_starts = 0
+        self._started = False
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Start the background keeper once; safe to call on every request"""
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        threading.Thread(target=self._run, name="model-keeper", daemon=True).start()
+
+    def stop(self):
+        self._stop.set()
+
+    def pin(self) -> bool:
+        """Load (or refresh) the model with an empty prompt; returns True when resident"""
+        try:
+            result = self.client.generate("", model=self.model, keep_alive=self.keep_alive,
+                                          timeouts=self.load_timeouts)
+            self.pins += 1
+            self.last_pinned_at = time.time()
+            self.observe(result.load_duration)
+            self.last_error = None
+            return self.check_resident()
+        except OllamaError as e:
+            self.last_error = str(e)
+            self.ready = False
+            logger.warning("Model warm-up failed", extra={"backend": self.client.base_url, "error": str(e)})
+            return False
+
+    def check_resident(self) -> bool:
+        """Refresh `ready` and `expires_at` from /api/ps"""
+        try:
+            running = self.client.ps(timeouts=OllamaTimeouts(connect=5, first_byte=5, total=5)).get(self.model)
+        except OllamaError as e:
+            self.last_error = str(e)
+            self.ready = False
+            return False
+        self.ready = running is not None
+        self.expires_at = parse_expires_at(running.expires_at) if running else None
+        return self.ready
+
+    def observe(self, load_duration_ns: int):
+        """Record a generation's load_duration; a non-trivial one means the model was cold"""
+        if load_duration_ns:
+            self.last_load_ms = round(load_duration_ns / 1e6, 1)
+            if load_duration_ns > 500_000_000:
+                self.cold_starts += 1
+
+    def _needs_pin(self) -> bool:
+        if not self.check_resident():
+            return True
+        if self.expires_at is None or self.keep_alive_seconds is None:
+            return False
+        # Re-pin once less than two check intervals of keep_alive remain
+        return self.expires_at - time.time() < 2 * self.check_interval
+
+    def _run(self):
+        logger.info("Warming up model", extra={"model": self.model, "backend": self.client.base_url,
+                                                "keep_alive": self.keep_alive})
+        while not self._stop.is_set():
+            if self._needs_pin():
+                if self.pin():
+                    logger.info("Model is resident", extra={"model": self.model, "backend": self.client.base_url,
+                                                            "load_ms": self.last_load_ms})
+                    wait = self.check_interval
+                else:
+                    wait = min(5.0, self.check_interval)
+            else:
+                wait = self.check_interval
+            self._stop.wait(wait)
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "backend": self.client.base_url,
+            "model": self.model,
+            "ready": self.ready,
+            "keep_alive": self.keep_alive,
+            "expires_at": self.expires_at,
+            "last_pinned_at": self.last_pinned_at,
+            "last_load_ms": self.last_load_ms,
+            "pins": self.pins,
+            "cold_starts": self.cold_starts,
+            "last_error": self.last_error
+        }
+
+
+class ModelKeeperGroup:
+    """One ModelKeeper per Ollama node; ready once any node has the model resident"""
+
+    def __init__(self, clients: Sequence[OllamaClient], model: str, keep_alive: str = "30m", **kwargs):
+        self.keepers = {client.base_url: ModelKeeper(client, model, keep_alive, **kwargs)
+                        for client in clients}
+
+    @property
+    def ready(self) -> bool:
+        return any(keeper.ready for keeper in self.keepers.values())
+
+    def start(self):
+        for keeper in self.keepers.values():
+            keeper.start()
+
+    def stop(self):
+        for keeper in self.keepers.values():
+            keeper.stop()
+
+    def observe(self, result: GenerateResult):
+        """Attribute a generation's load_duration to the node that served it"""
+        keeper = self.keepers.get(result.backend)
+        if keeper is not None:
+            keeper.observe(result.load_duration)
+
+    def status(self) -> List[Dict[str, Any]]:
+        return [keeper.status() for keeper in self.keepers.values()]
@@ -0,0 +1,587 @@
+"""
+Ollama API Client
+Pooled keep-alive connections with bounded concurrency (sync and asyncio)
+"""
+
+import asyncio
+import json
+import threading
+import time
+from dataclasses import dataclass, field, replace
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, TypeVar, Union
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ReadTimeoutError
+
+T = TypeVar("T")
+
+
+class OllamaError(Exception):
+    """Base error for Ollama API calls"""
+
+
+class OllamaTimeoutError(OllamaError):
+    """Connect, first byte or total deadline exceeded"""
+
+
+class OllamaConnectionError(OllamaError):
+    """Cannot connect to the Ollama server"""
+
+
+class OllamaHTTPError(OllamaError):
+    """Ollama answered with a non-200 status"""
+
+    def __init__(self, status_code: int, body: str):
+        super().__init__(f"HTTP {status_code}: {body}")
+        self.status_code = status_code
+        self.body = body
+
+
+@dataclass(frozen=True)
+class OllamaTimeouts:
+    """Per-phase timeouts in seconds"""
+    connect: float = 10.0
+    first_byte: float = 80.0
+    total: float = 80.0
+
+
+@dataclass
+class GenerateResult:
+    """Final result of /api/generate"""
+    response: str
+    model: str = ""
+    done: bool = True
+    total_duration: int = 0
+    load_duration: int = 0
+    prompt_eval_count: int = 0
+    prompt_eval_duration: int = 0
+    eval_count: int = 0
+    eval_duration: int = 0
+    context: Optional[List[int]] = None
+    backend: str = ""  # base URL of the node that generated it
+    raw: Dict[str, Any] = field(default_factory=dict, repr=False)
+
+    @classmethod
+    def from_json(cls, data: Dict[str, Any], response: Optional[str] = None) -> "GenerateResult":
+        return cls(
+            response=data.get("response", "") if response is None else response,
+            model=data.get("model", ""),
+            done=data.get("done", True),
+            total_duration=data.get("total_duration", 0),
+            load_duration=data.get("load_duration", 0),
+            prompt_eval_count=data.get("prompt_eval_count", 0),
+            prompt_eval_duration=data.get("prompt_eval_duration", 0),
+            eval_count=data.get("eval_count", 0),
+            eval_duration=data.get("eval_duration", 0),
+            context=data.get("context"),
+            raw=data,
+        )
+
+
+@dataclass
+class GenerateChunk:
+    """One streamed piece of /api/generate; `result` is set on the final chunk"""
+    response: str
+    done: bool = False
+    result: Optional[GenerateResult] = None
+
+
+@dataclass
+class ModelInfo:
+    """One entry of /api/tags"""
+    name: str
+    size: int = 0
+    digest: str = ""
+    modified_at: str = ""
+
+
+@dataclass
+class TagsResult:
+    """Result of /api/tags"""
+    models: List[ModelInfo]
+
+    @property
+    def names(self) -> List[str]:
+        return [m.name for m in self.models]
+
+    @classmethod
+    def from_json(cls, data: Dict[str, Any]) -> "TagsResult":
+        return cls(models=[
+            ModelInfo(
+                name=m.get("name", ""),
+                size=m.get("size", 0),
+                digest=m.get("digest", ""),
+                modified_at=m.get("modified_at", ""),
+            )
+            for m in data.get("models", [])
+        ])
+
+
+@dataclass
+class RunningModel:
+    """One entry of /api/ps"""
+    name: str
+    size_vram: int = 0
+    expires_at: str = ""
+
+
+@dataclass
+class PsResult:
+    """Result of /api/ps (models currently loaded in memory)"""
+    models: List[RunningModel]
+
+    @property
+    def names(self) -> List[str]:
+        return [m.name for m in self.models]
+
+    def get(self, name: str) -> Optional[RunningModel]:
+        """The loaded model `name`; an untagged name also matches its `:latest` tag, as Ollama resolves it"""
+        return next((m for m in self.models if m.name in (name, f"{name}:latest")), None)
+
+    @classmethod
+    def from_json(cls, data: Dict[str, Any]) -> "PsResult":
+        return cls(models=[
+            RunningModel(
+                name=m.get("name", ""),
+                size_vram=m.get("size_vram", 0),
+                expires_at=m.get("expires_at", ""),
+            )
+            for m in data.get("models", [])
+        ])
+
+
+@dataclass
+class EmbeddingsResult:
+    """Result of /api/embeddings"""
+    embedding: List[float]
+
+
+@dataclass
+class EmbedBatchResult:
+    """Result of /api/embed (one vector per input)"""
+    embeddings: List[List[float]]
+
+
+def _generate_payload(model: str, prompt: str, stream: bool, options: Optional[Dict[str, Any]],
+                      keep_alive: Optional[str], extra: Dict[str, Any]) -> Dict[str, Any]:
+    data = {"model": model, "prompt": prompt, "stream": stream}
+    if options:
+        data["options"] = options
+    if keep_alive is not None:
+        data["keep_alive"] = keep_alive
+    data.update(extra)
+    return data
+
+
+def _decode_json(body: Union[str, bytes, bytearray], backend: str) -> Dict[str, Any]:
+    """A JSON object from Ollama; anything else (proxy error page, cut-off body) is an OllamaError"""
+    try:
+        data = json.loads(body)
+    except ValueError as e:
+        raise OllamaError(f"Invalid JSON from {backend}: {e}")
+    if not isinstance(data, dict):
+        raise OllamaError(f"Expected a JSON object from {backend}, got {type(data).__name__}")
+    return data
+
+
+def _parse_stream_line(line: str, parts: List[str], backend: str) -> GenerateChunk:
+    chunk = _decode_json(line, backend)
+    if chunk.get("error"):
+        raise OllamaError(chunk["error"])
+    text = chunk.get("response", "")
+    parts.append(text)
+    if chunk.get("done"):
+        result = GenerateResult.from_json(chunk, "".join(parts))
+        result.backend = backend
+        return GenerateChunk(text, True, result)
+    return GenerateChunk(text)
+
+
+def _set_read_timeout(response: requests.Response, seconds: float):
+    # requests fixes the read timeout once per request; narrow it for the next socket read
+    sock = getattr(getattr(response.raw, "connection", None), "sock", None)
+    if sock is not None:
+        sock.settimeout(seconds)
+
+
+def _read_within(response: requests.Response, items: Iterator[T], deadline: float,
+                 read_timeout: float) -> Iterator[T]:
+    """Yield from a body iterator with every socket read ending by the deadline"""
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise OllamaTimeoutError("Total timeout exceeded")
+        _set_read_timeout(response, min(read_timeout, remaining))
+        try:
+            item = next(items)
+        except StopIteration:
+            return
+        yield item
+
+
+def _read_timed_out(error: requests.exceptions.RequestException) -> bool:
+    # A stall mid-body surfaces as ConnectionError wrapping urllib3's ReadTimeoutError
+    return isinstance(error, requests.exceptions.Timeout) or (
+        bool(error.args) and isinstance(error.args[0], ReadTimeoutError))
+
+
+def _stall_error(deadline: float, read_timeout: float) -> OllamaTimeoutError:
+    if time.monotonic() >= deadline:
+        return OllamaTimeoutError("Total timeout exceeded")
+    return OllamaTimeoutError(f"No data within {read_timeout:.0f}s")
+
+
+class _ConnectTimingAdapter(HTTPAdapter):
+    """HTTPAdapter that reports how long each new pooled connection took to open"""
+
+    def __init__(self, on_connect: Callable[[float], None], **kwargs):
+        self._on_connect = on_connect
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        manager = self.poolmanager
+        manager.pool_classes_by_scheme = {
+            scheme: type(pool_cls.__name__, (pool_cls,),
+                         {"ConnectionCls": self._timed(pool_cls.ConnectionCls)})
+            for scheme, pool_cls in manager.pool_classes_by_scheme.items()
+        }
+
+    def _timed(self, connection_cls):
+        on_connect = self._on_connect
+
+        class TimedConnection(connection_cls):
+            def connect(self):
+                started = time.monotonic()
+                super().connect()
+                on_connect(time.monotonic() - started)
+
+        return TimedConnection
+
+
+class OllamaClient:
+    """Thread-safe Ollama client sharing one connection pool"""
+
+    def __init__(self, base_url: str, model: str,
+                 timeouts: Optional[OllamaTimeouts] = None,
+                 max_in_flight: int = 4, pool_size: int = 16,
+                 keep_alive: Optional[str] = None,
+                 on_connect: Optional[Callable[[float], None]] = None):
+        self.base_url = base_url.rstrip("/")
+        self.model = model
+        self.timeouts = timeouts or OllamaTimeouts()
+        self.keep_alive = keep_alive
+        self.max_in_flight = max_in_flight
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self._session = requests.Session()
+        if on_connect is not None:
+            adapter = _ConnectTimingAdapter(on_connect, pool_connections=1, pool_maxsize=pool_size)
+        else:
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+
+    def close(self):
+        self._session.close()
+
+    def _acquire_slot(self, deadline: float):
+        if not self._slots.acquire(timeout=max(0.0, deadline - time.monotonic())):
+            raise OllamaTimeoutError("Timed out waiting for a free generation slot")
+
+    def _request(self, method: str, path: str, timeouts: OllamaTimeouts,
+                 deadline: float, **kwargs) -> requests.Response:
+        read_timeout = min(timeouts.first_byte, max(0.001, deadline - time.monotonic()))
+        try:
+            response = self._session.request(
+                method, f"{self.base_url}{path}", stream=True,
+                timeout=(timeouts.connect, read_timeout), **kwargs)
+        except requests.exceptions.ConnectTimeout:
+            raise OllamaTimeoutError(f"Connect timeout ({timeouts.connect}s)")
+        except requests.exceptions.Timeout:
+            raise OllamaTimeoutError(f"No response within {read_timeout:.0f}s")
+        except requests.exceptions.ConnectionError as e:
+            raise OllamaConnectionError(str(e))
+        if response.status_code != 200:
+            body = response.text
+            response.close()
+            raise OllamaHTTPError(response.status_code, body)
+        return response
+
+    def _read_json(self, response: requests.Response, deadline: float,
+                   read_timeout: float) -> Dict[str, Any]:
+        body = bytearray()
+        try:
+            with response:
+                for block in _read_within(response, response.iter_content(chunk_size=16384),
+                                          deadline, read_timeout):
+                    body.extend(block)
+        except requests.exceptions.RequestException as e:
+            if _read_timed_out(e):
+                raise _stall_error(deadline, read_timeout)
+            raise OllamaConnectionError(str(e))
+        return _decode_json(body, self.base_url)
+
+    def generate(self, prompt: str, options: Optional[Dict[str, Any]] = None,
+                 model: Optional[str] = None, timeouts: Optional[OllamaTimeouts] = None,
+                 **extra) -> GenerateResult:
+        """Non-streaming /api/generate"""
+        timeouts = timeouts or self.timeouts
+        deadline = time.monotonic() + timeouts.total
+        self._acquire_slot(deadline)
+        try:
+            data = _generate_payload(model or self.model, prompt, False, options,
+                                     extra.pop("keep_alive", self.keep_alive), extra)
+            # Non-streaming responses only send headers once generation finishes
+            response = self._request("POST", "/api/generate",
+                                     replace(timeouts, first_byte=timeouts.total),
+                                     deadline, json=data)
+            result = self._read_json(response, deadline, timeouts.total)
+            if result.get("error"):
+                raise OllamaError(result["error"])
+            generated = GenerateResult.from_json(result)
+            generated.backend = self.base_url
+            return generated
+        finally:
+            self._slots.release()
+
+    def generate_stream(self, prompt: str, options: Optional[Dict[str, Any]] = None,
+                        model: Optional[str] = None, timeouts: Optional[OllamaTimeouts] = None,
+                        **extra) -> Iterator[GenerateChunk]:
+        """Streaming /api/generate; closing the iterator aborts the generation"""
+        timeouts = timeouts or self.timeouts
+        deadline = time.monotonic() + timeouts.total
+        self._acquire_slot(deadline)
+        try:
+            data = _generate_payload(model or self.model, prompt, True, options,
+                                     extra.pop("keep_alive", self.keep_alive), extra)
+            response = self._request("POST", "/api/generate", timeouts, deadline, json=data)
+            parts: List[str] = []
+            try:
+                with response:
+                    for line in _read_within(response, response.iter_lines(decode_unicode=True),
+                                             deadline, timeouts.first_byte):
+                        if not line:
+                            continue
+                        chunk = _parse_stream_line(line, parts, self.base_url)
+                        yield chunk
+                        if chunk.done:
+                            return
+            except requests.exceptions.RequestException as e:
+                if _read_timed_out(e):
+                    raise _stall_error(deadline, timeouts.first_byte)
+                raise OllamaConnectionError(str(e))
+            raise OllamaError("Ollama stream ended unexpectedly")
+        finally:
+            self._slots.release()
+
+    def tags(self, timeouts: Optional[OllamaTimeouts] = None) -> TagsResult:
+        """List local models via /api/tags"""
+        timeouts = timeouts or self.timeouts
+        deadline = time.monotonic() + timeouts.total
+        response = self._request("GET", "/api/tags", timeouts, deadline)
+        return TagsResult.from_json(self._read_json(response, deadline, timeouts.first_byte))
+
+    def ps(self, timeouts: Optional[OllamaTimeouts] = None) -> PsResult:
+        """List models loaded in memory via /api/ps"""
+        timeouts = timeouts or self.timeouts
+        deadline = time.monotonic() + timeouts.total
+        response = self._request("GET", "/api/ps", timeouts, deadline)
+        return PsResult.from_json(self._read_json(response, deadline, timeouts.first_byte))
+
+    def embeddings(self, prompt: str, model: Optional[str] = None,
+                   timeouts: Optional[OllamaTimeouts] = None) -> EmbeddingsResult:
+        """Embed one text via /api/embeddings"""
+        timeouts = timeouts or self.timeouts
+        deadline = time.monotonic() + timeouts.total
+        response = self._request("POST", "/api/embeddings", timeouts, deadline,
+                                 json={"model": model or self.model, "prompt": prompt})
+        return EmbeddingsResult(
+            self._read_json(response, deadline, timeouts.first_byte).get("embedding", []))
+
+    def embed_batch(self, inputs: List[str], model: Optional[str] = None,
+                    timeouts: Optional[OllamaTimeouts] = None) -> EmbedBatchResult:
+        """Embed many texts in one call via /api/embed"""
+        timeouts = timeouts or self.timeouts
+        deadline = time.monotonic() + timeouts.total
+        response = self._request("POST", "/api/embed", timeouts, deadline,
+                                 json={"model": model or self.model, "input": inputs})
+        return EmbedBatchResult(
+            self._read_json(response, deadline, timeouts.first_byte).get("embeddings", []))
+
+
+class AsyncOllamaClient:
+    """asyncio Ollama client sharing one httpx connection pool"""
+
+    def __init__(self, base_url: str, model: str,
+                 timeouts: Optional[OllamaTimeouts] = None,
+                 max_in_flight: int = 4, pool_size: int = 100,
+                 keep_alive: Optional[str] = None,
+                 on_connect: Optional[Callable[[float], None]] = None):
+        self.base_url = base_url.rstrip("/")
+        self.model = model
+        self.timeouts = timeouts or OllamaTimeouts()
+        self.keep_alive = keep_alive
+        self.max_in_flight = max_in_flight
+        self.on_connect = on_connect
+        self._slots = asyncio.Semaphore(max_in_flight)
+        self._client = httpx.AsyncClient(
+            base_url=self.base_url,
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+        )
+
+    async def aclose(self):
+        await self._client.aclose()
+
+    def _httpx_timeout(self, timeouts: OllamaTimeouts, read: float) -> httpx.Timeout:
+        return httpx.Timeout(connect=timeouts.connect, read=read, write=timeouts.connect,
+                             pool=timeouts.total)
+
+    async def _acquire_slot(self, deadline: float):
+        try:
+            await asyncio.wait_for(self._slots.acquire(), max(0.0, deadline - time.monotonic()))
+        except asyncio.TimeoutError:
+            raise OllamaTimeoutError("Timed out waiting for a free generation slot")
+
+    def _trace_connect(self):
+        """httpcore trace hook timing TCP connect (and TLS) of a new pooled connection"""
+        started = []
+        done_event = ("connection.start_tls.complete" if self.base_url.startswith("https:")
+                      else "connection.connect_tcp.complete")
+
+        async def trace(event: str, info: Dict[str, Any]):
+            if event == "connection.connect_tcp.started":
+                started.append(time.monotonic())
+            elif event == done_event and started:
+                self.on_connect(time.monotonic() - started[0])
+
+        return trace
+
+    async def _send(self, method: str, path: str, timeouts: OllamaTimeouts,
+                    read: float, **kwargs) -> httpx.Response:
+        if self.on_connect is not None:
+            kwargs["extensions"] = {"trace": self._trace_connect()}
+        request = self._client.build_request(
+            method, path, timeout=self._httpx_timeout(timeouts, read), **kwargs)
+        try:
+            response = await self._client.send(request, stream=True)
+        except httpx.ConnectTimeout:
+            raise OllamaTimeoutError(f"Connect timeout ({timeouts.connect}s)")
+        except httpx.TimeoutException:
+            raise OllamaTimeoutError(f"No response within {read:.0f}s")
+        except httpx.TransportError as e:
+            raise OllamaConnectionError(str(e))
+        if response.status_code != 200:
+            body = (await response.aread()).decode("utf-8", "replace")
+            await response.aclose()
+            raise OllamaHTTPError(response.status_code, body)
+        return response
+
+    async def _request_json(self, method: str, path: str, timeouts: OllamaTimeouts,
+                            read: float, **kwargs) -> Dict[str, Any]:
+        async def run():
+            response = await self._send(method, path, timeouts, read, **kwargs)
+            try:
+                return _decode_json(await response.aread(), self.base_url)
+            except httpx.TimeoutException:
+                raise OllamaTimeoutError("Response body read timeout")
+            except httpx.TransportError as e:
+                raise OllamaConnectionError(str(e))
+            finally:
+                await response.aclose()
+        try:
+            return await asyncio.wait_for(run(), timeouts.total)
+        except asyncio.TimeoutError:
+            raise OllamaTimeoutError("Total timeout exceeded")
+
+    async def generate(self, prompt: str, options: Optional[Dict[str, Any]] = None,
+                       model: Optional[str] = None, timeouts: Optional[OllamaTimeouts] = None,
+                       **extra) -> GenerateResult:
+        """Non-streaming /api/generate"""
+        timeouts = timeouts or self.timeouts
+        deadline = time.monotonic() + timeouts.total
+        await self._acquire_slot(deadline)
+        try:
+            data = _generate_payload(model or self.model, prompt, False, options,
+                                     extra.pop("keep_alive", self.keep_alive), extra)
+            remaining = replace(timeouts, total=max(0.001, deadline - time.monotonic()))
+            result = await self._request_json("POST", "/api/generate", remaining,
+                                              timeouts.total, json=data)
+            if result.get("error"):
+                raise OllamaError(result["error"])
+            generated = GenerateResult.from_json(result)
+            generated.backend = self.base_url
+            return generated
+        finally:
+            self._slots.release()
+
+    async def generate_stream(self, prompt: str, options: Optional[Dict[str, Any]] = None,
+                              model: Optional[str] = None, timeouts: Optional[OllamaTimeouts] = None,
+                              **extra) -> AsyncIterator[GenerateChunk]:
+        """Streaming /api/generate; closing the iterator aborts the generation"""
+        timeouts = timeouts or self.timeouts
+        deadline = time.monotonic() + timeouts.total
+        await self._acquire_slot(deadline)
+        try:
+            data = _generate_payload(model or self.model, prompt, True, options,
+                                     extra.pop("keep_alive", self.keep_alive), extra)
+            response = await self._send("POST", "/api/generate", timeouts,
+                                        timeouts.first_byte, json=data)
+            parts: List[str] = []
+            lines = response.aiter_lines()
+            try:
+                while True:
+                    # httpx bounds each read by first_byte; this bounds it by the deadline too
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise OllamaTimeoutError("Total timeout exceeded")
+                    try:
+                        line = await asyncio.wait_for(lines.__anext__(), remaining)
+                    except StopAsyncIteration:
+                        break
+                    except asyncio.TimeoutError:
+                        raise OllamaTimeoutError("Total timeout exceeded")
+                    if not line:
+                        continue
+                    chunk = _parse_stream_line(line, parts, self.base_url)
+                    yield chunk
+                    if chunk.done:
+                        return
+            except httpx.TimeoutException:
+                raise OllamaTimeoutError(f"No data within {timeouts.first_byte:.0f}s")
+            except httpx.TransportError as e:
+                raise OllamaConnectionError(str(e))
+            finally:
+                await response.aclose()
+            raise OllamaError("Ollama stream ended unexpectedly")
+        finally:
+            self._slots.release()
+
+    async def tags(self, timeouts: Optional[OllamaTimeouts] = None) -> TagsResult:
+        """List local models via /api/tags"""
+        timeouts = timeouts or self.timeouts
+        return TagsResult.from_json(
+            await self._request_json("GET", "/api/tags", timeouts, timeouts.first_byte))
+
+    async def ps(self, timeouts: Optional[OllamaTimeouts] = None) -> PsResult:
+        """List models loaded in memory via /api/ps"""
+        timeouts = timeouts or self.timeouts
+        return PsResult.from_json(
+            await self._request_json("GET", "/api/ps", timeouts, timeouts.first_byte))
+
+    async def embeddings(self, prompt: str, model: Optional[str] = None,
+                         timeouts: Optional[OllamaTimeouts] = None) -> EmbeddingsResult:
+        """Embed one text via /api/embeddings"""
+        timeouts = timeouts or self.timeouts
+        result = await self._request_json("POST", "/api/embeddings", timeouts, timeouts.first_byte,
+                                          json={"model": model or self.model, "prompt": prompt})
+        return EmbeddingsResult(result.get("embedding", []))
+
+    async def embed_batch(self, inputs: List[str], model: Optional[str] = None,
+                          timeouts: Optional[OllamaTimeouts] = None) -> EmbedBatchResult:
+        """Embed many texts in one call via /api/embed"""
+        timeouts = timeouts or self.timeouts
+        result = await self._request_json("POST", "/api/embed", timeouts, timeouts.first_byte,
+                                          json={"model": model or self.model, "input": inputs})
+        return EmbedBatchResult(result.get("embeddings", []))
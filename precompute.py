@@ -0,0 +1,383 @@
+#!/usr/bin/env python3
+"""
+Advice Precomputation
+Offline generation of advice for popular goals into a read-only store with a trigram index
+
+Usage:
+    python precompute.py generate goals.txt --top 5000   # resumable; builds the store at the end
+    python precompute.py build                           # rebuild the store from the checkpoint
+    python precompute.py query "run a 5k"                # fuzzy lookup against the store
+"""
+
+import argparse
+import json
+import logging
+import mmap
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+
+from advice_cache import normalize_goal
+
+logger = logging.getLogger(__name__)
+
+PRECOMPUTED_DIR = os.environ.get("PRECOMPUTED_DIR", "precomputed")
+STORE_VERSION = 1
+# Symlink in the store directory to the live build; builds are never modified once linked
+CURRENT_LINK = "current"
+# Words that negate or reverse a goal. Trigrams barely see them ("stop drinking more water"
+# is 0.82 from "start drinking more water"), so a fuzzy match must agree on all of them
+POLARITY_WORDS = frozenset({
+    "not", "no", "never", "dont", "doesnt", "didnt", "wont", "cant", "cannot", "without", "non",
+    "stop", "quit", "start", "begin", "more", "less", "fewer", "increase", "reduce", "decrease",
+    "cut", "gain", "lose", "early", "earlier", "late", "later",
+    "안", "못", "않기", "말기", "그만", "끊기", "줄이기", "늘리기",
+})
+
+
+def current_dir(path: str) -> Optional[str]:
+    """Directory holding the live store under `path`, or None when there is none.
+
+    Resolved once per open, so a reader keeps using the build it opened while a
+    newer one is linked in. Stores written before versioned builds live in `path`.
+    """
+    link = os.path.join(path, CURRENT_LINK)
+    if os.path.exists(os.path.join(link, "manifest.json")):
+        return os.path.realpath(link)
+    if os.path.exists(os.path.join(path, "manifest.json")):
+        return path
+    return None
+
+
+def goal_trigrams(text: str) -> Set[str]:
+    """Character trigrams of a normalized goal, padded so short words still match"""
+    padded = f"  {normalize_goal(text)} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def polarity_words(text: str) -> Set[str]:
+    """The POLARITY_WORDS in a goal ("don't" counts as "dont")"""
+    words = normalize_goal(text).replace("'", "").replace("\u2019", "").split()
+    return {w.strip(".,!?;:\"()") for w in words} & POLARITY_WORDS
+
+
+class PrecomputedStore:
+    """Read-only advice store with a character-trigram index for fuzzy lookup.
+
+    Each build is a `store-*` directory under the store path, made live by
+    flipping the `current` symlink; it is never rewritten, since a running
+    server has entries.jsonl memory-mapped. Layout of a build:
+        manifest.json        version, model, prompt fingerprint, entry count
+        entries.jsonl        {"goal", "advice"} per entry (memory-mapped on open)
+        entries.idx          uint64 byte offsets into entries.jsonl (count + 1)
+        keys.json            normalized goals in entry order (exact matches)
+        trigrams.json        trigram -> [start, length] into postings.i32
+        postings.i32         entry ids per trigram
+        trigram_counts.i32   distinct trigrams per entry
+
+    Similarity is the Dice coefficient of trigram sets, so lookups cost one
+    bincount over the query's posting lists. Trigrams ignore meaning, so a
+    fuzzy match is also rejected when the goals differ in a negating or
+    reversing word (POLARITY_WORDS).
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(self._file("manifest.json"), encoding="utf-8") as f:
+            manifest = json.load(f)
+        self.model = manifest["model"]
+        self.fingerprint = manifest["fingerprint"]
+        self.count = manifest["count"]
+        self.created_at = manifest.get("created_at")
+        with open(self._file("keys.json"), encoding="utf-8") as f:
+            self._exact: Dict[str, int] = {key: i for i, key in enumerate(json.load(f))}
+        with open(self._file("trigrams.json"), encoding="utf-8") as f:
+            self._trigrams: Dict[str, List[int]] = json.load(f)
+        self._postings = np.fromfile(self._file("postings.i32"), dtype=np.int32)
+        self._gram_counts = np.fromfile(self._file("trigram_counts.i32"), dtype=np.int32)
+        self._offsets = np.fromfile(self._file("entries.idx"), dtype=np.uint64)
+        with open(self._file("entries.jsonl"), "rb") as f:
+            self._entries = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if self.count else b""
+        self.hits = 0
+        self.misses = 0
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    @classmethod
+    def open(cls, path: str, fingerprint: Optional[str] = None) -> Optional["PrecomputedStore"]:
+        """Open the live store under `path`; None when missing or built for another model/prompt"""
+        directory = current_dir(path)
+        if directory is None:
+            return None
+        store = cls(directory)
+        if fingerprint is not None and store.fingerprint != fingerprint:
+            logger.warning("Ignoring precomputed advice built for a different model or prompt",
+                           extra={"path": path})
+            return None
+        logger.info("Loaded precomputed answers", extra={"path": path, "count": store.count})
+        return store
+
+    def entry(self, index: int) -> Dict[str, str]:
+        start, end = int(self._offsets[index]), int(self._offsets[index + 1])
+        return json.loads(self._entries[start:end])
+
+    def lookup(self, goal: str, min_similarity: float = 0.9) -> Optional[Tuple[str, float, str]]:
+        """(advice, similarity, matched goal) for the closest stored goal, or None"""
+        index = self._exact.get(normalize_goal(goal))
+        similarity = 1.0
+        if index is None:
+            index, similarity = self._closest(goal)
+        if index is None or similarity < min_similarity:
+            self.misses += 1
+            return None
+        entry = self.entry(index)
+        if similarity < 1.0 and polarity_words(goal) != polarity_words(entry["goal"]):
+            self.misses += 1  # close in spelling, opposite in meaning
+            return None
+        self.hits += 1
+        return entry["advice"], similarity, entry["goal"]
+
+    def _closest(self, goal: str) -> Tuple[Optional[int], float]:
+        grams = goal_trigrams(goal)
+        spans = [self._trigrams[g] for g in grams if g in self._trigrams]
+        if not spans:
+            return None, 0.0
+        ids = np.concatenate([self._postings[start:start + length] for start, length in spans])
+        overlap = np.bincount(ids, minlength=self.count)
+        scores = 2.0 * overlap / (len(grams) + self._gram_counts)
+        best = int(np.argmax(scores))
+        return best, float(scores[best])
+
+    def stats(self) -> Dict[str, int]:
+        return {"entries": self.count, "hits": self.hits, "misses": self.misses}
+
+
+def write_store(path: str, entries: List[Dict[str, str]], model: str, fingerprint: str):
+    """Write entries ({"goal", "advice"}) as a new PrecomputedStore build under `path` and make it live"""
+    os.makedirs(path, exist_ok=True)
+    build_dir = tempfile.mkdtemp(prefix="store-", dir=path)
+    os.chmod(build_dir, 0o755)
+    _write_build(build_dir, entries, model, fingerprint)
+    previous = current_dir(path)
+    # Atomic flip: readers see the old build or the new one, never a partial one
+    link = os.path.join(path, CURRENT_LINK)
+    tmp_link = f"{link}.{os.getpid()}.tmp"
+    os.symlink(os.path.basename(build_dir), tmp_link)
+    os.replace(tmp_link, link)
+    _remove_old_builds(path, keep={build_dir, previous})
+
+
+def _remove_old_builds(path: str, keep: Set[Optional[str]]):
+    # The previous build stays for servers opening it right now. Removing a
+    # build a server has open is safe: its mapped files live on until closed.
+    keep = {os.path.realpath(build) for build in keep if build is not None}
+    for name in os.listdir(path):
+        build = os.path.join(path, name)
+        if name.startswith("store-") and os.path.realpath(build) not in keep:
+            shutil.rmtree(build, ignore_errors=True)
+    if os.path.realpath(path) not in keep:
+        # Store files from before versioned builds
+        for name in ("manifest.json", "entries.jsonl", "entries.idx", "keys.json", "trigrams.json",
+                     "postings.i32", "trigram_counts.i32"):
+            try:
+                os.remove(os.path.join(path, name))
+            except FileNotFoundError:
+                pass
+
+
+def _write_build(path: str, entries: List[Dict[str, str]], model: str, fingerprint: str):
+    offsets = [0]
+    keys: List[str] = []
+    postings: Dict[str, List[int]] = {}
+    gram_counts: List[int] = []
+    with open(os.path.join(path, "entries.jsonl"), "wb") as f:
+        for i, entry in enumerate(entries):
+            line = (json.dumps({"goal": entry["goal"], "advice": entry["advice"]},
+                               ensure_ascii=False) + "\n").encode("utf-8")
+            f.write(line)
+            offsets.append(offsets[-1] + len(line))
+            keys.append(normalize_goal(entry["goal"]))
+            grams = goal_trigrams(entry["goal"])
+            gram_counts.append(len(grams))
+            for gram in grams:
+                postings.setdefault(gram, []).append(i)
+    np.asarray(offsets, dtype=np.uint64).tofile(os.path.join(path, "entries.idx"))
+    np.asarray(gram_counts, dtype=np.int32).tofile(os.path.join(path, "trigram_counts.i32"))
+    spans: Dict[str, List[int]] = {}
+    flat: List[int] = []
+    for gram in sorted(postings):
+        spans[gram] = [len(flat), len(postings[gram])]
+        flat.extend(postings[gram])
+    np.asarray(flat, dtype=np.int32).tofile(os.path.join(path, "postings.i32"))
+    with open(os.path.join(path, "keys.json"), "w", encoding="utf-8") as f:
+        json.dump(keys, f, ensure_ascii=False)
+    with open(os.path.join(path, "trigrams.json"), "w", encoding="utf-8") as f:
+        json.dump(spans, f, ensure_ascii=False)
+    manifest = {
+        "version": STORE_VERSION,
+        "model": model,
+        "fingerprint": fingerprint,
+        "count": len(entries),
+        "created_at": time.time()
+    }
+    with open(os.path.join(path, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+
+
+def read_goals(paths: Iterable[str], top: Optional[int] = None) -> List[str]:
+    """Goals from text files (one per line) or JSONL request logs ({"goal": ...}), most frequent first"""
+    counts: Counter = Counter()
+    first_seen: Dict[str, str] = {}
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                goal = line
+                if line.startswith("{"):
+                    try:
+                        goal = json.loads(line).get("goal")
+                    except ValueError:
+                        continue
+                if not isinstance(goal, str) or not goal.strip():
+                    continue
+                key = normalize_goal(goal)
+                counts[key] += 1
+                first_seen.setdefault(key, goal.strip())
+    return [first_seen[key] for key, _ in counts.most_common(top)]
+
+
+def read_checkpoint(path: str, fingerprint: str) -> Dict[str, Dict[str, str]]:
+    """Completed entries by normalized goal; lines for another prompt or a torn tail are skipped"""
+    done: Dict[str, Dict[str, str]] = {}
+    if not os.path.exists(path):
+        return done
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if record.get("fingerprint") == fingerprint:
+                done[normalize_goal(record["goal"])] = record
+    return done
+
+
+def generate(goals: List[str], out: str, concurrency: int, urls: List[str]) -> int:
+    """Generate advice for goals missing from the checkpoint; returns the number of failures"""
+    from advice_core import (OLLAMA_KEEP_ALIVE, OLLAMA_MODEL, OLLAMA_OPTIONS,
+                             advice_cache_key, build_advice_prompt)
+    from backend_pool import BackendPool
+    from ollama_client import OllamaClient, OllamaError, OllamaTimeouts
+
+    fingerprint = advice_cache_key("")
+    checkpoint = os.path.join(out, "checkpoint.jsonl")
+    done = read_checkpoint(checkpoint, fingerprint)
+    todo = [goal for goal in goals if normalize_goal(goal) not in done]
+    print(f"🎯 {len(goals)} goals: {len(goals) - len(todo)} already done, {len(todo)} to generate")
+    if not todo:
+        return 0
+
+    timeouts = OllamaTimeouts(connect=10, first_byte=300, total=300)
+    pool = BackendPool([OllamaClient(url, OLLAMA_MODEL, timeouts=timeouts,
+                                     max_in_flight=concurrency, keep_alive=OLLAMA_KEEP_ALIVE)
+                        for url in urls], OLLAMA_MODEL)
+    os.makedirs(out, exist_ok=True)
+    write_lock = threading.Lock()
+    failures = 0
+    start_time = time.time()
+
+    def run(goal: str) -> str:
+        result = pool.generate(build_advice_prompt(goal), options=OLLAMA_OPTIONS)
+        if not result.response.strip():
+            raise OllamaError("Received empty response from Ollama")
+        return result.response.strip()
+
+    with open(checkpoint, "a", encoding="utf-8") as f, \
+            ThreadPoolExecutor(max_workers=concurrency * len(urls)) as executor:
+        futures = {executor.submit(run, goal): goal for goal in todo}
+        for n, future in enumerate(as_completed(futures), 1):
+            goal = futures[future]
+            try:
+                advice = future.result()
+            except OllamaError as e:
+                failures += 1
+                print(f"❌ {goal}: {e}")
+                continue
+            with write_lock:
+                f.write(json.dumps({"goal": goal, "advice": advice, "model": OLLAMA_MODEL,
+                                    "fingerprint": fingerprint}, ensure_ascii=False) + "\n")
+                f.flush()
+            if n % 50 == 0 or n == len(todo):
+                rate = n / max(time.time() - start_time, 1e-9)
+                print(f"⏳ {n}/{len(todo)} ({rate:.1f} goals/s)")
+    pool.close()
+    return failures
+
+
+def build(out: str) -> int:
+    """Rebuild the store in `out` from its checkpoint; returns the entry count"""
+    from advice_core import OLLAMA_MODEL, advice_cache_key
+
+    fingerprint = advice_cache_key("")
+    entries = list(read_checkpoint(os.path.join(out, "checkpoint.jsonl"), fingerprint).values())
+    write_store(out, entries, OLLAMA_MODEL, fingerprint)
+    return len(entries)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Precompute advice for popular goals")
+    parser.add_argument("--out", default=PRECOMPUTED_DIR, help="store directory")
+    sub = parser.add_subparsers(dest="command", required=True)
+    gen = sub.add_parser("generate", help="generate advice for goal lists or request logs")
+    gen.add_argument("paths", nargs="+", help="text files (one goal per line) or JSONL logs")
+    gen.add_argument("--top", type=int, help="only the N most frequent goals")
+    gen.add_argument("--concurrency", type=int, default=4, help="in-flight generations per node")
+    gen.add_argument("--urls", help="comma-separated Ollama URLs (default: OLLAMA_BASE_URLS)")
+    sub.add_parser("build", help="rebuild the store from the checkpoint")
+    query = sub.add_parser("query", help="fuzzy-match a goal against the store")
+    query.add_argument("goal")
+    query.add_argument("--min-similarity", type=float, default=0.0)
+    args = parser.parse_args()
+
+    if args.command == "generate":
+        from advice_core import OLLAMA_BASE_URLS
+        from backend_pool import parse_base_urls
+
+        urls = parse_base_urls(args.urls) if args.urls else OLLAMA_BASE_URLS
+        start_time = time.time()
+        failures = generate(read_goals(args.paths, args.top), args.out, args.concurrency, urls)
+        count = build(args.out)
+        print(f"✅ Store has {count} answers ({failures} failed) after {time.time() - start_time:.1f}s")
+        return 1 if failures else 0
+    if args.command == "build":
+        print(f"✅ Store has {build(args.out)} answers")
+        return 0
+
+    store = PrecomputedStore.open(args.out)
+    if store is None:
+        print(f"❌ No precomputed store in {args.out}")
+        return 1
+    start_time = time.perf_counter()
+    match = store.lookup(args.goal, args.min_similarity)
+    elapsed_us = (time.perf_counter() - start_time) * 1e6
+    if match is None:
+        print(f"No match ({elapsed_us:.0f}µs)")
+        return 1
+    advice, similarity, matched_goal = match
+    print(f"[{similarity:.3f}] {matched_goal} ({elapsed_us:.0f}µs)\n{advice}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,221 @@
+"""
+Advice Prefetch
+Low-priority background generations for goals the user is likely to ask about soon,
+preempted as soon as interactive work needs the backend
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from goal_router import BIG_ROUTE, GoalRoute
+from metrics import prefetches
+from structured_log import begin_request
+
+logger = logging.getLogger(__name__)
+
+# Handler outcomes; deferred items go back to the queue
+PREFETCH_GENERATED = "generated"
+PREFETCH_SKIPPED = "skipped"  # already cached when its turn came
+PREFETCH_CANCELLED = "cancelled"  # preempted mid-generation by interactive load
+PREFETCH_FAILED = "failed"
+PREFETCH_DEFERRED = "deferred"
+
+# Log context route for prefetch generations
+PREFETCH_LOG_ROUTE = "/api/llama-advice/prefetch"
+
+
+@dataclass(frozen=True)
+class PrefetchItem:
+    key: str  # advice cache key the generation fills
+    goal: str
+    route: GoalRoute = BIG_ROUTE
+    use_rag: bool = False
+    queued_at: float = field(default_factory=time.monotonic)
+
+
+class Prefetcher:
+    """Pending goals (newest first: a todo just created is the likeliest next click)
+    drained by a few workers while `can_start()` says the backend is idle.
+
+    Handlers stream their generation and give up when `preempted()` turns true,
+    which closes the Ollama connection and frees the slot at once; the item goes
+    to the back of the queue. Pending items older than `max_age` are dropped
+    unrun. Filled cache keys are remembered for `use_window` seconds: `claim()`
+    from the cache lookup counts a use, expiry without one counts the
+    generation as wasted.
+    """
+
+    def __init__(self, can_start: Callable[[], bool], preempted: Callable[[], bool],
+                 workers: int = 1, max_pending: int = 500, max_age: float = 300.0,
+                 use_window: float = 3600.0, max_filled: int = 10000, poll_interval: float = 0.5):
+        self.can_start = can_start
+        self.preempted = preempted
+        self.workers = workers
+        self.max_pending = max_pending
+        self.max_age = max_age
+        self.use_window = use_window
+        self.max_filled = max_filled
+        self.poll_interval = poll_interval
+        self._pending: "OrderedDict[str, PrefetchItem]" = OrderedDict()
+        self._running: Dict[str, PrefetchItem] = {}
+        self._filled: "OrderedDict[str, float]" = OrderedDict()
+        self._started = False
+        self._stop = threading.Event()
+        self._wakeup = threading.Event()
+        self._tasks: List[asyncio.Task] = []
+        self._lock = threading.Lock()
+
+    def _claim_start(self) -> bool:
+        with self._lock:
+            if self._started:
+                return False
+            self._started = True
+            return True
+
+    def start(self, handler: Callable[[PrefetchItem], str]):
+        """Run prefetches on daemon threads (sync handler); safe to call on every request"""
+        if self._claim_start():
+            for n in range(self.workers):
+                threading.Thread(target=self._run, args=(handler,), name=f"prefetch-{n}", daemon=True).start()
+
+    def start_async(self, handler: Callable[[PrefetchItem], Awaitable[str]]):
+        """Run prefetches as tasks on the running loop (async handler)"""
+        if self._claim_start():
+            self._tasks = [asyncio.ensure_future(self._run_async(handler)) for _ in range(self.workers)]
+
+    async def stop_async(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def stop(self):
+        self._stop.set()
+        self._wakeup.set()
+
+    def submit(self, items: List[PrefetchItem]) -> Tuple[int, int]:
+        """Queue items not already pending, running or filled; returns (queued, skipped)"""
+        queued = skipped = 0
+        with self._lock:
+            for item in items:
+                if item.key in self._pending or item.key in self._running or item.key in self._filled:
+                    skipped += 1
+                    continue
+                self._pending[item.key] = item
+                queued += 1
+                if len(self._pending) > self.max_pending:
+                    self._pending.popitem(last=False)
+                    prefetches.inc(outcome="dropped")
+        if queued:
+            prefetches.inc(queued, outcome="queued")
+            self._wakeup.set()
+        return queued, skipped
+
+    def _next(self) -> Optional[PrefetchItem]:
+        now = time.monotonic()
+        with self._lock:
+            while self._pending and now - next(iter(self._pending.values())).queued_at > self.max_age:
+                self._pending.popitem(last=False)
+                prefetches.inc(outcome="dropped")
+            if not self._pending or not self.can_start():
+                return None
+            key, item = self._pending.popitem()
+            self._running[key] = item
+            return item
+
+    def _settle(self, item: PrefetchItem, outcome: str):
+        with self._lock:
+            del self._running[item.key]
+            if outcome == PREFETCH_DEFERRED:
+                if item.key not in self._pending:
+                    self._pending[item.key] = item
+                return
+            if outcome == PREFETCH_CANCELLED and item.key not in self._pending:
+                # Still worth having: retried last, once everything newer is done
+                self._pending[item.key] = item
+                self._pending.move_to_end(item.key, last=False)
+            if outcome == PREFETCH_GENERATED:
+                self._filled[item.key] = time.monotonic()
+                self._expire_filled()
+        prefetches.inc(outcome=outcome)
+
+    def _expire_filled(self):
+        now = time.monotonic()
+        while self._filled and (len(self._filled) > self.max_filled
+                                or now - next(iter(self._filled.values())) > self.use_window):
+            self._filled.popitem(last=False)
+            prefetches.inc(outcome="wasted")
+
+    def claim(self, key: str) -> bool:
+        """A request was answered from the cache entry for `key`: True the first time
+        that entry came from a prefetch"""
+        with self._lock:
+            if not self._filled or self._filled.pop(key, None) is None:
+                return False
+        prefetches.inc(outcome="used")
+        return True
+
+    def _run(self, handler: Callable[[PrefetchItem], str]):
+        while not self._stop.is_set():
+            item = self._next()
+            if item is None:
+                with self._lock:
+                    self._expire_filled()
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+            begin_request(PREFETCH_LOG_ROUTE, item.key[:16])
+            try:
+                outcome = handler(item)
+            except Exception as e:
+                logger.error("Prefetch failed", extra={"error": f"{type(e).__name__}: {e}"})
+                outcome = PREFETCH_FAILED
+            self._settle(item, outcome)
+            if outcome == PREFETCH_DEFERRED:
+                self._stop.wait(self.poll_interval)
+
+    async def _run_async(self, handler: Callable[[PrefetchItem], Awaitable[str]]):
+        while True:
+            item = self._next()
+            if item is None:
+                with self._lock:
+                    self._expire_filled()
+                await asyncio.sleep(self.poll_interval)
+                continue
+            begin_request(PREFETCH_LOG_ROUTE, item.key[:16])
+            try:
+                outcome = await handler(item)
+            except asyncio.CancelledError:
+                self._settle(item, PREFETCH_DEFERRED)
+                raise
+            except Exception as e:
+                logger.error("Prefetch failed", extra={"error": f"{type(e).__name__}: {e}"})
+                outcome = PREFETCH_FAILED
+            self._settle(item, outcome)
+            if outcome == PREFETCH_DEFERRED:
+                await asyncio.sleep(self.poll_interval)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            pending, running, filled = len(self._pending), len(self._running), len(self._filled)
+        counts = {outcome: int(prefetches.value(outcome=outcome))
+                  for outcome in ("queued", "generated", "skipped", "cancelled", "dropped",
+                                  "failed", "used", "wasted")}
+        settled = counts["used"] + counts["wasted"]
+        attempted = counts["generated"] + counts["cancelled"]
+        return {
+            "workers": self.workers,
+            "pending": pending,
+            "running": running,
+            "awaiting_use": filled,
+            **counts,
+            # Prefetched answers that were asked for, of those whose use window is over
+            "hit_rate": round(counts["used"] / settled, 4) if settled else 0.0,
+            # Generations that never served a request (cancelled midway or unused)
+            "waste_rate": round((counts["cancelled"] + counts["wasted"]) / attempted, 4) if attempted else 0.0
+        }
@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+"""
+RAG Retrieval Engine
+Chunked corpus ingestion and top-k search over a memory-mapped embedding store
+
+Usage:
+    python rag.py ingest corpus/            # add new/changed documents
+    python rag.py query "exercise daily"    # show the top-k chunks
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import sys
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from ollama_client import OllamaClient, OllamaTimeouts
+
+RAG_INDEX_DIR = os.environ.get("RAG_INDEX_DIR", "rag_index")
+RAG_EMBED_MODEL = os.environ.get("OLLAMA_EMBED_MODEL", "nomic-embed-text")
+OLLAMA_BASE_URL = os.environ.get("OLLAMA_BASE_URL", "http://localhost:11434")
+DOCUMENT_EXTENSIONS = (".md", ".txt")
+# Seconds between checks for rows appended by another process
+REFRESH_INTERVAL = 5.0
+
+_PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+
+
+def chunk_text(text: str, max_words: int = 120, overlap: int = 20) -> List[str]:
+    """Split text into ~max_words chunks, keeping paragraphs together where possible"""
+    chunks: List[str] = []
+    current: List[str] = []
+    for paragraph in _PARAGRAPH_BREAK.split(text):
+        words = paragraph.split()
+        if not words:
+            continue
+        if current and len(current) + len(words) > max_words:
+            chunks.append(" ".join(current))
+            current = current[-overlap:] if overlap else []
+        current.extend(words)
+        while len(current) > max_words:
+            chunks.append(" ".join(current[:max_words]))
+            current = current[max_words - overlap:]
+    if current and (not chunks or len(current) > overlap):
+        chunks.append(" ".join(current))
+    return chunks
+
+
+def quantize_int8(vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Symmetric per-row int8 quantization; returns (codes, scales)"""
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+class EmbeddingStore:
+    """Append-only store of unit-normalized float32 vectors plus metadata.
+
+    Layout of the index directory:
+        index.json        dim, row count, embedding model, ingested sources
+        embeddings.f32    row-major float32 matrix (memory-mapped on open)
+        embeddings.i8     int8 copy with per-row scales in scales.f32
+        meta.jsonl        one JSON object per row
+        meta.idx          uint64 byte offsets into meta.jsonl
+
+    Rows are written before index.json is replaced, so readers never see a
+    partially appended batch.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.dim = 0
+        self.count = 0
+        self.model = ""
+        self.sources: Dict[str, str] = {}
+        self._vectors: Optional[np.ndarray] = None
+        self._codes: Optional[np.ndarray] = None
+        self._scales: Optional[np.ndarray] = None
+        self._offsets: Optional[np.ndarray] = None
+        self._index_mtime = 0.0
+        self._lock = threading.Lock()
+        self.refresh()
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def refresh(self) -> bool:
+        """Re-map the files if another process appended rows; returns True when reloaded"""
+        index_file = self._file("index.json")
+        try:
+            mtime = os.stat(index_file).st_mtime
+        except FileNotFoundError:
+            return False
+        if mtime == self._index_mtime:
+            return False
+        with open(index_file, encoding="utf-8") as f:
+            index = json.load(f)
+        with self._lock:
+            self.dim = index["dim"]
+            self.count = index["count"]
+            self.model = index.get("model", "")
+            self.sources = index.get("sources", {})
+            self._index_mtime = mtime
+            self._map()
+        return True
+
+    def _map(self):
+        if self.count == 0:
+            self._vectors = self._codes = self._scales = self._offsets = None
+            return
+        shape = (self.count, self.dim)
+        self._vectors = np.memmap(self._file("embeddings.f32"), dtype=np.float32, mode="r", shape=shape)
+        self._codes = np.memmap(self._file("embeddings.i8"), dtype=np.int8, mode="r", shape=shape)
+        self._scales = np.memmap(self._file("scales.f32"), dtype=np.float32, mode="r", shape=(self.count,))
+        self._offsets = np.memmap(self._file("meta.idx"), dtype=np.uint64, mode="r", shape=(self.count,))
+
+    def append(self, vectors: np.ndarray, metas: List[Dict[str, Any]],
+               model: str, sources: Optional[Dict[str, str]] = None):
+        """Append rows without rewriting existing ones"""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if len(vectors) != len(metas):
+            raise ValueError("vectors and metas must have the same length")
+        if self.count and vectors.shape[1] != self.dim:
+            raise ValueError(f"Embedding dimension {vectors.shape[1]} does not match index ({self.dim})")
+        if self.count and model != self.model:
+            raise ValueError(f"Index was built with '{self.model}', not '{model}'")
+
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        vectors = vectors / norms
+        codes, scales = quantize_int8(vectors)
+
+        os.makedirs(self.path, exist_ok=True)
+        with self._lock:
+            # Truncate any rows left over from an interrupted append
+            self._truncate_to_count()
+            with open(self._file("embeddings.f32"), "ab") as f:
+                f.write(vectors.tobytes())
+            with open(self._file("embeddings.i8"), "ab") as f:
+                f.write(codes.tobytes())
+            with open(self._file("scales.f32"), "ab") as f:
+                f.write(scales.tobytes())
+            offsets = []
+            with open(self._file("meta.jsonl"), "ab") as f:
+                for meta in metas:
+                    offsets.append(f.tell())
+                    f.write(json.dumps(meta, ensure_ascii=False).encode("utf-8") + b"\n")
+            with open(self._file("meta.idx"), "ab") as f:
+                f.write(np.asarray(offsets, dtype=np.uint64).tobytes())
+
+            self.dim = vectors.shape[1]
+            self.count += len(vectors)
+            self.model = model
+            self.sources.update(sources or {})
+            tmp = self._file("index.json.tmp")
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"dim": self.dim, "count": self.count, "model": self.model,
+                           "sources": self.sources}, f, ensure_ascii=False)
+            os.replace(tmp, self._file("index.json"))
+            self._index_mtime = os.stat(self._file("index.json")).st_mtime
+            self._map()
+
+    def _truncate_to_count(self):
+        sizes = {
+            "embeddings.f32": self.count * self.dim * 4,
+            "embeddings.i8": self.count * self.dim,
+            "scales.f32": self.count * 4,
+            "meta.idx": self.count * 8,
+        }
+        for name, size in sizes.items():
+            file_path = self._file(name)
+            if os.path.exists(file_path) and os.path.getsize(file_path) > size:
+                os.truncate(file_path, size)
+        meta_path = self._file("meta.jsonl")
+        if os.path.exists(meta_path):
+            if self.count == 0:
+                os.truncate(meta_path, 0)
+            else:
+                with open(meta_path, "rb") as f:
+                    f.seek(int(self._offsets[-1]))
+                    f.readline()
+                    end = f.tell()
+                if os.path.getsize(meta_path) > end:
+                    os.truncate(meta_path, end)
+
+    def metadata(self, row: int) -> Dict[str, Any]:
+        with open(self._file("meta.jsonl"), "rb") as f:
+            f.seek(int(self._offsets[row]))
+            return json.loads(f.readline())
+
+    def search(self, query: np.ndarray, k: int = 3, quantized: bool = False) -> List[Tuple[float, Dict[str, Any]]]:
+        """Top-k rows by cosine similarity to a unit-normalized query"""
+        with self._lock:
+            if self.count == 0 or query.shape[0] != self.dim:
+                return []
+            query = query.astype(np.float32)
+            if quantized:
+                scores = (self._codes @ query) * self._scales
+            else:
+                scores = self._vectors @ query
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(float(scores[i]), self.metadata(int(i))) for i in top]
+
+
+class RagEngine:
+    """Ingests documents into an EmbeddingStore and retrieves chunks for a goal"""
+
+    def __init__(self, client: Optional[OllamaClient], index_dir: str = RAG_INDEX_DIR,
+                 embed_model: str = RAG_EMBED_MODEL, batch_size: int = 16):
+        self.client = client
+        self.embed_model = embed_model
+        self.batch_size = batch_size
+        self.store = EmbeddingStore(index_dir)
+        self._last_refresh = time.monotonic()
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        if self.client is None:
+            raise RuntimeError("RagEngine has no Ollama client; pass a query vector instead")
+        vectors: List[List[float]] = []
+        for i in range(0, len(texts), self.batch_size):
+            vectors.extend(self.client.embed_batch(texts[i:i + self.batch_size],
+                                                   model=self.embed_model).embeddings)
+        return np.asarray(vectors, dtype=np.float32)
+
+    def ingest(self, paths: Iterable[str]) -> int:
+        """Embed and append every new or changed document; returns chunks added.
+
+        Chunks of an older version of a changed document stay in the files but
+        are filtered out at retrieval time by their digest.
+        """
+        added = 0
+        for path in _iter_documents(paths):
+            with open(path, encoding="utf-8") as f:
+                text = f.read()
+            digest = hashlib.sha1(text.encode("utf-8")).hexdigest()
+            if self.store.sources.get(path) == digest:
+                continue
+            chunks = chunk_text(text)
+            if not chunks:
+                continue
+            vectors = self.embed(chunks)
+            metas = [{"source": path, "digest": digest, "chunk": i, "text": chunk}
+                     for i, chunk in enumerate(chunks)]
+            self.store.append(vectors, metas, self.embed_model, {path: digest})
+            added += len(chunks)
+            print(f"📄 Ingested {path}: {len(chunks)} chunks")
+        return added
+
+    def refresh(self):
+        """Pick up rows another process (`python rag.py ingest`) appended, at most every REFRESH_INTERVAL"""
+        if time.monotonic() - self._last_refresh > REFRESH_INTERVAL:
+            self._last_refresh = time.monotonic()
+            self.store.refresh()
+
+    def retrieve(self, query: str, k: int = 3, vector: Optional[np.ndarray] = None,
+                 quantized: bool = False, min_score: float = 0.0) -> List[Dict[str, Any]]:
+        """Top-k chunks for a query; pass `vector` to reuse an embedding from the same model"""
+        self.refresh()
+        if self.store.count == 0:
+            return []
+        if vector is None:
+            vector = self.embed([query])[0]
+            vector = vector / (np.linalg.norm(vector) or 1.0)
+        chunks = []
+        for score, meta in self.store.search(vector, k * 3, quantized):
+            if score < min_score or self.store.sources.get(meta["source"]) != meta.get("digest"):
+                continue
+            chunks.append({**meta, "score": round(score, 4)})
+            if len(chunks) == k:
+                break
+        return chunks
+
+
+def _iter_documents(paths: Iterable[str]) -> Iterable[str]:
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, files in os.walk(path):
+                for name in sorted(files):
+                    if name.endswith(DOCUMENT_EXTENSIONS):
+                        yield os.path.join(root, name)
+        elif path.endswith(DOCUMENT_EXTENSIONS):
+            yield path
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="RAG index for habit and productivity documents")
+    parser.add_argument("--index", default=RAG_INDEX_DIR, help="index directory")
+    parser.add_argument("--model", default=RAG_EMBED_MODEL, help="Ollama embedding model")
+    sub = parser.add_subparsers(dest="command", required=True)
+    ingest = sub.add_parser("ingest", help="add documents (.md/.txt files or directories)")
+    ingest.add_argument("paths", nargs="+")
+    ingest.add_argument("--batch-size", type=int, default=16)
+    query = sub.add_parser("query", help="show the top-k chunks for a query")
+    query.add_argument("text")
+    query.add_argument("-k", type=int, default=3)
+    query.add_argument("--int8", action="store_true", help="search the quantized copy")
+    args = parser.parse_args()
+
+    client = OllamaClient(OLLAMA_BASE_URL, args.model,
+                          timeouts=OllamaTimeouts(connect=10, first_byte=120, total=300))
+    engine = RagEngine(client, args.index, args.model,
+                       batch_size=getattr(args, "batch_size", 16))
+
+    if args.command == "ingest":
+        start_time = time.time()
+        added = engine.ingest(args.paths)
+        print(f"✅ Added {added} chunks in {time.time() - start_time:.2f}s "
+              f"({engine.store.count} total)")
+    else:
+        for chunk in engine.retrieve(args.text, args.k, quantized=args.int8):
+            print(f"[{chunk['score']:.3f}] {chunk['source']}#{chunk['chunk']}: {chunk['text'][:120]}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
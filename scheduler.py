@@ -0,0 +1,270 @@
+"""
+Admission Control Scheduler
+Bounded priority queue, concurrency limit and per-client token buckets in front of Ollama
+"""
+
+import asyncio
+import heapq
+import itertools
+import threading
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple
+
+from shared_state import SharedState
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 1
+PRIORITY_PREFETCH = 2
+
+PRIORITY_NAMES = {
+    "interactive": PRIORITY_INTERACTIVE,
+    "batch": PRIORITY_BATCH,
+    "prefetch": PRIORITY_PREFETCH,
+}
+
+
+class SchedulerRejected(Exception):
+    """Request was not admitted; `retry_after` is a hint in seconds"""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class RateLimitedError(SchedulerRejected):
+    """Client exceeded its fair share"""
+
+
+class QueueFullError(SchedulerRejected):
+    """Too many requests already waiting"""
+
+
+class QueueTimeoutError(SchedulerRejected):
+    """Waited longer than the queue deadline"""
+
+
+class TokenBucket:
+    """Classic token bucket: `rate` tokens per second up to `burst`"""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self) -> float:
+        """Consume one token; returns 0 on success or seconds until one is available"""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return 0.0
+        return (1.0 - self.tokens) / self.rate
+
+
+def take_shared_token(state: Optional[str], rate: float, burst: float) -> Tuple[str, float]:
+    """TokenBucket.take over a stored "tokens updated_at" pair; wall-clock time, so
+    every process on the host agrees. Returns (new state, wait)."""
+    now = time.time()
+    tokens, updated = (float(v) for v in state.split()) if state else (burst, now)
+    tokens = min(burst, tokens + max(0.0, now - updated) * rate)
+    wait = 0.0
+    if tokens >= 1.0:
+        tokens -= 1.0
+    else:
+        wait = (1.0 - tokens) / rate
+    return f"{tokens:.6f} {now:.6f}", wait
+
+
+class _Waiter:
+    __slots__ = ("priority", "event", "future", "loop", "granted", "cancelled", "enqueued_at")
+
+    def __init__(self, priority: int, loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.priority = priority
+        self.loop = loop
+        self.event = None if loop else threading.Event()
+        self.future = loop.create_future() if loop else None
+        self.granted = False
+        self.cancelled = False
+        self.enqueued_at = time.monotonic()
+
+    def wake(self):
+        if self.loop is None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(_resolve, self.future)
+
+
+def _resolve(future: asyncio.Future):
+    if not future.done():
+        future.set_result(None)
+
+
+class Scheduler:
+    """Admits at most `concurrency` generations; the rest wait in priority order.
+
+    Waiters are served lowest priority value first, FIFO within a class. A
+    waiter that is not admitted before its deadline is rejected so callers can
+    answer quickly instead of queueing invisibly inside Ollama.
+
+    With `shared` set, client buckets live in the host-wide store so a client
+    gets one rate however many worker processes its requests land on; buckets
+    expire once they would have refilled. Slots and the queue stay per process.
+    """
+
+    def __init__(self, concurrency: int = 4, max_queue: int = 64,
+                 queue_timeout: float = 10.0, client_rate: float = 0.5,
+                 client_burst: float = 5.0, max_clients: int = 10000,
+                 shared: Optional[SharedState] = None):
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.client_rate = client_rate
+        self.client_burst = client_burst
+        self.max_clients = max_clients
+        self.shared = shared
+        self.active = 0
+        self.admitted = 0
+        self.rejected = {"rate_limited": 0, "queue_full": 0, "queue_timeout": 0}
+        self._service_time = 5.0  # EWMA of slot hold time, seeds Retry-After
+        self._queue: List[Any] = []
+        self._queued = 0
+        self._seq = itertools.count()
+        self._buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def check_rate(self, client_id: str):
+        """Charge one request to the client's bucket or raise RateLimitedError"""
+        if self.shared is not None:
+            wait = self.shared.update(
+                "rate", client_id, lambda state: take_shared_token(state, self.client_rate, self.client_burst),
+                ttl=self.client_burst / self.client_rate)
+            if wait is not None:
+                if wait:
+                    with self._lock:
+                        self.rejected["rate_limited"] += 1
+                    raise RateLimitedError("Too many requests", wait)
+                return
+        with self._lock:
+            bucket = self._buckets.get(client_id)
+            if bucket is None:
+                bucket = self._buckets[client_id] = TokenBucket(self.client_rate, self.client_burst)
+                if len(self._buckets) > self.max_clients:
+                    self._buckets.popitem(last=False)
+            self._buckets.move_to_end(client_id)
+            wait = bucket.take()
+            if wait:
+                self.rejected["rate_limited"] += 1
+                raise RateLimitedError("Too many requests", wait)
+
+    def _retry_after(self) -> float:
+        return max(1.0, self._service_time * (self._queued + 1) / self.concurrency)
+
+    def _enqueue(self, priority: int, loop: Optional[asyncio.AbstractEventLoop]) -> Optional[_Waiter]:
+        """Take a free slot (returns None) or queue a waiter"""
+        with self._lock:
+            if self.active < self.concurrency and not self._queued:
+                self.active += 1
+                self.admitted += 1
+                return None
+            if self._queued >= self.max_queue:
+                self.rejected["queue_full"] += 1
+                raise QueueFullError("Server is busy, queue is full", self._retry_after())
+            waiter = _Waiter(priority, loop)
+            heapq.heappush(self._queue, (priority, next(self._seq), waiter))
+            self._queued += 1
+            return waiter
+
+    def _abandon(self, waiter: _Waiter, timed_out: bool = True) -> bool:
+        """Give up on a queued waiter; returns False if it was granted meanwhile"""
+        with self._lock:
+            if waiter.granted:
+                return False
+            waiter.cancelled = True
+            self._queued -= 1
+            if timed_out:
+                self.rejected["queue_timeout"] += 1
+            return True
+
+    def acquire(self, priority: int = PRIORITY_INTERACTIVE, timeout: Optional[float] = None):
+        """Block until a slot is free, or raise QueueFullError / QueueTimeoutError"""
+        waiter = self._enqueue(priority, None)
+        if waiter is None:
+            return
+        waiter.event.wait(self.queue_timeout if timeout is None else timeout)
+        if self._abandon(waiter):
+            raise QueueTimeoutError("Server is busy, timed out in queue", self._retry_after())
+
+    async def acquire_async(self, priority: int = PRIORITY_INTERACTIVE, timeout: Optional[float] = None):
+        """asyncio flavour of acquire(); waiting does not hold a thread"""
+        waiter = self._enqueue(priority, asyncio.get_running_loop())
+        if waiter is None:
+            return
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future),
+                                   self.queue_timeout if timeout is None else timeout)
+        except asyncio.TimeoutError:
+            pass
+        except asyncio.CancelledError:
+            if not self._abandon(waiter, timed_out=False):
+                self.release()
+            raise
+        if self._abandon(waiter):
+            raise QueueTimeoutError("Server is busy, timed out in queue", self._retry_after())
+
+    def release(self, held_for: Optional[float] = None):
+        with self._lock:
+            if held_for is not None:
+                self._service_time = 0.8 * self._service_time + 0.2 * held_for
+            self.active -= 1
+            while self._queue:
+                _, _, waiter = heapq.heappop(self._queue)
+                if waiter.cancelled:
+                    continue
+                waiter.granted = True
+                self._queued -= 1
+                self.active += 1
+                self.admitted += 1
+                waiter.wake()
+                break
+
+    @contextmanager
+    def slot(self, priority: int = PRIORITY_INTERACTIVE, timeout: Optional[float] = None) -> Iterator[None]:
+        self.acquire(priority, timeout)
+        start_time = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(time.monotonic() - start_time)
+
+    @asynccontextmanager
+    async def slot_async(self, priority: int = PRIORITY_INTERACTIVE,
+                         timeout: Optional[float] = None) -> AsyncIterator[None]:
+        await self.acquire_async(priority, timeout)
+        start_time = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(time.monotonic() - start_time)
+
+    def queue_depth(self, max_priority: Optional[int] = None) -> int:
+        """Waiting requests, optionally only those at or above a priority class"""
+        with self._lock:
+            return sum(1 for p, _, w in self._queue
+                       if not w.cancelled and (max_priority is None or p <= max_priority))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "active": self.active,
+                "concurrency": self.concurrency,
+                "queued": self._queued,
+                "max_queue": self.max_queue,
+                "admitted": self.admitted,
+                "rejected": dict(self.rejected),
+                "avg_service_time": round(self._service_time, 3),
+                "clients": len(self._buckets)
+            }
@@ -0,0 +1,99 @@
+"""
+Semantic Cache
+Reuses advice for near-duplicate goals via cosine similarity of goal embeddings
+"""
+
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+class SemanticCache:
+    """Fixed-capacity matrix of unit-normalized goal vectors with top-1 lookup.
+
+    Rows are preallocated so a lookup is one matrix-vector product; when the
+    cache is full an expired row, or else the least recently used one, is
+    overwritten. Every row is tagged with the fingerprint of what generated
+    it (model, prompt, options) and a lookup only scores rows carrying the
+    caller's, so each fingerprint is its own index. Rows expire `ttl` seconds
+    after they were added, however often they are hit.
+    """
+
+    def __init__(self, capacity: int = 512, threshold: float = 0.92, ttl: float = 86400.0):
+        self.capacity = capacity
+        self.threshold = threshold
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._vectors: Optional[np.ndarray] = None
+        self._last_used = np.zeros(capacity, dtype=np.float64)
+        self._expires_at = np.zeros(capacity, dtype=np.float64)
+        self._tags = np.full(capacity, -1, dtype=np.int32)
+        self._tag_ids: Dict[str, int] = {}
+        self._goals: List[Optional[str]] = [None] * capacity
+        self._advice: List[Optional[str]] = [None] * capacity
+        self._size = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def normalize(vector: Sequence[float]) -> Optional[np.ndarray]:
+        """Convert an embedding into a unit-length float32 vector"""
+        array = np.asarray(vector, dtype=np.float32)
+        norm = float(np.linalg.norm(array))
+        if array.ndim != 1 or norm == 0.0:
+            return None
+        return array / norm
+
+    def lookup(self, vector: np.ndarray, fingerprint: str) -> Optional[Tuple[str, float, str, float]]:
+        """Return (advice, similarity, cached goal, expires_at) of the best live match
+        generated under `fingerprint` above the threshold"""
+        with self._lock:
+            tag = self._tag_ids.get(fingerprint)
+            if (tag is None or self._size == 0 or self._vectors is None
+                    or self._vectors.shape[1] != vector.shape[0]):
+                self.misses += 1
+                return None
+            live = (self._tags[:self._size] == tag) & (self._expires_at[:self._size] > time.time())
+            scores = np.where(live, self._vectors[:self._size] @ vector, -np.inf)
+            best = int(np.argmax(scores))
+            similarity = float(scores[best])
+            if similarity < self.threshold:
+                self.misses += 1
+                return None
+            self._last_used[best] = time.monotonic()
+            self.hits += 1
+            return self._advice[best], similarity, self._goals[best], float(self._expires_at[best])
+
+    def add(self, vector: np.ndarray, fingerprint: str, goal: str, advice: str):
+        with self._lock:
+            if self._vectors is None or self._vectors.shape[1] != vector.shape[0]:
+                # First insert, or the embedding model changed: start over
+                self._vectors = np.zeros((self.capacity, vector.shape[0]), dtype=np.float32)
+                self._size = 0
+            if self._size < self.capacity:
+                row = self._size
+                self._size += 1
+            else:
+                expired = self._expires_at <= time.time()
+                row = int(np.argmax(expired)) if expired.any() else int(np.argmin(self._last_used))
+            self._vectors[row] = vector
+            self._last_used[row] = time.monotonic()
+            self._expires_at[row] = time.time() + self.ttl
+            self._tags[row] = self._tag_ids.setdefault(fingerprint, len(self._tag_ids))
+            self._goals[row] = goal
+            self._advice[row] = advice
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "size": self._size,
+                "capacity": self.capacity,
+                "threshold": self.threshold,
+                "ttl": self.ttl
+            }
@@ -0,0 +1,147 @@
+"""
+Advice Sessions
+Keeps the context Ollama returns with each answer so follow-ups continue from it
+instead of re-evaluating the whole prompt
+"""
+
+import threading
+import time
+import uuid
+from array import array
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional
+
+from goal_router import BIG_ROUTE, GoalRoute
+from ollama_client import GenerateResult
+
+
+@dataclass
+class Session:
+    """One conversation about a goal; `context` is None when the last answer left none to reuse"""
+    id: str
+    goal: str
+    advice: str
+    route: GoalRoute = BIG_ROUTE
+    context: Optional[array] = None
+    backend: Optional[str] = None
+    turns: int = 1
+    last_used: float = field(default_factory=time.monotonic)
+
+    @property
+    def tokens(self) -> int:
+        return len(self.context) if self.context is not None else 0
+
+    def generate_kwargs(self) -> Dict[str, Any]:
+        """Extra generate() arguments: the stored context, on the node whose KV cache holds it"""
+        if self.context is None:
+            return {}
+        return {"context": self.context.tolist(), "prefer": self.backend}
+
+
+class SessionStore:
+    """Thread-safe LRU of sessions, bounded by count and by stored context tokens.
+
+    Contexts are kept as int32 arrays (4 bytes a token instead of a Python int
+    each). Sessions idle for `idle_ttl` seconds are dropped on the next access.
+    A context longer than `max_context_tokens` is not kept: continuing from it
+    would overflow num_ctx, and Ollama would silently cut off the start of the
+    conversation, so the follow-up is built from the last answer's text instead.
+    """
+
+    def __init__(self, max_sessions: int = 10000, max_tokens: int = 2_000_000,
+                 idle_ttl: float = 900.0, max_context_tokens: int = 768):
+        self.max_sessions = max_sessions
+        self.max_tokens = max_tokens
+        self.idle_ttl = idle_ttl
+        self.max_context_tokens = max_context_tokens
+        self.tokens = 0
+        self.created = 0
+        self.follow_ups = 0
+        self.reused = 0
+        self.expired = 0
+        self.evicted = 0
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def create(self, goal: str, advice: str, route: GoalRoute = BIG_ROUTE,
+               result: Optional[GenerateResult] = None) -> Session:
+        session = Session(uuid.uuid4().hex, goal, advice, route)
+        with self._lock:
+            self._set_context(session, result)
+            self._sessions[session.id] = session
+            self.created += 1
+            self._evict()
+        return session
+
+    def get(self, session_id: str) -> Optional[Session]:
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            session = self._sessions.get(session_id)
+            if session is None:
+                return None
+            session.last_used = now
+            self._sessions.move_to_end(session_id)
+            return session
+
+    def record(self, session: Session, advice: str, result: Optional[GenerateResult],
+               reused: bool):
+        """A follow-up answer: it becomes the session's last answer and context"""
+        with self._lock:
+            self.follow_ups += 1
+            if reused:
+                self.reused += 1
+            if session.id not in self._sessions:
+                return  # evicted while the follow-up was generating
+            session.advice = advice
+            session.turns += 1
+            session.last_used = time.monotonic()
+            self._set_context(session, result)
+            self._sessions.move_to_end(session.id)
+            self._evict()
+
+    def _set_context(self, session: Session, result: Optional[GenerateResult]):
+        self.tokens -= session.tokens
+        session.context, session.backend = None, None
+        if result is not None and result.context and len(result.context) <= self.max_context_tokens:
+            session.context = array("i", result.context)
+            session.backend = result.backend or None
+        self.tokens += session.tokens
+
+    def _drop(self, session_id: str):
+        self.tokens -= self._sessions.pop(session_id).tokens
+
+    def _expire(self, now: float):
+        # Oldest first: stop at the first session still in use
+        while self._sessions:
+            session = next(iter(self._sessions.values()))
+            if now - session.last_used < self.idle_ttl:
+                return
+            self._drop(session.id)
+            self.expired += 1
+
+    def _evict(self):
+        self._expire(time.monotonic())
+        while len(self._sessions) > self.max_sessions or (self.tokens > self.max_tokens
+                                                          and len(self._sessions) > 1):
+            self._drop(next(iter(self._sessions)))
+            self.evicted += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "context_tokens": self.tokens,
+                "max_sessions": self.max_sessions,
+                "max_tokens": self.max_tokens,
+                "idle_ttl": self.idle_ttl,
+                "created": self.created,
+                "follow_ups": self.follow_ups,
+                "context_reused": self.reused,
+                "expired": self.expired,
+                "evicted": self.evicted
+            }
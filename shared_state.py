@@ -0,0 +1,167 @@
+"""
+Shared State
+Host-wide key/value store on one SQLite file (WAL, memory-mapped) so every worker
+process sees the same rate limits, circuit state and Ollama status
+"""
+
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Writes between sweeps of expired and excess entries
+EVICT_EVERY = 256
+
+
+class SharedState:
+    """Namespaced string entries with a TTL, shared through one SQLite file.
+
+    Every worker on the host opens the same `db_path`; WAL lets readers run
+    beside the single writer, and reads go through the memory map, so the
+    pages are held once in the page cache however many workers there are.
+    Read-modify-write goes through `update()` inside BEGIN IMMEDIATE, so two
+    processes never both act on the same old value. Expired entries are never
+    returned and are swept every EVICT_EVERY writes, along with the entries
+    closest to expiry once there are more than `max_entries`.
+
+    No operation raises on a SQLite error (locked past `timeout`, disk full,
+    file removed): it is logged and counted, and the caller gets the default
+    it passed, which keeps that piece of state per-process.
+    """
+
+    def __init__(self, db_path: str, max_entries: int = 100000, timeout: float = 0.5,
+                 mmap_size: int = 64 * 1024 * 1024):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self.mmap_size = mmap_size
+        self.errors = 0
+        self._writes = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self._connect()
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS shared_state ("
+            "namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, "
+            "expires_at REAL NOT NULL, PRIMARY KEY (namespace, key))")
+        self._db.execute("CREATE INDEX IF NOT EXISTS shared_state_expiry ON shared_state (expires_at)")
+
+    @classmethod
+    def open(cls, db_path: Optional[str], **kwargs: Any) -> Optional["SharedState"]:
+        """The store at `db_path`, or None (per-process state) when unset or unusable"""
+        if not db_path:
+            return None
+        try:
+            return cls(db_path, **kwargs)
+        except (OSError, sqlite3.Error) as e:
+            logger.warning("Shared state unavailable, keeping state per process",
+                           extra={"path": db_path, "error": str(e)})
+            return None
+
+    def _connect(self):
+        # Autocommit, with explicit transactions where a read and a write must be atomic
+        self._db = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None,
+                                   timeout=self.timeout)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(f"PRAGMA mmap_size={int(self.mmap_size)}")
+        self._pid = os.getpid()
+
+    @property
+    def owner(self) -> str:
+        return f"{socket.gethostname()}:{os.getpid()}"
+
+    def _run(self, work: Callable[[], Any], default: Any = None, write: bool = False) -> Any:
+        with self._lock:
+            try:
+                if self._pid != os.getpid():
+                    # Opened before the server forked its workers: a connection must not cross a fork
+                    self._connect()
+                if not write:
+                    return work()
+                self._db.execute("BEGIN IMMEDIATE")
+                try:
+                    result = work()
+                except BaseException:
+                    self._db.execute("ROLLBACK")
+                    raise
+                self._db.execute("COMMIT")
+                self._writes += 1
+                if self._writes % EVICT_EVERY == 0:
+                    self._evict()
+                return result
+            except sqlite3.Error as e:
+                self.errors += 1
+                logger.warning("Shared state operation failed", extra={"error": str(e)})
+                return default
+
+    def _read(self, namespace: str, key: str) -> Optional[str]:
+        row = self._db.execute(
+            "SELECT value FROM shared_state WHERE namespace = ? AND key = ? AND expires_at > ?",
+            (namespace, key, time.time())).fetchone()
+        return row[0] if row is not None else None
+
+    def _write(self, namespace: str, key: str, value: str, ttl: float):
+        self._db.execute(
+            "INSERT OR REPLACE INTO shared_state (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)",
+            (namespace, key, value, time.time() + ttl))
+
+    def get(self, namespace: str, key: str) -> Optional[str]:
+        return self._run(lambda: self._read(namespace, key))
+
+    def set(self, namespace: str, key: str, value: str, ttl: float):
+        self._run(lambda: self._write(namespace, key, value, ttl), write=True)
+
+    def delete(self, namespace: str, key: str):
+        self._run(lambda: self._db.execute(
+            "DELETE FROM shared_state WHERE namespace = ? AND key = ?", (namespace, key)), write=True)
+
+    def update(self, namespace: str, key: str, apply: Callable[[Optional[str]], Tuple[str, Any]],
+               ttl: float, default: Any = None) -> Any:
+        """Atomic read-modify-write: `apply(current or None)` returns (new value, result)"""
+
+        def work():
+            value, result = apply(self._read(namespace, key))
+            self._write(namespace, key, value, ttl)
+            return result
+        return self._run(work, default, write=True)
+
+    def lease(self, namespace: str, key: str, ttl: float) -> bool:
+        """Take or renew a lease held by at most one process; True while this one holds it.
+
+        True as well when the store fails, so the work is done per process rather than not at all.
+        """
+        owner = self.owner
+
+        def work():
+            holder = self._read(namespace, key)
+            if holder is not None and holder != owner:
+                return False
+            self._write(namespace, key, owner, ttl)
+            return True
+        return self._run(work, True, write=True)
+
+    def _evict(self):
+        self._db.execute("DELETE FROM shared_state WHERE expires_at <= ?", (time.time(),))
+        excess = self._db.execute("SELECT COUNT(*) FROM shared_state").fetchone()[0] - self.max_entries
+        if excess > 0:
+            self._db.execute(
+                "DELETE FROM shared_state WHERE rowid IN "
+                "(SELECT rowid FROM shared_state ORDER BY expires_at LIMIT ?)", (excess,))
+
+    def stats(self) -> Dict[str, Any]:
+        def work():
+            # Live entries only; expired rows linger until the next sweep
+            return self._db.execute(
+                "SELECT COUNT(*) FROM shared_state WHERE expires_at > ?", (time.time(),)).fetchone()[0]
+        return {
+            "path": self.db_path,
+            "entries": self._run(work),
+            "max_entries": self.max_entries,
+            "errors": self.errors
+        }
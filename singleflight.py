@@ -0,0 +1,225 @@
+"""
+Single-Flight Request Coalescing
+Concurrent callers with the same key share one upstream call or token stream
+"""
+
+import asyncio
+import threading
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, List, Optional, Tuple
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Deduplicates concurrent blocking calls by key"""
+
+    def __init__(self):
+        self.leaders = 0
+        self.coalesced = 0
+        self._calls: Dict[str, _Call] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """Run fn once per key at a time; returns (result, shared)"""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self.coalesced += 1
+                leader = False
+            else:
+                call = self._calls[key] = _Call()
+                self.leaders += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "leaders": self.leaders,
+                "coalesced": self.coalesced,
+                "in_flight": len(self._calls)
+            }
+
+
+class _Broadcast:
+    def __init__(self):
+        self.items: List[Any] = []
+        self.finished = False
+        self.cond = threading.Condition()
+
+
+class StreamFlight:
+    """Shares one upstream stream per key between concurrent subscribers.
+
+    The upstream iterator is drained by a background thread into a buffer, so
+    a subscriber that joins midway first replays the buffered items and then
+    follows live, and a disconnecting subscriber never stalls the others.
+    """
+
+    def __init__(self):
+        self.leaders = 0
+        self.coalesced = 0
+        self._streams: Dict[str, _Broadcast] = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, key: str, source: Callable[[], Iterator[Any]]) -> Tuple[Iterator[Any], bool]:
+        """Returns (items iterator, shared) for the stream identified by key"""
+        with self._lock:
+            broadcast = self._streams.get(key)
+            shared = broadcast is not None
+            if shared:
+                self.coalesced += 1
+            else:
+                broadcast = self._streams[key] = _Broadcast()
+                self.leaders += 1
+                threading.Thread(target=self._pump, args=(key, broadcast, source),
+                                 name=f"stream-flight-{key[:8]}", daemon=True).start()
+        return self._follow(broadcast), shared
+
+    def _pump(self, key: str, broadcast: _Broadcast, source: Callable[[], Iterator[Any]]):
+        try:
+            for item in source():
+                with broadcast.cond:
+                    broadcast.items.append(item)
+                    broadcast.cond.notify_all()
+        finally:
+            with self._lock:
+                del self._streams[key]
+            with broadcast.cond:
+                broadcast.finished = True
+                broadcast.cond.notify_all()
+
+    @staticmethod
+    def _follow(broadcast: _Broadcast) -> Iterator[Any]:
+        index = 0
+        while True:
+            with broadcast.cond:
+                while index >= len(broadcast.items) and not broadcast.finished:
+                    broadcast.cond.wait()
+                pending = broadcast.items[index:]
+                finished = broadcast.finished
+            index += len(pending)
+            yield from pending
+            if finished and index >= len(broadcast.items):
+                return
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "leaders": self.leaders,
+                "coalesced": self.coalesced,
+                "in_flight": len(self._streams)
+            }
+
+
+class AsyncSingleFlight:
+    """asyncio flavour of SingleFlight; all callers must share one event loop"""
+
+    def __init__(self):
+        self.leaders = 0
+        self.coalesced = 0
+        self._calls: Dict[str, asyncio.Future] = {}
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """Await fn once per key at a time; returns (result, shared)"""
+        future = self._calls.get(key)
+        if future is not None:
+            self.coalesced += 1
+            # Shield so one cancelled waiter does not cancel everyone's result
+            return await asyncio.shield(future), True
+
+        self.leaders += 1
+        future = self._calls[key] = asyncio.ensure_future(fn())
+        future.add_done_callback(lambda _: self._calls.pop(key, None))
+        return await asyncio.shield(future), False
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+            "in_flight": len(self._calls)
+        }
+
+
+class _AsyncBroadcast:
+    def __init__(self):
+        self.items: List[Any] = []
+        self.finished = False
+        self.changed = asyncio.Event()
+
+
+class AsyncStreamFlight:
+    """asyncio flavour of StreamFlight; the upstream is drained by a task"""
+
+    def __init__(self):
+        self.leaders = 0
+        self.coalesced = 0
+        self._streams: Dict[str, _AsyncBroadcast] = {}
+        self._tasks = set()
+
+    def subscribe(self, key: str, source: Callable[[], AsyncIterator[Any]]) -> Tuple[AsyncIterator[Any], bool]:
+        """Returns (items async iterator, shared) for the stream identified by key"""
+        broadcast = self._streams.get(key)
+        shared = broadcast is not None
+        if shared:
+            self.coalesced += 1
+        else:
+            broadcast = self._streams[key] = _AsyncBroadcast()
+            self.leaders += 1
+            task = asyncio.ensure_future(self._pump(key, broadcast, source))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        return self._follow(broadcast), shared
+
+    async def _pump(self, key: str, broadcast: _AsyncBroadcast, source: Callable[[], AsyncIterator[Any]]):
+        try:
+            async for item in source():
+                broadcast.items.append(item)
+                broadcast.changed.set()
+        finally:
+            self._streams.pop(key, None)
+            broadcast.finished = True
+            broadcast.changed.set()
+
+    @staticmethod
+    async def _follow(broadcast: _AsyncBroadcast) -> AsyncIterator[Any]:
+        index = 0
+        while True:
+            while index < len(broadcast.items):
+                yield broadcast.items[index]
+                index += 1
+            if broadcast.finished:
+                return
+            broadcast.changed.clear()
+            if index == len(broadcast.items) and not broadcast.finished:
+                await broadcast.changed.wait()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+            "in_flight": len(self._streams)
+        }
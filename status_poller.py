@@ -0,0 +1,210 @@
+"""
+Ollama Status Poller
+Background /api/tags + /api/ps polling into an in-memory snapshot for /api/ollama-status
+"""
+
+import asyncio
+import hashlib
+import json
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from ollama_client import OllamaError, OllamaHTTPError, OllamaTimeouts, PsResult, TagsResult
+from shared_state import SharedState
+
+STATUS_POLL_TIMEOUTS = OllamaTimeouts(connect=5, first_byte=5, total=5)
+
+
+def make_etag(*parts: Any) -> str:
+    """Weak ETag over JSON-serializable parts"""
+    digest = hashlib.sha1(json.dumps(parts, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+    return f'W/"{digest[:16]}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match check with weak comparison"""
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags or etag[2:] in tags
+
+
+class StatusPoller:
+    """Keeps the latest Ollama status in memory, refreshed every `interval` seconds.
+
+    Readers never touch Ollama: `current` (snapshot, ETag) is swapped as one
+    tuple after each poll, so a hung server only makes the snapshot stale,
+    never the endpoint.
+
+    With `shared` set, one worker process per host holds the poller lease and
+    publishes each snapshot; the others adopt it instead of polling Ollama
+    themselves, and take over the lease if its holder stops renewing it.
+    """
+
+    def __init__(self, client, interval: float = 5.0,
+                 timeouts: Optional[OllamaTimeouts] = None,
+                 shared: Optional[SharedState] = None):
+        self.client = client
+        self.interval = interval
+        self.timeouts = timeouts or STATUS_POLL_TIMEOUTS
+        self.shared = shared
+        self.polls = 0
+        self.last_success: Optional[float] = None
+        snapshot = {
+            "status": "unknown",
+            "reachable": False,
+            "models": [],
+            "loaded_models": [],
+            "latency_ms": None,
+            "last_success": None,
+            "last_checked": None,
+            "message": "Status not yet available"
+        }
+        self.current: Tuple[Dict[str, Any], str] = (snapshot, make_etag(self._state(snapshot)))
+        self._started = False
+        self._stop = threading.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._lock = threading.Lock()
+
+    def _claim_start(self) -> bool:
+        with self._lock:
+            if self._started:
+                return False
+            self._started = True
+            return True
+
+    def start(self):
+        """Poll from a daemon thread (sync client); safe to call on every request"""
+        if self._claim_start():
+            threading.Thread(target=self._run, name="status-poller", daemon=True).start()
+
+    def start_async(self):
+        """Poll from a task on the running loop (async client)"""
+        if self._claim_start():
+            self._task = asyncio.ensure_future(self._run_async())
+
+    def stop(self):
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+
+    def poll(self):
+        started = time.monotonic()
+        try:
+            tags = self.client.tags(timeouts=self.timeouts)
+            ps = self._ps_or_none(lambda: self.client.ps(timeouts=self.timeouts))
+        except Exception as e:
+            self._record(None, None, started, e)
+            return
+        self._record(tags, ps, started, None)
+
+    async def poll_async(self):
+        started = time.monotonic()
+        try:
+            tags = await self.client.tags(timeouts=self.timeouts)
+            try:
+                ps = await self.client.ps(timeouts=self.timeouts)
+            except OllamaError:
+                ps = None
+        except Exception as e:
+            await self._record_async(None, None, started, e)
+            return
+        await self._record_async(tags, ps, started, None)
+
+    async def _record_async(self, *args: Any):
+        # Publishing can wait on another process's lock on the shared file
+        if self.shared is None:
+            self._record(*args)
+        else:
+            await asyncio.to_thread(self._record, *args)
+
+    @staticmethod
+    def _ps_or_none(call) -> Optional[PsResult]:
+        # Older Ollama versions have no /api/ps; the model list alone is still useful
+        try:
+            return call()
+        except OllamaError:
+            return None
+
+    def _follow_shared(self) -> bool:
+        """Adopt the snapshot published by the lease holder; False when this process should poll"""
+        if self.shared is None or self.shared.lease("status", "poller", 3 * self.interval):
+            return False
+        published = self.shared.get("status", "snapshot")
+        if published is None:
+            return False  # the holder has not published yet
+        snapshot = json.loads(published)
+        self.current = (snapshot, make_etag(self._state(snapshot)))
+        return True
+
+    def _run(self):
+        while not self._stop.is_set():
+            if not self._follow_shared():
+                self.poll()
+            self._stop.wait(self.interval)
+
+    async def _run_async(self):
+        while True:
+            if not await asyncio.to_thread(self._follow_shared):
+                await self.poll_async()
+            await asyncio.sleep(self.interval)
+
+    @staticmethod
+    def _state(snapshot: Dict[str, Any]) -> Any:
+        """Fields whose change should invalidate client caches (not timestamps, latency or error text)"""
+        return [snapshot["status"], snapshot["models"],
+                [m["name"] for m in snapshot["loaded_models"]]]
+
+    def _record(self, tags: Optional[TagsResult], ps: Optional[PsResult],
+                started: float, error: Optional[Exception]):
+        now = time.time()
+        latency_ms = round((time.monotonic() - started) * 1000, 1)
+        self.polls += 1
+        if error is None:
+            self.last_success = now
+            snapshot = {
+                "status": "connected",
+                "reachable": True,
+                "models": tags.names,
+                "loaded_models": [
+                    {"name": m.name, "size_vram": m.size_vram, "expires_at": m.expires_at}
+                    for m in (ps.models if ps is not None else [])
+                ],
+                "latency_ms": latency_ms,
+                "last_success": now,
+                "last_checked": now,
+                "message": None
+            }
+        else:
+            http_error = isinstance(error, OllamaHTTPError)
+            snapshot = {
+                "status": "error" if http_error else "disconnected",
+                "reachable": http_error,
+                "models": [],
+                "loaded_models": [],
+                "latency_ms": latency_ms,
+                "last_success": self.last_success,
+                "last_checked": now,
+                "message": (f"Server error: {error.status_code}" if http_error
+                            else f"Connection failed: {str(error)}")
+            }
+        self.current = (snapshot, make_etag(self._state(snapshot)))
+        if self.shared is not None:
+            self.shared.set("status", "snapshot", json.dumps(snapshot), ttl=3 * self.interval)
+
+    def render(self, extra: Dict[str, Any], live_state: Any = None) -> Tuple[Dict[str, Any], str, int]:
+        """(body, ETag, HTTP status) for /api/ollama-status; `live_state` also feeds the ETag"""
+        snapshot, etag = self.current
+        if live_state is not None:
+            etag = make_etag(etag, live_state)
+        checked = snapshot["last_checked"]
+        age = None if checked is None else time.time() - checked
+        body = {
+            **snapshot,
+            "age_seconds": None if age is None else round(age, 3),
+            "stale": age is None or age > 3 * self.interval,
+            **extra
+        }
+        status_code = {"connected": 200, "error": 500}.get(snapshot["status"], 503)
+        return body, etag, status_code
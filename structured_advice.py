@@ -0,0 +1,103 @@
+"""
+Structured Advice
+Tips as a JSON list: Ollama's schema-constrained output, an incremental parser that
+ends the generation once enough tips are complete, and helpers for the compact response
+"""
+
+import json
+from typing import Any, Dict, List, Optional
+
+MAX_TIPS = 4
+
+TIPS_PROMPT_TEMPLATE = """Goal: {goal}
+
+Give exactly {count} specific, practical tips to achieve this goal. Start each tip with an emoji and keep it to one sentence.
+
+Respond with JSON: {{"tips": ["...", "..."]}}"""
+
+# Same advice as build_fallback_advice / build_busy_advice, one tip per entry
+FALLBACK_TIPS = [
+    "📋 Create a specific plan",
+    "⏰ Execute a little each day",
+    "📊 Record your progress",
+    "🎉 Celebrate small achievements",
+]
+
+
+def tips_schema(count: int) -> Dict[str, Any]:
+    """JSON schema for Ollama's `format`: an object holding exactly `count` tip strings"""
+    return {
+        "type": "object",
+        "properties": {
+            "tips": {"type": "array", "items": {"type": "string"}, "minItems": count, "maxItems": count}
+        },
+        "required": ["tips"]
+    }
+
+
+def build_tips_prompt(goal: str, count: int) -> str:
+    return TIPS_PROMPT_TEMPLATE.format(goal=goal, count=count)
+
+
+def tips_from_text(text: str, count: int = MAX_TIPS) -> List[str]:
+    """Tips from free-text advice (templates): one per line, skipping the heading line"""
+    lines = [line.strip() for line in text.splitlines() if line.strip()]
+    if lines and lines[0].endswith(":"):
+        lines = lines[1:]
+    return lines[:count]
+
+
+class TipStreamParser:
+    """Pulls complete tip strings out of a JSON answer while it is still being generated.
+
+    Only the string values inside the first JSON array are collected, so
+    `{"tips": [...]}` and a bare `[...]` both work. `complete` turns true as
+    soon as `count` strings have closed (or the array has), and the rest of the
+    answer, closing brackets and any trailing whitespace, need not be generated.
+    """
+
+    def __init__(self, count: int):
+        self.count = count
+        self.tips: List[str] = []
+        self.complete = False
+        self._in_array = False
+        self._in_string = False
+        self._escaped = False
+        self._raw: List[str] = []
+
+    def feed(self, text: str) -> List[str]:
+        """Consume a chunk of the answer; returns the tips it completed"""
+        completed = []
+        for char in text:
+            if self.complete:
+                break
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._in_array:
+                        tip = self._decode("".join(self._raw))
+                        if tip:
+                            self.tips.append(tip)
+                            completed.append(tip)
+                            self.complete = len(self.tips) >= self.count
+                    continue
+                self._raw.append(char)
+            elif char == '"':
+                self._in_string = True
+                self._raw = []
+            elif char == "[":
+                self._in_array = True
+            elif char == "]" and self._in_array:
+                self.complete = True
+        return completed
+
+    @staticmethod
+    def _decode(raw: str) -> Optional[str]:
+        try:
+            return json.loads(f'"{raw}"').strip()
+        except ValueError:
+            return raw.strip()
@@ -0,0 +1,330 @@
+"""
+Structured Logging
+JSON log lines written by a background thread, with request IDs, per-route sampling and payload truncation
+"""
+
+import atexit
+import contextvars
+import json
+import logging
+import os
+import queue
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Dict, Iterable, Optional
+
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "json")  # "json" or "text"
+LOG_QUEUE_SIZE = int(os.environ.get("LOG_QUEUE_SIZE", "10000"))
+# Longest string kept in a log field; payload logging gets a larger budget
+LOG_MAX_FIELD_CHARS = int(os.environ.get("LOG_MAX_FIELD_CHARS", "300"))
+LOG_PAYLOAD_MAX_CHARS = int(os.environ.get("LOG_PAYLOAD_MAX_CHARS", "4000"))
+# Fraction of requests whose INFO/DEBUG lines are kept; warnings and errors are always kept
+LOG_SAMPLE_RATE = float(os.environ.get("LOG_SAMPLE_RATE", "1.0"))
+# e.g. "/api/llama-advice=0.1,/api/health=0"
+LOG_SAMPLE_RATES = os.environ.get("LOG_SAMPLE_RATES", "")
+# Enables POST /api/debug/logging when set
+LOG_ADMIN_TOKEN = os.environ.get("LOG_ADMIN_TOKEN", "")
+
+REQUEST_ID_HEADER = "X-Request-ID"
+_REQUEST_ID_PATTERN = re.compile(r"^[A-Za-z0-9._:-]{1,64}$")
+
+# Attributes every LogRecord has; anything else came from `extra=`
+_RECORD_ATTRS = frozenset(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {
+    "message", "asctime", "request_id", "route"}
+
+
+def parse_sample_rates(value: str) -> Dict[str, float]:
+    """"route=rate,route=rate" -> {route: rate}"""
+    rates = {}
+    for item in value.split(","):
+        route, sep, rate = item.partition("=")
+        if sep and route.strip():
+            rates[route.strip()] = min(1.0, max(0.0, float(rate)))
+    return rates
+
+
+def truncate(value: Any, limit: int = LOG_MAX_FIELD_CHARS) -> Any:
+    """Clip long strings (recursively inside dicts and lists) to `limit` characters"""
+    if isinstance(value, str):
+        if len(value) <= limit:
+            return value
+        return f"{value[:limit]}...(+{len(value) - limit} chars)"
+    if isinstance(value, dict):
+        return {k: truncate(v, limit) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [truncate(v, limit) for v in value]
+    return value
+
+
+@dataclass
+class RequestContext:
+    request_id: str
+    route: str
+    sampled: bool = True
+
+
+_request: contextvars.ContextVar[Optional[RequestContext]] = contextvars.ContextVar(
+    "request_context", default=None)
+
+
+class LogSettings:
+    """Runtime-adjustable logging knobs (see POST /api/debug/logging)"""
+
+    def __init__(self, sample_rate: float, route_rates: Dict[str, float]):
+        self.sample_rate = sample_rate
+        self.route_rates = route_rates
+        self.payloads_until = 0.0
+
+    @property
+    def payloads(self) -> bool:
+        return time.monotonic() < self.payloads_until
+
+    def enable_payloads(self, seconds: float):
+        self.payloads_until = time.monotonic() + seconds
+
+    def disable_payloads(self):
+        self.payloads_until = 0.0
+
+    def rate_for(self, route: str) -> float:
+        return self.route_rates.get(route, self.sample_rate)
+
+    def stats(self) -> Dict[str, Any]:
+        remaining = self.payloads_until - time.monotonic()
+        return {
+            "level": logging.getLevelName(logging.getLogger().level),
+            "sample_rate": self.sample_rate,
+            "route_rates": dict(self.route_rates),
+            "payloads": remaining > 0,
+            "payloads_remaining_seconds": round(remaining) if remaining > 0 else 0,
+            "dropped": _handler.dropped if _handler is not None else 0
+        }
+
+
+settings = LogSettings(LOG_SAMPLE_RATE, parse_sample_rates(LOG_SAMPLE_RATES))
+
+
+def begin_request(route: str, request_id: Optional[str] = None) -> RequestContext:
+    """Bind a request ID and sampling decision to the current context"""
+    if not request_id or not _REQUEST_ID_PATTERN.match(request_id):
+        request_id = uuid.uuid4().hex[:16]
+    rate = settings.rate_for(route)
+    context = RequestContext(request_id, route, rate >= 1.0 or random.random() < rate)
+    _request.set(context)
+    return context
+
+
+def current_request_id() -> Optional[str]:
+    context = _request.get()
+    return context.request_id if context is not None else None
+
+
+def log_payload(logger: logging.Logger, message: str, **payload: Any):
+    """Full request/response bodies, only while payload logging is switched on"""
+    if settings.payloads:
+        logger.info(message, extra={"payload": truncate(payload, LOG_PAYLOAD_MAX_CHARS)})
+
+
+class _ContextFilter(logging.Filter):
+    """Stamps the request context onto records and drops unsampled INFO/DEBUG lines"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        context = _request.get()
+        if context is None:
+            record.request_id = None
+            record.route = None
+            return True
+        if record.levelno < logging.WARNING and not context.sampled:
+            return False
+        record.request_id = context.request_id
+        record.route = context.route
+        return True
+
+
+class _DroppingQueueHandler(QueueHandler):
+    """Never blocks the caller: when the writer falls behind, records are counted and dropped"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Render the message and traceback here (args may be mutated later),
+        # but leave JSON encoding to the writer thread
+        record.message = record.getMessage()
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.msg, record.args, record.exc_info = record.message, None, None
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line; `extra=` fields are included, long strings truncated"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "msg": truncate(record.getMessage()),
+        }
+        if getattr(record, "request_id", None):
+            entry["request_id"] = record.request_id
+            entry["route"] = record.route
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS:
+                entry[key] = value if key == "payload" else truncate(value)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """Human-readable lines for local development"""
+
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        fields = {k: v for k, v in vars(record).items() if k not in _RECORD_ATTRS}
+        if getattr(record, "request_id", None):
+            line = f"[{record.request_id}] {line}"
+        if fields:
+            line += " " + json.dumps(truncate(fields), ensure_ascii=False, default=str)
+        return line
+
+
+_handler: Optional[_DroppingQueueHandler] = None
+_listener: Optional[QueueListener] = None
+_setup_lock = threading.Lock()
+
+
+def setup_logging(level: str = LOG_LEVEL, fmt: str = LOG_FORMAT):
+    """Route the root logger through the background writer (idempotent)"""
+    global _handler, _listener
+    with _setup_lock:
+        if _handler is not None:
+            return
+        writer = logging.StreamHandler(sys.stdout)
+        writer.setFormatter(JsonFormatter() if fmt == "json" else TextFormatter())
+        log_queue: queue.Queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+        _handler = _DroppingQueueHandler(log_queue)
+        _handler.addFilter(_ContextFilter())
+        root = logging.getLogger()
+        root.addHandler(_handler)
+        root.setLevel(level)
+        # One INFO line per upstream call would drown everything else
+        for name in ("httpx", "httpcore", "urllib3"):
+            logging.getLogger(name).setLevel(logging.WARNING)
+        _listener = QueueListener(log_queue, writer, respect_handler_level=True)
+        _listener.start()
+        atexit.register(_listener.stop)
+
+
+def set_level(level: str):
+    logging.getLogger().setLevel(level.upper())
+
+
+def update_settings(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Apply {"level", "sample_rate", "route_rates", "payloads", "minutes"}; returns the new settings"""
+    if "level" in data:
+        set_level(str(data["level"]))
+    if "sample_rate" in data:
+        settings.sample_rate = min(1.0, max(0.0, float(data["sample_rate"])))
+    if isinstance(data.get("route_rates"), dict):
+        settings.route_rates = {str(k): min(1.0, max(0.0, float(v)))
+                                for k, v in data["route_rates"].items()}
+    if "payloads" in data:
+        if data["payloads"]:
+            settings.enable_payloads(60 * float(data.get("minutes", 10)))
+        else:
+            settings.disable_payloads()
+    return settings.stats()
+
+
+def _valid_level(level: Any) -> bool:
+    return isinstance(level, str) and isinstance(logging.getLevelName(level.upper()), int)
+
+
+def validate_settings(data: Any) -> Optional[str]:
+    """Error message for a bad /api/debug/logging body, or None"""
+    if not isinstance(data, dict):
+        return "Expected a JSON object."
+    if "level" in data and not _valid_level(data["level"]):
+        return f"Unknown log level: {data['level']}"
+    try:
+        float(data.get("sample_rate", 0))
+        float(data.get("minutes", 0))
+        for rate in (data.get("route_rates") or {}).values():
+            float(rate)
+    except (TypeError, ValueError, AttributeError):
+        return "Rates and minutes must be numbers."
+    return None
+
+
+def match_route(path: str, routes: frozenset) -> str:
+    """Route a path belongs to, templates included ("/api/jobs/<job_id>" for
+    "/api/jobs/ab12"); unknown paths are "other" so scanners cannot blow up cardinality"""
+    if path in routes:
+        return path
+    parts = path.split("/")
+    for route in routes:
+        template = route.split("/")
+        if (len(template) == len(parts) and any(t.startswith(("<", "{")) for t in template)
+                and all(t == p or (t.startswith(("<", "{")) and p) for t, p in zip(template, parts))):
+            return route
+    return "other"
+
+
+class WSGIRequestContextMiddleware:
+    """Assigns each request an ID (honouring X-Request-ID) and echoes it in the response"""
+
+    def __init__(self, app, routes: Iterable[str]):
+        self.app = app
+        self.routes = frozenset(routes)
+
+    def __call__(self, environ, start_response):
+        context = begin_request(match_route(environ.get("PATH_INFO", ""), self.routes),
+                                environ.get("HTTP_X_REQUEST_ID"))
+
+        def start_response_with_id(status, headers, exc_info=None):
+            return start_response(status, headers + [(REQUEST_ID_HEADER, context.request_id)], exc_info)
+
+        return self.app(environ, start_response_with_id)
+
+
+class ASGIRequestContextMiddleware:
+    """ASGI flavour of WSGIRequestContextMiddleware (add with app.add_middleware)"""
+
+    def __init__(self, app, routes: Iterable[str]):
+        self.app = app
+        self.routes = frozenset(routes)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        header = next((value.decode("latin-1") for name, value in scope.get("headers", [])
+                       if name == b"x-request-id"), None)
+        context = begin_request(match_route(scope.get("path", ""), self.routes), header)
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                message = {**message, "headers": list(message.get("headers", []))
+                           + [(b"x-request-id", context.request_id.encode("latin-1"))]}
+            await send(message)
+
+        await self.app(scope, receive, send_with_id)
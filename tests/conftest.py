@@ -0,0 +1,45 @@
+"""
+Test Fixtures
+The servers read their settings when advice_core is first imported, so point them
+at a mock Ollama and a scratch directory before any test module loads
+"""
+
+import os
+import socket
+import tempfile
+
+import pytest
+
+from mock_ollama import MockConfig, serve
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+MOCK_PORT = _free_port()
+SCRATCH_DIR = tempfile.mkdtemp(prefix="advice-tests-")
+
+for name, value in {
+    "OLLAMA_BASE_URL": f"http://127.0.0.1:{MOCK_PORT}",
+    "JOBS_DB": os.path.join(SCRATCH_DIR, "jobs.db"),
+    "RAG_INDEX_DIR": os.path.join(SCRATCH_DIR, "rag_index"),
+    "PRECOMPUTED_DIR": os.path.join(SCRATCH_DIR, "precomputed"),
+    "CLIENT_RATE_PER_SEC": "100",
+    "CLIENT_BURST": "100",
+    "MODEL_WARMUP_ENABLED": "0",
+    "PREFETCH_ENABLED": "0",
+    "LOG_LEVEL": "WARNING",
+}.items():
+    os.environ[name] = value
+
+
+@pytest.fixture(scope="session")
+def mock_ollama():
+    """A fast mock Ollama on MOCK_PORT for end-to-end tests; yields its base URL"""
+    server = serve(MockConfig(load_delay=0.0, ttft=0.01, tokens_per_sec=2000.0), port=MOCK_PORT)
+    yield os.environ["OLLAMA_BASE_URL"]
+    server.shutdown()
+    server.server_close()
@@ -0,0 +1,72 @@
+import sqlite3
+import time
+
+from advice_cache import AdviceCache, make_cache_key, normalize_goal
+
+
+def row_count(path):
+    with sqlite3.connect(path) as db:
+        return db.execute("SELECT COUNT(*) FROM advice_cache").fetchone()[0]
+
+
+def test_normalized_goals_share_a_key():
+    assert normalize_goal("  Drink  MORE water! ") == "drink more water"
+    key = make_cache_key("Drink more water", "llama3", "t", {"num_predict": 200})
+    assert key == make_cache_key("drink more water.", "llama3", "t", {"num_predict": 200})
+    assert key != make_cache_key("drink more water", "llama3", "t", {"num_predict": 100})
+
+
+def test_entries_expire():
+    cache = AdviceCache(ttl=60.0)
+    cache.set("short", "advice", ttl=0.01)
+    cache.set("long", "advice")
+    assert cache.contains("short")
+    time.sleep(0.02)
+    assert cache.get("short") is None
+    assert not cache.contains("short")
+    assert cache.get("long") == "advice"
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_least_recently_used_is_evicted():
+    cache = AdviceCache(max_entries=2)
+    cache.set("a", "1")
+    cache.set("b", "2")
+    cache.get("a")
+    cache.set("c", "3")
+    assert cache.get("b") is None
+    assert cache.get("a") == "1"
+
+
+def test_persists_across_restarts_without_expired_rows(tmp_path):
+    path = str(tmp_path / "cache.db")
+    cache = AdviceCache(db_path=path)
+    cache.set("kept", "advice")
+    cache.set("expired", "advice", ttl=0.01)
+    time.sleep(0.02)
+    reopened = AdviceCache(db_path=path)
+    assert reopened.get("kept") == "advice"
+    assert reopened.get("expired") is None
+    assert row_count(path) == 1
+
+
+def test_expired_entry_is_deleted_from_disk(tmp_path):
+    path = str(tmp_path / "cache.db")
+    cache = AdviceCache(db_path=path, sweep_interval=3600)
+    cache.set("expired", "advice", ttl=0.01)
+    time.sleep(0.02)
+    assert cache.get("expired") is None
+    assert row_count(path) == 0
+
+
+def test_disk_rows_are_capped(tmp_path):
+    path = str(tmp_path / "cache.db")
+    cache = AdviceCache(max_entries=2, max_rows=3, db_path=path, sweep_interval=0)
+    for i in range(10):
+        cache.set(f"k{i}", "advice")
+    assert row_count(path) == 3
+    # Memory misses fall through to the rows still on disk
+    assert cache.get("k7") == "advice"
+    assert cache.get("k6") is None
+    assert cache.stats()["max_rows"] == 3
+
@@ -0,0 +1,135 @@
+import pytest
+
+from backend_pool import ROUTING_EWMA, BackendPool, parse_base_urls
+from ollama_client import (
+    GenerateChunk,
+    GenerateResult,
+    OllamaConnectionError,
+    OllamaHTTPError,
+    OllamaTimeoutError,
+    TagsResult,
+)
+
+
+class FakeClient:
+    """Stands in for OllamaClient; `errors` are raised by the next calls, in order"""
+
+    def __init__(self, url, models=("llama3:latest",)):
+        self.base_url = url
+        self.models = list(models)
+        self.errors = []
+        self.calls = []
+
+    def _next(self, method):
+        self.calls.append(method)
+        if self.errors:
+            raise self.errors.pop(0)
+
+    def generate(self, prompt, **kwargs):
+        self._next("generate")
+        return GenerateResult(response=f"{prompt} from {self.base_url}", backend=self.base_url)
+
+    def generate_stream(self, prompt, **kwargs):
+        self._next("generate_stream")
+        yield GenerateChunk(response=self.base_url, done=True)
+
+    def tags(self, timeouts=None):
+        self._next("tags")
+        return TagsResult.from_json({"models": [{"name": m} for m in self.models]})
+
+    def close(self):
+        pass
+
+
+def make_pool(*clients, **kwargs):
+    return BackendPool(list(clients), "llama3", **kwargs)
+
+
+def test_parse_base_urls_dedupes_in_order():
+    assert parse_base_urls("http://a/, http://b http://a") == ["http://a", "http://b"]
+
+
+def test_routes_to_least_outstanding_node():
+    a, b = FakeClient("http://a"), FakeClient("http://b")
+    pool = make_pool(a, b)
+    pool.backends[0].outstanding = 2
+    assert pool.generate("hi").backend == "http://b"
+    assert pool.backends[0].outstanding == 2
+    assert pool.backends[1].outstanding == 0
+
+
+def test_ewma_routing_prefers_faster_node():
+    a, b = FakeClient("http://a"), FakeClient("http://b")
+    pool = make_pool(a, b, routing=ROUTING_EWMA)
+    pool.backends[0].ewma_latency = 5.0
+    pool.backends[1].ewma_latency = 1.0
+    assert pool.generate("hi").backend == "http://b"
+
+
+def test_ewma_only_tracks_generations():
+    a = FakeClient("http://a")
+    pool = make_pool(a)
+    pool.tags()
+    assert pool.backends[0].ewma_latency is None
+    pool.generate("hi")
+    assert pool.backends[0].ewma_latency is not None
+
+
+def test_skips_nodes_without_the_model():
+    a, b = FakeClient("http://a", models=("mistral:latest",)), FakeClient("http://b")
+    pool = make_pool(a, b)
+    pool.check_health()
+    pool.backends[1].outstanding = 3
+    assert pool.generate("hi").backend == "http://b"
+
+
+def test_ejects_after_consecutive_outages_and_readmits_on_health_check():
+    a, b = FakeClient("http://a"), FakeClient("http://b")
+    pool = make_pool(a, b, eject_after=2, max_attempts=1)
+    a.errors = [OllamaTimeoutError("slow"), OllamaTimeoutError("slow")]
+    for _ in range(2):
+        pool.backends[1].outstanding = 1  # keep routing to a
+        with pytest.raises(OllamaTimeoutError):
+            pool.generate("hi")
+    assert not pool.backends[0].healthy
+    assert pool.backends[0].ejections == 1
+    pool.backends[1].outstanding = 5
+    assert pool.generate("hi").backend == "http://b"
+
+    pool.check_health()
+    assert pool.backends[0].healthy
+    assert pool.backends[0].consecutive_failures == 0
+
+
+def test_client_errors_do_not_eject():
+    a = FakeClient("http://a")
+    pool = make_pool(a, eject_after=1)
+    a.errors = [OllamaHTTPError(400, "bad request")]
+    with pytest.raises(OllamaHTTPError):
+        pool.generate("hi")
+    assert pool.backends[0].healthy
+
+
+def test_connection_error_fails_over_to_another_node():
+    a, b = FakeClient("http://a"), FakeClient("http://b")
+    pool = make_pool(a, b)
+    a.errors = [OllamaConnectionError("refused")]
+    pool.backends[1].outstanding = 1
+    assert pool.generate("hi").backend == "http://b"
+    assert pool.retries == 1
+
+
+def test_routes_somewhere_when_every_node_is_ejected():
+    a = FakeClient("http://a")
+    pool = make_pool(a)
+    pool.backends[0].healthy = False
+    assert pool.generate("hi").backend == "http://a"
+
+
+def test_stream_fails_over_before_the_first_chunk():
+    a, b = FakeClient("http://a"), FakeClient("http://b")
+    pool = make_pool(a, b)
+    a.errors = [OllamaConnectionError("refused")]
+    pool.backends[1].outstanding = 1
+    chunks = list(pool.generate_stream("hi"))
+    assert [c.response for c in chunks] == ["http://b"]
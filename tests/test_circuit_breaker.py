@@ -0,0 +1,110 @@
+import time
+
+import pytest
+
+from circuit_breaker import (
+    STATE_CLOSED,
+    STATE_HALF_OPEN,
+    STATE_OPEN,
+    CircuitBreaker,
+    CircuitOpenError,
+    LatencyTracker,
+    LatencyTrackers,
+)
+from ollama_client import OllamaConnectionError, OllamaHTTPError, OllamaTimeoutError
+
+
+def test_latency_tracker_uses_default_until_warm():
+    tracker = LatencyTracker(min_samples=3)
+    tracker.add(1.0)
+    assert tracker.timeout(default=60.0, floor=5.0) == 60.0
+    tracker.add(1.0)
+    tracker.add(2.0)
+    assert tracker.timeout(default=60.0, floor=1.0) == 4.0
+    assert tracker.timeout(default=60.0, floor=10.0) == 10.0
+
+
+def test_latency_tracker_recovers_after_timeouts_at_the_deadline():
+    tracker = LatencyTracker(window=10, min_samples=5)
+    for _ in range(10):
+        tracker.add(5.0)
+    deadline = tracker.timeout(default=120.0, floor=5.0)
+    assert deadline == 10.0
+    # The backend slowed down: each call times out at the current deadline
+    for _ in range(10):
+        tracker.add(deadline)
+        deadline = tracker.timeout(default=120.0, floor=5.0)
+    assert deadline == 120.0
+
+
+def test_latency_trackers_are_kept_per_key():
+    trackers = LatencyTrackers(min_samples=1)
+    trackers["big:full"].add(30.0)
+    trackers["fast:full"].add(1.0)
+    assert trackers["big:full"].timeout(default=120.0, floor=1.0) == 60.0
+    assert trackers["fast:full"].timeout(default=120.0, floor=1.0) == 2.0
+    assert trackers.keys() == ["big:full", "fast:full"]
+    assert trackers.stats()["fast:full"]["samples"] == 1
+
+
+def test_breaker_opens_after_consecutive_outages():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60.0)
+    for _ in range(2):
+        breaker.allow()
+        breaker.record(OllamaConnectionError("refused"))
+    assert breaker.state == STATE_OPEN
+    with pytest.raises(CircuitOpenError) as excinfo:
+        breaker.allow()
+    assert 0 < excinfo.value.retry_after <= 60.0
+    assert breaker.stats()["short_circuited"] == 1
+
+
+def test_breaker_ignores_client_errors_and_success_resets_count():
+    breaker = CircuitBreaker(failure_threshold=2)
+    breaker.allow()
+    breaker.record(OllamaTimeoutError("slow"))
+    breaker.allow()
+    breaker.record(OllamaHTTPError(404, "model not found"))
+    breaker.allow()
+    breaker.record(None)
+    breaker.allow()
+    breaker.record(OllamaTimeoutError("slow"))
+    assert breaker.state == STATE_CLOSED
+
+
+def test_breaker_half_open_probe_closes_on_success():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05, half_open_max=1)
+    breaker.allow()
+    breaker.record(OllamaConnectionError("refused"))
+    time.sleep(0.06)
+    breaker.allow()  # the probe
+    assert breaker.state == STATE_HALF_OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.allow()  # only one probe at a time
+    breaker.record(None)
+    assert breaker.state == STATE_CLOSED
+    breaker.allow()
+
+
+def test_breaker_half_open_probe_reopens_on_failure():
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=0.05)
+    for _ in range(3):
+        breaker.allow()
+        breaker.record(OllamaConnectionError("refused"))
+    time.sleep(0.06)
+    breaker.allow()
+    breaker.record(OllamaHTTPError(503, "overloaded"))
+    assert breaker.state == STATE_OPEN
+    assert breaker.opens == 2
+
+
+def test_breaker_forgets_a_probe_that_never_reports():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    breaker.allow()
+    breaker.record(OllamaConnectionError("refused"))
+    time.sleep(0.06)
+    breaker.allow()  # probe lost, e.g. the caller crashed
+    time.sleep(0.06)
+    breaker.allow()
+    breaker.record(None)
+    assert breaker.state == STATE_CLOSED
@@ -0,0 +1,84 @@
+import asyncio
+import json
+import socket
+import threading
+import time
+
+import pytest
+
+from ollama_client import (
+    AsyncOllamaClient,
+    OllamaClient,
+    OllamaTimeouts,
+    OllamaTimeoutError,
+    PsResult,
+)
+
+
+def test_ps_get_matches_latest_tag():
+    ps = PsResult.from_json({"models": [{"name": "llama3:latest", "size_vram": 1}, {"name": "qwen2:1.5b"}]})
+    assert ps.get("llama3").name == "llama3:latest"
+    assert ps.get("llama3:latest").size_vram == 1
+    assert ps.get("qwen2:1.5b") is not None
+    assert ps.get("qwen2") is None
+    assert ps.get("mistral") is None
+
+
+@pytest.fixture
+def stalled_stream():
+    """A server that sends one stream line, then goes quiet; yields its base URL"""
+    server = socket.socket()
+    server.bind(("127.0.0.1", 0))
+    server.listen()
+    stop = threading.Event()
+
+    def handle(conn):
+        with conn:
+            conn.recv(65536)
+            conn.sendall(b"HTTP/1.1 200 OK\r\nContent-Type: application/x-ndjson\r\n"
+                         b"Transfer-Encoding: chunked\r\n\r\n")
+            line = json.dumps({"response": "Drink", "done": False}).encode() + b"\n"
+            conn.sendall(b"%x\r\n%s\r\n" % (len(line), line))
+            stop.wait(10)
+
+    def accept():
+        while not stop.is_set():
+            try:
+                conn, _ = server.accept()
+            except OSError:
+                return
+            threading.Thread(target=handle, args=(conn,), daemon=True).start()
+
+    threading.Thread(target=accept, daemon=True).start()
+    yield f"http://127.0.0.1:{server.getsockname()[1]}"
+    stop.set()
+    server.close()
+
+
+# The stall outlasts the total deadline but not the per-read first-byte timeout
+STALL_TIMEOUTS = OllamaTimeouts(connect=1.0, first_byte=10.0, total=0.3)
+
+
+def test_stalled_stream_stops_at_total_deadline(stalled_stream):
+    client = OllamaClient(stalled_stream, "llama3", timeouts=STALL_TIMEOUTS)
+    started = time.monotonic()
+    with pytest.raises(OllamaTimeoutError, match="Total timeout"):
+        for _ in client.generate_stream("hi"):
+            pass
+    assert time.monotonic() - started < 2.0
+    client.close()
+
+
+def test_async_stalled_stream_stops_at_total_deadline(stalled_stream):
+    async def main():
+        client = AsyncOllamaClient(stalled_stream, "llama3", timeouts=STALL_TIMEOUTS)
+        try:
+            async for _ in client.generate_stream("hi"):
+                pass
+        finally:
+            await client.aclose()
+
+    started = time.monotonic()
+    with pytest.raises(OllamaTimeoutError, match="Total timeout"):
+        asyncio.run(main())
+    assert time.monotonic() - started < 2.0
@@ -0,0 +1,41 @@
+import pytest
+
+from precompute import PrecomputedStore, polarity_words, write_store
+
+
+@pytest.fixture
+def store(tmp_path):
+    write_store(str(tmp_path), [
+        {"goal": "Drink more water", "advice": "hydrate"},
+        {"goal": "Stop smoking", "advice": "quit plan"},
+        {"goal": "Learn to play the guitar", "advice": "practice chords"},
+    ], model="llama3", fingerprint="fp")
+    return PrecomputedStore.open(str(tmp_path), fingerprint="fp")
+
+
+def test_open_rejects_another_fingerprint(tmp_path, store):
+    assert PrecomputedStore.open(str(tmp_path), fingerprint="other") is None
+    assert PrecomputedStore.open(str(tmp_path / "missing")) is None
+
+
+def test_exact_match_after_normalization(store):
+    assert store.lookup("  drink MORE water!") == ("hydrate", 1.0, "Drink more water")
+
+
+def test_near_spelling_matches(store):
+    advice, similarity, goal = store.lookup("Learn to play the guitarr")
+    assert advice == "practice chords"
+    assert 0.9 <= similarity < 1.0
+
+
+def test_unrelated_goal_misses(store):
+    assert store.lookup("Run a marathon") is None
+    assert store.lookup("Learn to play the piano") is None
+    assert store.stats()["misses"] == 2
+
+
+def test_opposite_meaning_is_rejected(store):
+    assert polarity_words("Don't stop smoking") == {"dont", "stop"}
+    assert store.lookup("dont stop smoking", min_similarity=0.5) is None
+    assert store.lookup("Drink less water", min_similarity=0.5) is None
+    assert store.lookup("Stop smoking") is not None
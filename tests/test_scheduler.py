@@ -0,0 +1,105 @@
+import threading
+import time
+
+import pytest
+
+from scheduler import (
+    PRIORITY_BATCH,
+    PRIORITY_INTERACTIVE,
+    QueueFullError,
+    QueueTimeoutError,
+    RateLimitedError,
+    Scheduler,
+    TokenBucket,
+    take_shared_token,
+)
+
+
+def test_token_bucket_allows_burst_then_waits():
+    bucket = TokenBucket(rate=1.0, burst=2.0)
+    assert bucket.take() == 0.0
+    assert bucket.take() == 0.0
+    wait = bucket.take()
+    assert 0.9 < wait <= 1.0
+
+
+def test_token_bucket_refills_over_time():
+    bucket = TokenBucket(rate=100.0, burst=1.0)
+    assert bucket.take() == 0.0
+    assert bucket.take() > 0
+    time.sleep(0.02)
+    assert bucket.take() == 0.0
+
+
+def test_shared_token_state_round_trips():
+    state, wait = take_shared_token(None, rate=1.0, burst=1.0)
+    assert wait == 0.0
+    state, wait = take_shared_token(state, rate=1.0, burst=1.0)
+    assert 0.9 < wait <= 1.0
+
+
+def test_check_rate_is_per_client():
+    scheduler = Scheduler(client_rate=0.1, client_burst=2)
+    scheduler.check_rate("a")
+    scheduler.check_rate("a")
+    with pytest.raises(RateLimitedError) as excinfo:
+        scheduler.check_rate("a")
+    assert excinfo.value.retry_after > 0
+    scheduler.check_rate("b")
+    assert scheduler.stats()["rejected"]["rate_limited"] == 1
+
+
+def test_client_buckets_are_bounded():
+    scheduler = Scheduler(max_clients=2)
+    for client in ("a", "b", "c"):
+        scheduler.check_rate(client)
+    assert scheduler.stats()["clients"] == 2
+
+
+def test_queue_full_and_queue_timeout():
+    scheduler = Scheduler(concurrency=1, max_queue=1, queue_timeout=0.05)
+    scheduler.acquire()
+    with pytest.raises(QueueTimeoutError):
+        scheduler.acquire()
+
+    errors = []
+
+    def wait():
+        try:
+            scheduler.acquire(timeout=0.2)
+        except QueueTimeoutError as e:
+            errors.append(e)
+
+    waiter = threading.Thread(target=wait)
+    waiter.start()
+    while scheduler.stats()["queued"] < 1:
+        time.sleep(0.005)
+    with pytest.raises(QueueFullError):
+        scheduler.acquire()
+    waiter.join(5)
+    assert len(errors) == 1
+    scheduler.release()
+    assert scheduler.stats()["active"] == 0
+    assert scheduler.stats()["rejected"] == {"rate_limited": 0, "queue_full": 1, "queue_timeout": 2}
+
+
+def test_waiters_are_served_by_priority():
+    scheduler = Scheduler(concurrency=1, queue_timeout=5)
+    scheduler.acquire()
+    order = []
+
+    def wait(priority, name):
+        with scheduler.slot(priority):
+            order.append(name)
+
+    threads = []
+    for priority, name in ((PRIORITY_BATCH, "batch"), (PRIORITY_INTERACTIVE, "interactive")):
+        thread = threading.Thread(target=wait, args=(priority, name))
+        thread.start()
+        threads.append(thread)
+        while scheduler.queue_depth() < len(threads):
+            time.sleep(0.005)
+    scheduler.release()
+    for thread in threads:
+        thread.join(5)
+    assert order == ["interactive", "batch"]
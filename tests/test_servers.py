@@ -0,0 +1,73 @@
+"""
+End-to-end: each server answers through the real client stack against mock_ollama
+"""
+
+import json
+
+import pytest
+
+
+@pytest.fixture(scope="module")
+def flask_client(mock_ollama):
+    import app_simple
+    return app_simple.app.test_client()
+
+
+@pytest.fixture(scope="module")
+def starlette_client(mock_ollama):
+    from starlette.testclient import TestClient
+
+    import app
+    with TestClient(app.app) as client:
+        yield client
+
+
+def stream_lines(body: str):
+    return [json.loads(line) for line in body.splitlines() if line.strip()]
+
+
+def test_validate_goal():
+    from advice_core import validate_goal
+
+    assert validate_goal({"goal": "  Drink water "}) == ("Drink water", None)
+    assert validate_goal({"goal": 5}) == (None, "Please enter a goal.")
+    assert validate_goal(None) == (None, "Please enter a goal.")
+    assert validate_goal({"goal": "   "}) == (None, "Goal is empty.")
+
+
+def test_flask_server(flask_client):
+    goal = "Practice the flask guitar every evening"
+    first = flask_client.post("/api/llama-advice", json={"goal": goal}).get_json()
+    assert first["success"] and not first.get("fallback")
+    assert first["advice"]
+    second = flask_client.post("/api/llama-advice", json={"goal": goal}).get_json()
+    assert second["advice"] == first["advice"]
+    assert second["cached"]
+
+    stream = flask_client.post("/api/llama-advice/stream?format=ndjson",
+                               json={"goal": "Read one flask chapter before bed", "fresh": True})
+    events = stream_lines(stream.get_data(as_text=True))
+    done = events[-1]
+    assert done["event"] == "done" and not done.get("fallback")
+    assert "".join(e["text"] for e in events if e["event"] == "token").strip() == done["advice"]
+
+    assert flask_client.post("/api/llama-advice", json={"goal": None}).status_code == 400
+
+
+def test_starlette_server(starlette_client):
+    goal = "Practice the starlette piano every morning"
+    first = starlette_client.post("/api/llama-advice", json={"goal": goal}).json()
+    assert first["success"] and not first.get("fallback")
+    assert first["advice"]
+    second = starlette_client.post("/api/llama-advice", json={"goal": goal}).json()
+    assert second["advice"] == first["advice"]
+    assert second["cached"]
+
+    stream = starlette_client.post("/api/llama-advice/stream?format=ndjson",
+                                   json={"goal": "Read one starlette chapter before bed", "fresh": True})
+    events = stream_lines(stream.text)
+    done = events[-1]
+    assert done["event"] == "done" and not done.get("fallback")
+    assert "".join(e["text"] for e in events if e["event"] == "token").strip() == done["advice"]
+
+    assert starlette_client.post("/api/llama-advice", json={"goal": 5}).status_code == 400
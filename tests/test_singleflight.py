@@ -0,0 +1,82 @@
+import asyncio
+import threading
+
+import pytest
+
+from singleflight import AsyncSingleFlight, SingleFlight, StreamFlight
+
+
+def test_concurrent_callers_share_one_call():
+    flight = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def slow():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return "advice"
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(flight.do("k", slow)))
+    leader.start()
+    started.wait(5)
+    followers = [threading.Thread(target=lambda: results.append(flight.do("k", slow))) for _ in range(3)]
+    for t in followers:
+        t.start()
+    while flight.stats()["coalesced"] < 3:
+        threading.Event().wait(0.01)
+    release.set()
+    for t in [leader, *followers]:
+        t.join(5)
+
+    assert len(calls) == 1
+    assert sorted(results) == [("advice", False)] + [("advice", True)] * 3
+    assert flight.stats() == {"leaders": 1, "coalesced": 3, "in_flight": 0}
+
+
+def test_error_is_raised_and_key_is_freed():
+    flight = SingleFlight()
+
+    def fail():
+        raise ValueError("boom")
+
+    with pytest.raises(ValueError):
+        flight.do("k", fail)
+    assert flight.do("k", lambda: 1) == (1, False)
+
+
+def test_stream_subscribers_see_every_item():
+    flight = StreamFlight()
+    release = threading.Event()
+
+    def source():
+        yield 1
+        release.wait(5)
+        yield 2
+
+    first, shared_first = flight.subscribe("k", source)
+    second, shared_second = flight.subscribe("k", source)
+    release.set()
+    assert (shared_first, shared_second) == (False, True)
+    assert list(first) == [1, 2]
+    assert list(second) == [1, 2]
+
+
+def test_async_callers_share_one_call():
+    async def main():
+        flight = AsyncSingleFlight()
+        calls = []
+
+        async def slow():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return "advice"
+
+        results = await asyncio.gather(*(flight.do("k", slow) for _ in range(4)))
+        return calls, results, flight.stats()
+
+    calls, results, stats = asyncio.run(main())
+    assert len(calls) == 1
+    assert [shared for _, shared in results].count(False) == 1
+    assert stats == {"leaders": 1, "coalesced": 3, "in_flight": 0}
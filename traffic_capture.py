@@ -0,0 +1,229 @@
+"""
+Traffic Capture
+Opt-in recording of advice requests to a rotating JSONL log, for replay with `benchmark.py replay`
+"""
+
+import atexit
+import contextvars
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+from structured_log import current_request_id
+
+logger = logging.getLogger(__name__)
+
+CAPTURE_ENABLED = os.environ.get("CAPTURE_ENABLED", "false").lower() == "true"
+CAPTURE_PATH = os.environ.get("CAPTURE_PATH", "captures/requests.jsonl")
+# Rotate to requests.jsonl.1 ... .N once the file passes this size
+CAPTURE_MAX_BYTES = int(os.environ.get("CAPTURE_MAX_BYTES", str(64 * 1024 * 1024)))
+CAPTURE_BACKUPS = int(os.environ.get("CAPTURE_BACKUPS", "5"))
+# Records are written in batches of up to CAPTURE_BATCH_SIZE, at least every CAPTURE_FLUSH_SECONDS
+CAPTURE_BATCH_SIZE = int(os.environ.get("CAPTURE_BATCH_SIZE", "256"))
+CAPTURE_FLUSH_SECONDS = float(os.environ.get("CAPTURE_FLUSH_SECONDS", "1.0"))
+CAPTURE_QUEUE_SIZE = int(os.environ.get("CAPTURE_QUEUE_SIZE", "10000"))
+
+# Single-goal advice routes; `benchmark.py replay` re-issues these
+CAPTURED_ROUTES = ("/api/llama-advice", "/api/llama-advice/stream")
+
+_current: contextvars.ContextVar[Optional[Dict[str, Any]]] = contextvars.ContextVar(
+    "capture_record", default=None)
+
+
+def note(**fields: Any):
+    """Add fields to the current request's capture record (no-op when not capturing)"""
+    record = _current.get()
+    if record is not None:
+        record.update(fields)
+
+
+class CaptureWriter:
+    """Appends records from a bounded queue in batches on a background thread.
+
+    `record()` never blocks or touches the file; when the writer falls behind,
+    records are counted in `dropped` instead.
+    """
+
+    def __init__(self, path: str, max_bytes: int = CAPTURE_MAX_BYTES, backups: int = CAPTURE_BACKUPS,
+                 batch_size: int = CAPTURE_BATCH_SIZE, flush_seconds: float = CAPTURE_FLUSH_SECONDS,
+                 queue_size: int = CAPTURE_QUEUE_SIZE):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.written = 0
+        self.dropped = 0
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name="traffic-capture", daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+        logger.info("Capturing advice traffic", extra={"path": self.path})
+
+    def stop(self):
+        """Write out whatever is queued and stop the writer thread"""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join(timeout=10)
+        self._thread = None
+
+    def record(self, entry: Dict[str, Any]):
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            self.dropped += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "path": self.path,
+            "written": self.written,
+            "queued": self._queue.qsize(),
+            "dropped": self.dropped
+        }
+
+    def _take_batch(self) -> List[Dict[str, Any]]:
+        try:
+            batch = [self._queue.get(timeout=self.flush_seconds)]
+        except queue.Empty:
+            return []
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while not self._stop.is_set() or not self._queue.empty():
+            batch = self._take_batch()
+            if batch:
+                try:
+                    self._write(batch)
+                except OSError:
+                    logger.exception("Traffic capture write failed", extra={"records": len(batch)})
+
+    def _write(self, batch: List[Dict[str, Any]]):
+        data = "".join(json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n"
+                       for entry in batch).encode("utf-8")
+        if self._size() + len(data) > self.max_bytes:
+            self._rotate()
+        with open(self.path, "ab") as f:
+            f.write(data)
+        self.written += len(batch)
+
+    def _size(self) -> int:
+        try:
+            return os.path.getsize(self.path)
+        except OSError:
+            return 0
+
+    def _rotate(self):
+        """requests.jsonl -> .1 -> .2 ...; the oldest backup is dropped"""
+        for n in range(self.backups - 1, 0, -1):
+            source = f"{self.path}.{n}"
+            if os.path.exists(source):
+                os.replace(source, f"{self.path}.{n + 1}")
+        if not os.path.exists(self.path):
+            return
+        if self.backups > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+
+
+writer = CaptureWriter(CAPTURE_PATH)
+
+
+def _finish(record: Dict[str, Any], started: float, status: str):
+    # Only requests that got as far as naming a goal are worth replaying
+    if "goal" in record:
+        record["status"] = int(status)
+        record["latency_ms"] = round((time.monotonic() - started) * 1000, 1)
+        writer.record(record)
+
+
+class WSGICaptureMiddleware:
+    """Records each request to `routes` once its body has been sent; routes add fields with note()"""
+
+    def __init__(self, app, routes: Iterable[str]):
+        self.app = app
+        self.routes = frozenset(routes)
+
+    def __call__(self, environ, start_response):
+        path = environ.get("PATH_INFO", "")
+        if path not in self.routes or environ.get("REQUEST_METHOD") != "POST":
+            return self.app(environ, start_response)
+        started = time.monotonic()
+        record = {
+            "ts": round(time.time(), 3),
+            "route": path,
+            "query": environ.get("QUERY_STRING", ""),
+            "client_id": environ.get("HTTP_X_CLIENT_ID") or environ.get("REMOTE_ADDR") or "anonymous",
+            "request_id": current_request_id(),
+        }
+        _current.set(record)
+        status = ["500"]
+
+        def recording_start_response(status_line, headers, exc_info=None):
+            status[0] = status_line[:3]
+            return start_response(status_line, headers, exc_info)
+
+        body = self.app(environ, recording_start_response)
+        return self._iterate(body, record, started, status)
+
+    def _iterate(self, body, record: Dict[str, Any], started: float, status: List[str]):
+        try:
+            yield from body
+        finally:
+            close = getattr(body, "close", None)
+            if close is not None:
+                close()
+            _finish(record, started, status[0])
+
+
+class ASGICaptureMiddleware:
+    """ASGI flavour of WSGICaptureMiddleware (add with app.add_middleware)"""
+
+    def __init__(self, app, routes: Iterable[str]):
+        self.app = app
+        self.routes = frozenset(routes)
+
+    async def __call__(self, scope, receive, send):
+        path = scope.get("path", "")
+        if scope["type"] != "http" or path not in self.routes or scope.get("method") != "POST":
+            await self.app(scope, receive, send)
+            return
+        started = time.monotonic()
+        client_id = next((value.decode("latin-1") for name, value in scope.get("headers", [])
+                          if name == b"x-client-id"), None)
+        record = {
+            "ts": round(time.time(), 3),
+            "route": path,
+            "query": scope.get("query_string", b"").decode("latin-1"),
+            "client_id": client_id or (scope["client"][0] if scope.get("client") else "anonymous"),
+            "request_id": current_request_id(),
+        }
+        _current.set(record)
+        status = ["500"]
+
+        async def recording_send(message):
+            if message["type"] == "http.response.start":
+                status[0] = str(message["status"])
+            await send(message)
+
+        try:
+            await self.app(scope, receive, recording_send)
+        finally:
+            _finish(record, started, status[0])